@@ -0,0 +1,35 @@
+"""Замер памяти, занимаемой данными чатов в DataManager.
+
+Запуск: python benchmarks/chat_memory.py [количество_чатов]
+"""
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bot import ChatData, DataManager, MAIN_ADMIN_ID  # noqa: E402
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    data_manager = DataManager()
+
+    tracemalloc.start()
+    for i in range(count):
+        chat_id = -1_000_000_000_000 - i
+        chat_data = ChatData(chat_id)
+        if i % 10 == 0:
+            # Каждый десятый чат с дополнительным администратором
+            chat_data.add_admin(MAIN_ADMIN_ID + 1 + i)
+        data_manager.chats[chat_id] = chat_data
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f"Чатов: {count}")
+    print(f"Память: {current / 2 ** 20:.1f} МиБ ({current / count:.0f} байт на чат)")
+    print(f"Пик: {peak / 2 ** 20:.1f} МиБ")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,37 @@
 import asyncio
+import functools
+import hashlib
+import heapq
+import html
+import httpx
 import logging
-from telegram import Bot, Update, InlineKeyboardButton, InlineKeyboardMarkup, ChatPermissions
-from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes, MessageHandler, filters
-from telegram.error import BadRequest, TimedOut
+import multiprocessing
+import queue
+import random
+import signal
+import threading
+from telegram import Bot, Update, InlineKeyboardButton, InlineKeyboardMarkup, ChatMember, ChatPermissions
+from telegram.ext import (
+    Application, BaseHandler, BaseUpdateProcessor, CallbackQueryHandler, ChatMemberHandler, ContextTypes,
+    TypeHandler
+)
+from telegram.error import BadRequest, NetworkError, RetryAfter, TimedOut
+from telegram.request import HTTPXRequest
 import time
 import json
 import os
-from datetime import datetime, timedelta, timezone
+import re
+import sqlite3
+import sys
+import zlib
+from array import array
+from collections import OrderedDict, defaultdict, deque
+from datetime import datetime, timedelta, timezone, time as dt_time
+
+try:
+    import numpy as np
+except ImportError:  # статистика посещаемости считается на чистом Python
+    np = None
 
 # Настройка логирования
 logging.basicConfig(
@@ -16,135 +41,1558 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 BOT_TOKEN = os.environ.get('BOT_TOKEN', '8455558290:AAHDiNfqtG7LMOWor9rHhpwtCVv-JHmt-7c')
+BOT_API_URL = os.environ.get('BOT_API_URL', '')  # Свой сервер Bot API (например, локальный для тестов)
 MAIN_ADMIN_ID = 2073879359  # Главный администратор (нельзя удалить)
+SAVE_INTERVAL = float(os.environ.get('SAVE_INTERVAL', '2'))  # Интервал отложенного сохранения, сек
+STORAGE_MODE = os.environ.get('BOT_STORAGE', 'json')  # json | journal | sqlite
+CHAT_CACHE_SIZE = int(os.environ.get('CHAT_CACHE_SIZE', '10000'))  # Чатов в памяти для sqlite
+USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', '50000'))  # Профилей пользователей в кэше
+USER_CACHE_TTL = float(os.environ.get('USER_CACHE_TTL', '3600'))  # Срок жизни профиля, сек
+USER_CACHE_NEGATIVE_TTL = float(os.environ.get('USER_CACHE_NEGATIVE_TTL', '300'))  # Срок для неудачных запросов, сек
+ADMIN_LOOKUP_CONCURRENCY = int(os.environ.get('ADMIN_LOOKUP_CONCURRENCY', '8'))  # Параллельных запросов имен в /admins
+ADMIN_LOOKUP_TIMEOUT = float(os.environ.get('ADMIN_LOOKUP_TIMEOUT', '2'))  # Таймаут запроса одного имени, сек
+CHAT_ADMINS_CACHE_TTL = float(os.environ.get('CHAT_ADMINS_CACHE_TTL', '600'))  # Срок жизни списка админов Telegram, сек
+
+# Лимиты исходящих сообщений (Telegram: ~1 сообщение/сек в чат, ~30/сек всего)
+SEND_CHAT_RATE = float(os.environ.get('SEND_CHAT_RATE', '1'))
+SEND_CHAT_BURST = float(os.environ.get('SEND_CHAT_BURST', '3'))
+SEND_GLOBAL_RATE = float(os.environ.get('SEND_GLOBAL_RATE', '30'))
+SEND_GLOBAL_BURST = float(os.environ.get('SEND_GLOBAL_BURST', '30'))
+SEND_MAX_RETRIES = int(os.environ.get('SEND_MAX_RETRIES', '3'))  # Повторов при таймауте
+SEND_BACKOFF_BASE = float(os.environ.get('SEND_BACKOFF_BASE', '1'))  # Начальная задержка повтора, сек
+SEND_BACKOFF_MAX = float(os.environ.get('SEND_BACKOFF_MAX', '30'))  # Максимальная задержка повтора, сек
+COALESCE_WINDOW = float(os.environ.get('COALESCE_WINDOW', '0'))  # Окно объединения ответов модерации, сек (0 - выкл.)
+
+# HTTP-клиент Bot API (HTTP/2 требует python-telegram-bot[http2])
+HTTP_POOL_SIZE = int(os.environ.get('HTTP_POOL_SIZE', '256'))  # Соединений для вызовов API
+HTTP_KEEPALIVE = int(os.environ.get('HTTP_KEEPALIVE', '64'))  # Из них держать открытыми между запросами
+HTTP_KEEPALIVE_EXPIRY = float(os.environ.get('HTTP_KEEPALIVE_EXPIRY', '30'))  # Простой до закрытия соединения, сек
+HTTP_VERSION = os.environ.get('HTTP_VERSION', '1.1')  # 1.1 | 2
+HTTP_CONNECT_TIMEOUT = float(os.environ.get('HTTP_CONNECT_TIMEOUT', '5'))
+HTTP_READ_TIMEOUT = float(os.environ.get('HTTP_READ_TIMEOUT', '5'))
+HTTP_WRITE_TIMEOUT = float(os.environ.get('HTTP_WRITE_TIMEOUT', '5'))
+HTTP_POOL_TIMEOUT = float(os.environ.get('HTTP_POOL_TIMEOUT', '5'))  # Ожидание свободного соединения, сек
+GET_UPDATES_POOL_SIZE = int(os.environ.get('GET_UPDATES_POOL_SIZE', '1'))  # Отдельный пул для long polling
+HTTP_STATS_INTERVAL = float(os.environ.get('HTTP_STATS_INTERVAL', '300'))  # Запись загрузки пулов в лог, сек (0 - выкл.)
+
+BULK_MODERATION_CONCURRENCY = int(os.environ.get('BULK_MODERATION_CONCURRENCY', '5'))  # Параллельных действий
+BULK_PROGRESS_INTERVAL = float(os.environ.get('BULK_PROGRESS_INTERVAL', '2'))  # Период обновления прогресса, сек
+REPLY_TRACKER_MESSAGES = int(os.environ.get('REPLY_TRACKER_MESSAGES', '200'))  # Сообщений с ответами на чат
+REPLY_TRACKER_CHATS = int(os.environ.get('REPLY_TRACKER_CHATS', '1000'))  # Чатов с отслеживанием ответов
+PUNISHMENTS_FILE = os.environ.get('PUNISHMENTS_FILE', 'punishments.json')  # Сроки временных мутов и банов
+PUNISHMENT_RETRY_DELAY = float(os.environ.get('PUNISHMENT_RETRY_DELAY', '60'))  # Повтор неудачного снятия, сек
+FLOOD_MAX_MESSAGES = int(os.environ.get('FLOOD_MAX_MESSAGES', '10'))  # Сообщений за окно без мута (0 - выкл.)
+FLOOD_WINDOW = float(os.environ.get('FLOOD_WINDOW', '5'))  # Скользящее окно антифлуда, сек
+FLOOD_MUTE_DURATION = os.environ.get('FLOOD_MUTE_DURATION', '10m')  # Мут за флуд, в формате /mute
+FLOOD_MAX_TRACKED = int(os.environ.get('FLOOD_MAX_TRACKED', '50000'))  # Пар (чат, пользователь) в памяти антифлуда
+ATTENDANCE_FILE = os.environ.get('ATTENDANCE_FILE', 'attendance_data.json')  # Опросы посещаемости
+ATTENDANCE_RENDER_INTERVAL = float(os.environ.get('ATTENDANCE_RENDER_INTERVAL', '3'))  # Не чаще раза за интервал, сек
+ATTENDANCE_ARCHIVE_FILE = os.environ.get('ATTENDANCE_ARCHIVE_FILE', 'attendance_archive.jsonl')  # Закрытые опросы
+ATTENDANCE_POLL_TIME = os.environ.get('ATTENDANCE_POLL_TIME', '')  # Время ежедневного опроса ЧЧ:ММ (пусто - выкл.)
+ATTENDANCE_POLL_DAYS = os.environ.get('ATTENDANCE_POLL_DAYS', '0,1,2,3,4,5,6')  # Дни недели, 0 - воскресенье
+ATTENDANCE_CHATS = os.environ.get('ATTENDANCE_CHATS', '')  # Чаты для опроса через запятую (пусто - все с опросами)
+ATTENDANCE_POST_RATE = float(os.environ.get('ATTENDANCE_POST_RATE', '20'))  # Публикаций опроса в секунду
+ATTENDANCE_HISTORY_DIR = os.environ.get('ATTENDANCE_HISTORY_DIR', 'attendance_history')  # Колонки истории опросов
+
+# Параллельная обработка обновлений (в одном чате - всегда по очереди)
+UPDATE_CONCURRENCY = int(os.environ.get('UPDATE_CONCURRENCY', '32'))  # Одновременно выполняемых обновлений (1 - выкл.)
+UPDATE_MAX_PENDING = int(os.environ.get('UPDATE_MAX_PENDING', '1024'))  # Принятых в работу, включая ждущих свой чат
+
+# Режим получения обновлений: polling | webhook
+BOT_MODE = os.environ.get('BOT_MODE', 'polling')
+BOT_SHARDS = int(os.environ.get('BOT_SHARDS', '1'))  # Процессов-шардов по chat_id (1 - один процесс)
+SHARD_WATCH_INTERVAL = float(os.environ.get('SHARD_WATCH_INTERVAL', '5'))  # Проверка живости шардов, сек
+SHARD_BATCH_SIZE = int(os.environ.get('SHARD_BATCH_SIZE', '100'))  # Обновлений из очереди шарда за раз
+WEBHOOK_LISTEN = os.environ.get('WEBHOOK_LISTEN', '127.0.0.1')  # Адрес локального HTTP-сервера
+WEBHOOK_PORT = int(os.environ.get('WEBHOOK_PORT', '8443'))
+WEBHOOK_PATH = os.environ.get('WEBHOOK_PATH', 'telegram')  # Путь, на который приходят обновления
+WEBHOOK_URL = os.environ.get('WEBHOOK_URL', '')  # Публичный URL для setWebhook (за балансировщиком - его адрес)
+WEBHOOK_SECRET = os.environ.get('WEBHOOK_SECRET', '')  # Проверяется в заголовке X-Telegram-Bot-Api-Secret-Token
+JOURNAL_COMPACT_SIZE = int(os.environ.get('JOURNAL_COMPACT_SIZE', str(1024 * 1024)))  # Порог компактирования, байт
+
+# Резервные копии
+BACKUP_DIR = os.environ.get('BACKUP_DIR', 'backups')
+BACKUP_FILES = os.environ.get('BACKUP_FILES', '')  # Файлы через запятую (пусто - данные бота и опросов)
+BACKUP_INTERVAL = float(os.environ.get('BACKUP_INTERVAL', '3600'))  # Период копирования, сек (0 - выкл.)
+BACKUP_KEEP_HOURLY = int(os.environ.get('BACKUP_KEEP_HOURLY', '24'))
+BACKUP_KEEP_DAILY = int(os.environ.get('BACKUP_KEEP_DAILY', '7'))
+BACKUP_KEEP_WEEKLY = int(os.environ.get('BACKUP_KEEP_WEEKLY', '4'))
 
 
 class ChatData:
-    """Класс для управления данными чата"""
+    """Класс для управления данными чата.
+
+    Админы хранятся в frozenset (проверка за O(1), безопасное чтение из потока
+    сохранения), время изменения - целым числом секунд epoch.
+    """
+
+    __slots__ = ('chat_id', 'admin_users', 'last_updated')
+
+    # Общий для всех чатов набор по умолчанию - не тратит память на каждый чат
+    DEFAULT_ADMINS = frozenset((MAIN_ADMIN_ID,))
 
-    def __init__(self, chat_id):
+    def __init__(self, chat_id, admin_users=DEFAULT_ADMINS, last_updated=None):
         self.chat_id = chat_id
-        self.admin_users = [MAIN_ADMIN_ID]
-        self.last_updated = datetime.now().isoformat()
+        self.admin_users = admin_users
+        self.last_updated = int(time.time()) if last_updated is None else last_updated
+
+    @classmethod
+    def _intern_admins(cls, admin_users):
+        """Гарантирует главного админа и переиспользует общий набор по умолчанию"""
+        admin_users = frozenset(admin_users) | cls.DEFAULT_ADMINS
+        return cls.DEFAULT_ADMINS if admin_users == cls.DEFAULT_ADMINS else admin_users
+
+    def add_admin(self, user_id):
+        self.admin_users = self._intern_admins(self.admin_users | {user_id})
+
+    def remove_admin(self, user_id):
+        self.admin_users = self._intern_admins(self.admin_users - {user_id})
+
+    def sorted_admins(self):
+        """Админы для показа: главный админ первым, остальные по ID"""
+        return sorted(self.admin_users, key=lambda user_id: (user_id != MAIN_ADMIN_ID, user_id))
 
     def to_dict(self):
         return {
-            'admin_users': self.admin_users,
+            'admin_users': sorted(self.admin_users),
             'last_updated': self.last_updated
         }
 
     @classmethod
     def from_dict(cls, chat_id, data):
-        instance = cls(chat_id)
-        instance.admin_users = data.get('admin_users', [MAIN_ADMIN_ID])
-        instance.last_updated = data.get('last_updated', datetime.now().isoformat())
+        return cls(
+            chat_id,
+            cls._intern_admins(data.get('admin_users', ())),
+            TimeManager.to_epoch(data.get('last_updated'))
+        )
+
+
+def atomic_write(filename, write_fn, binary=False):
+    """Атомарно записывает файл: временный файл + fsync + rename"""
+    directory = os.path.dirname(os.path.abspath(filename))
+    tmp_filename = f"{filename}.tmp"
+    with (open(tmp_filename, 'wb') if binary else open(tmp_filename, 'w', encoding='utf-8')) as f:
+        write_fn(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_filename, filename)
+
+    # Фиксируем сам rename в каталоге (только POSIX)
+    if hasattr(os, 'O_DIRECTORY'):
+        dir_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+def append_journal(filename, records):
+    """Дописывает записи в журнал по строке JSON на запись; возвращает размер журнала"""
+    with open(filename, 'a', encoding='utf-8') as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False))
+            f.write('\n')
+        f.flush()
+        os.fsync(f.fileno())
+        return f.tell()
+
+
+def truncate_journal(filename):
+    with open(filename, 'w', encoding='utf-8') as f:
+        os.fsync(f.fileno())
+
+
+def replay_journal(filename, apply_record):
+    """Применяет записи журнала по порядку; возвращает (число записей, размер журнала).
+
+    Чтение останавливается на первой поврежденной строке, а хвост файла
+    отрезается, чтобы новые записи не склеились с оборванной строкой.
+    """
+    if not os.path.exists(filename):
+        return 0, 0
+
+    applied = 0
+    good_size = 0
+    with open(filename, 'rb') as f:
+        for line in f:
+            try:
+                if not line.endswith(b'\n'):
+                    raise ValueError("строка журнала не завершена")
+                apply_record(json.loads(line))
+            except (ValueError, KeyError) as e:
+                # Оборванная последняя строка после сбоя
+                logger.warning(f"Пропущена поврежденная запись журнала {filename}: {e}")
+                break
+            applied += 1
+            good_size += len(line)
+        size = f.seek(0, os.SEEK_END)
+
+    if good_size < size:
+        with open(filename, 'r+b') as f:
+            f.truncate(good_size)
+    return applied, good_size
+
+
+# Версия формата файла данных. Старые файлы без версии (0) хранили чаты
+# под ключом 'chats' либо 'chat_data' - миграции понимают оба варианта.
+SCHEMA_VERSION = 2
+SCHEMA_CHAT_KEYS = ('chats', 'chat_data')
+
+
+def _migrate_chat_v0(record):
+    """v0 -> v1: нормализуем типы, отбрасываем посторонние поля"""
+    migrated = {'admin_users': [int(user_id) for user_id in record.get('admin_users', [])]}
+    if record.get('last_updated'):
+        migrated['last_updated'] = record['last_updated']
+    return migrated
+
+
+def _migrate_chat_v1(record):
+    """v1 -> v2: last_updated из ISO-строки в целые секунды epoch"""
+    migrated = dict(record)
+    if 'last_updated' in migrated:
+        migrated['last_updated'] = TimeManager.to_epoch(migrated['last_updated'])
+    return migrated
+
+
+# Миграции записей чатов: версия -> функция перехода к следующей версии
+SCHEMA_MIGRATIONS = {
+    0: _migrate_chat_v0,
+    1: _migrate_chat_v1,
+}
+
+
+def migrate_chat_record(version, record):
+    """Приводит запись чата из версии version к текущей"""
+    if version > SCHEMA_VERSION:
+        raise ValueError(f"Неподдерживаемая версия схемы: {version}")
+    while version < SCHEMA_VERSION:
+        record = SCHEMA_MIGRATIONS[version](record)
+        version += 1
+    return record
+
+
+class JsonStreamReader:
+    """Инкрементальный разбор JSON: в памяти держится только текущее значение"""
+
+    _WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+    def __init__(self, f, chunk_size=64 * 1024):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self):
+        if self.eof:
+            return False
+        chunk = self.f.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def _peek(self):
+        while True:
+            self.pos = self._WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                raise ValueError("Неожиданный конец JSON")
+
+    def _expect(self, char):
+        if self._peek() != char:
+            raise ValueError(f"Ожидался '{char}' в позиции {self.pos}")
+        self.pos += 1
+
+    def begin_object(self):
+        self._expect('{')
+
+    def next_key(self):
+        """Следующий ключ текущего объекта или None в конце объекта"""
+        char = self._peek()
+        if char == '}':
+            self.pos += 1
+            return None
+        if char == ',':
+            self.pos += 1
+        key = self.read_value()
+        self._expect(':')
+        return key
+
+    def read_value(self):
+        self._peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # Число на границе буфера может быть обрезано - дочитываем
+            if end == len(self.buf) and self._fill():
+                continue
+            self.pos = end
+            return value
+
+
+def iter_snapshot(filename):
+    """Потоково читает файл данных: выдает (chat_id, запись в текущей схеме)"""
+    with open(filename, 'r', encoding='utf-8') as f:
+        reader = JsonStreamReader(f)
+        reader.begin_object()
+        version = 0
+        while (key := reader.next_key()) is not None:
+            if key not in SCHEMA_CHAT_KEYS:
+                value = reader.read_value()
+                if key == 'version':
+                    version = int(value)
+                continue
+
+            reader.begin_object()
+            while (chat_id_str := reader.next_key()) is not None:
+                yield int(chat_id_str), migrate_chat_record(version, reader.read_value())
+
+
+class StorageBackend:
+    """Базовый класс хранилища данных чатов.
+
+    Методы stage/prepare_flush/restore_batch вызываются из потока event loop,
+    write_batch - из рабочего потока.
+    """
+
+    # Ленивые хранилища не загружают все чаты при старте
+    lazy = False
+
+    def load(self, chats, apply_record):
+        """Загружает данные при старте (для неленивых хранилищ)"""
+
+    def load_chat(self, chat_id):
+        """Загружает один чат по требованию; None, если его нет"""
+        return None
+
+    def admin_chats(self, user_id):
+        """Записанные чаты, где пользователь назначен админом (для ленивых хранилищ)"""
+        return set()
+
+    def stage(self, record):
+        """Ставит изменение в очередь на запись"""
+        raise NotImplementedError
+
+    def has_pending(self):
+        raise NotImplementedError
+
+    def prepare_flush(self, chats, compact=False):
+        """Забирает накопленные изменения в пакет для записи"""
+        raise NotImplementedError
+
+    def write_batch(self, batch):
+        raise NotImplementedError
+
+    def restore_batch(self, batch):
+        """Возвращает изменения пакета в очередь после неудачной записи"""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class JsonStorage(StorageBackend):
+    """Хранилище в JSON-файле: полный снимок и необязательный журнал изменений"""
+
+    def __init__(self, filename='bot_data.json', journal=False, compact_size=JOURNAL_COMPACT_SIZE,
+                 import_filename=None, chat_filter=None):
+        self.filename = filename
+        self.journal = journal
+        # Общий файл, из которого шард при первом запуске берет свои чаты
+        self.import_filename = import_filename
+        self.chat_filter = chat_filter
+        self.journal_filename = f"{filename}.journal"
+        self.compact_size = compact_size
+        self._dirty = set()
+        self._journal_buffer = []
+        self._journal_size = 0
+
+    def stage(self, record):
+        if self.journal:
+            self._journal_buffer.append(record)
+        else:
+            self._dirty.add(record['chat'])
+
+    def has_pending(self):
+        return bool(self._dirty or self._journal_buffer)
+
+    def prepare_flush(self, chats, compact=False):
+        records = self._journal_buffer
+        self._journal_buffer = []
+        dirty = self._dirty
+        self._dirty = set()
+
+        snapshot = None
+        if not self.journal or compact or self._journal_size >= self.compact_size:
+            snapshot = dict(chats)
+        return records, dirty, snapshot
+
+    def write_batch(self, batch):
+        records, dirty, snapshot = batch
+        if self.journal:
+            self._journal_size = self._write_journal(records, snapshot)
+        else:
+            self._write_snapshot(snapshot)
+
+    def restore_batch(self, batch):
+        records, dirty, snapshot = batch
+        self._journal_buffer = records + self._journal_buffer
+        self._dirty |= dirty
+
+    def _write_snapshot(self, chats):
+        """Потоковая запись снимка на диск: по строке на чат"""
+        def write(f):
+            header = {'version': SCHEMA_VERSION, 'last_updated': datetime.now().isoformat()}
+            f.write(json.dumps(header, ensure_ascii=False)[:-1])
+            f.write(', "chats": {')
+            separator = '\n'
+            for chat_id, chat_data in chats.items():
+                f.write(separator)
+                f.write(json.dumps(str(chat_id)))
+                f.write(': ')
+                f.write(json.dumps(chat_data.to_dict(), ensure_ascii=False, default=str))
+                separator = ',\n'
+            f.write('\n}}\n')
+
+        atomic_write(self.filename, write)
+
+    def _write_journal(self, records, chats=None):
+        """Дописывает записи в журнал; при переданном снимке - компактирует.
+
+        Возвращает новый размер журнала.
+        """
+        size = append_journal(self.journal_filename, records)
+
+        if chats is not None:
+            # Снимок содержит все записи журнала, поэтому журнал можно обнулить.
+            # Если упадем между этими шагами, повторное применение записей безопасно.
+            self._write_snapshot(chats)
+            truncate_journal(self.journal_filename)
+            size = 0
+
+        return size
+
+    def load(self, chats, apply_record):
+        try:
+            if os.path.exists(self.filename):
+                for chat_id, record in iter_snapshot(self.filename):
+                    chats[chat_id] = ChatData.from_dict(chat_id, record)
+            elif self.import_filename:
+                self._import_shared(chats, apply_record)
+
+        except Exception as e:
+            # Частично прочитанный снимок при следующем сохранении затер бы все
+            # остальные чаты - не запускаемся, пока файл не восстановлен из копии
+            logger.error(f"Ошибка загрузки {self.filename}: {e}")
+            raise ValueError(
+                f"файл данных {self.filename} поврежден, восстановите его из копии: python bot.py restore"
+            ) from e
+
+        if self.journal:
+            self._replay_journal(apply_record)
+
+    def _replay_journal(self, apply_record):
+        """Применяет записи журнала поверх снимка"""
+        applied, self._journal_size = replay_journal(self.journal_filename, apply_record)
+        logger.info(f"Применено записей журнала: {applied}")
+
+    def _import_shared(self, chats, apply_record):
+        """Первый запуск шарда: свои чаты из общего снимка и его журнала"""
+        if os.path.exists(self.import_filename):
+            for chat_id, record in iter_snapshot(self.import_filename):
+                if self.chat_filter(chat_id):
+                    chats[chat_id] = ChatData.from_dict(chat_id, record)
+        replay_journal(
+            f"{self.import_filename}.journal",
+            lambda record: self.chat_filter(record['chat']) and apply_record(record)
+        )
+        logger.info(f"Импортировано чатов шарда из {self.import_filename}: {len(chats)}")
+
+
+class SqliteStorage(StorageBackend):
+    """Хранилище в SQLite: строка на чат и таблица (chat_id, user_id) админов"""
+
+    lazy = True
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS chats ("
+        " chat_id INTEGER PRIMARY KEY,"
+        " last_updated INTEGER)",
+        "CREATE TABLE IF NOT EXISTS chat_admins ("
+        " chat_id INTEGER NOT NULL,"
+        " user_id INTEGER NOT NULL,"
+        " PRIMARY KEY (chat_id, user_id)) WITHOUT ROWID",
+        "CREATE INDEX IF NOT EXISTS idx_chat_admins_user ON chat_admins (user_id, chat_id)",
+    )
+
+    def __init__(self, filename='bot_data.sqlite3', import_filename='bot_data.json',
+                 import_database=None, chat_filter=None):
+        self.filename = filename
+        self.import_filename = import_filename
+        # Общая база, из которой шард при первом запуске берет свои чаты
+        self.import_database = import_database
+        self.chat_filter = chat_filter
+        self._buffer = []
+        self._reader = None
+        self._writer = None
+
+    def _connect(self, check_same_thread=True):
+        conn = sqlite3.connect(self.filename, check_same_thread=check_same_thread)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=FULL")
+        return conn
+
+    def load(self, chats, apply_record):
+        # Пишущее соединение используется только из рабочего потока,
+        # читающее - только из потока event loop (WAL позволяет читать во время записи)
+        self._writer = self._connect(check_same_thread=False)
+        with self._writer:
+            for statement in self.SCHEMA:
+                self._writer.execute(statement)
+        self._reader = self._connect()
+
+        if self._reader.execute("SELECT 1 FROM chats LIMIT 1").fetchone() is None:
+            if self.import_database and os.path.exists(self.import_database):
+                self._import_database()
+            else:
+                self._import_json()
+
+    def _import_database(self):
+        """Первый запуск шарда: переносит свои чаты из общей базы"""
+        source = sqlite3.connect(f"file:{self.import_database}?mode=ro", uri=True)
+        try:
+            admins = defaultdict(list)
+            for chat_id, user_id in source.execute("SELECT chat_id, user_id FROM chat_admins"):
+                if self.chat_filter(chat_id):
+                    admins[chat_id].append(user_id)
+
+            imported = 0
+            with self._writer:
+                for chat_id, last_updated in source.execute("SELECT chat_id, last_updated FROM chats"):
+                    if self.chat_filter(chat_id):
+                        self._write_chat(chat_id, last_updated, admins.get(chat_id, ()))
+                        imported += 1
+        finally:
+            source.close()
+        logger.info(f"Импортировано чатов шарда из {self.import_database}: {imported}")
+
+    def _import_json(self):
+        """Однократный перенос данных из JSON-файла в пустую базу"""
+        if not self.import_filename or not os.path.exists(self.import_filename):
+            return
+
+        imported = 0
+        with self._writer:
+            for chat_id, record in iter_snapshot(self.import_filename):
+                if self.chat_filter is not None and not self.chat_filter(chat_id):
+                    continue
+                chat_data = ChatData.from_dict(chat_id, record)
+                self._write_chat(chat_id, chat_data.last_updated, chat_data.admin_users)
+                imported += 1
+        logger.info(f"Импортировано чатов из {self.import_filename}: {imported}")
+
+    def _write_chat(self, chat_id, last_updated, admin_users):
+        self._writer.execute(
+            "INSERT OR REPLACE INTO chats (chat_id, last_updated) VALUES (?, ?)",
+            (chat_id, last_updated)
+        )
+        self._writer.executemany(
+            "INSERT OR IGNORE INTO chat_admins (chat_id, user_id) VALUES (?, ?)",
+            [(chat_id, user_id) for user_id in admin_users]
+        )
+
+    def load_chat(self, chat_id):
+        row = self._reader.execute(
+            "SELECT last_updated FROM chats WHERE chat_id = ?", (chat_id,)
+        ).fetchone()
+        if row is None:
+            return None
+
+        admin_users = [
+            user_id for (user_id,) in self._reader.execute(
+                "SELECT user_id FROM chat_admins WHERE chat_id = ?", (chat_id,)
+            )
+        ]
+        return ChatData.from_dict(chat_id, {'admin_users': admin_users, 'last_updated': row[0]})
+
+    def admin_chats(self, user_id):
+        # Запрос по индексу idx_chat_admins_user: при старте пары не загружаются
+        return {
+            chat_id for (chat_id,) in self._reader.execute(
+                "SELECT chat_id FROM chat_admins WHERE user_id = ?", (user_id,)
+            )
+        }
+
+    def stage(self, record):
+        self._buffer.append(record)
+
+    def has_pending(self):
+        return bool(self._buffer)
+
+    def prepare_flush(self, chats, compact=False):
+        records = self._buffer
+        self._buffer = []
+        return records
+
+    def write_batch(self, records):
+        with self._writer:
+            for record in records:
+                chat_id = record['chat']
+                self._writer.execute(
+                    "INSERT INTO chats (chat_id, last_updated) VALUES (?, ?) "
+                    "ON CONFLICT (chat_id) DO UPDATE SET last_updated = excluded.last_updated",
+                    (chat_id, record['ts'])
+                )
+                if record['op'] == 'add_admin':
+                    self._writer.execute(
+                        "INSERT OR IGNORE INTO chat_admins (chat_id, user_id) VALUES (?, ?)",
+                        (chat_id, record['user'])
+                    )
+                elif record['op'] == 'remove_admin':
+                    self._writer.execute(
+                        "DELETE FROM chat_admins WHERE chat_id = ? AND user_id = ?",
+                        (chat_id, record['user'])
+                    )
+
+    def restore_batch(self, records):
+        self._buffer = records + self._buffer
+
+    def close(self):
+        for conn in (self._reader, self._writer):
+            if conn is not None:
+                conn.close()
+        self._reader = self._writer = None
 
-        # Гарантируем, что главный админ всегда в списке
-        if MAIN_ADMIN_ID not in instance.admin_users:
-            instance.admin_users.append(MAIN_ADMIN_ID)
 
-        return instance
+def create_storage(mode=STORAGE_MODE, shard=None):
+    """Создает хранилище по имени режима: json | journal | sqlite
+
+    Шард хранит свои чаты в отдельных файлах, а при первом запуске берет их
+    из общих файлов запуска без шардов.
+    """
+    if shard is None or shard.count == 1:
+        if mode == 'sqlite':
+            return SqliteStorage()
+        return JsonStorage(journal=mode == 'journal')
+
+    if mode == 'sqlite':
+        return SqliteStorage(
+            shard.path('bot_data.sqlite3'), import_filename='bot_data.json',
+            import_database='bot_data.sqlite3', chat_filter=shard.owns
+        )
+    return JsonStorage(
+        shard.path('bot_data.json'), journal=mode == 'journal',
+        import_filename='bot_data.json', chat_filter=shard.owns
+    )
 
 
 class DataManager:
     """Класс для управления данными бота"""
 
-    def __init__(self, filename='bot_data.json'):
-        self.filename = filename
-        self.chats = {}
+    def __init__(self, storage=None, flush_interval=SAVE_INTERVAL, cache_size=CHAT_CACHE_SIZE):
+        self.storage = storage if storage is not None else JsonStorage()
+        self.flush_interval = flush_interval
+        self.cache_size = cache_size
+        # Для ленивых хранилищ chats - LRU-кэш горячих чатов, иначе - все чаты
+        self.chats = OrderedDict() if self.storage.lazy else {}
+        # Измененные, но еще не записанные чаты не вытесняются: chat_id -> (номер записи, ChatData)
+        self._pinned = {}
+        self._record_seq = 0
+        # Обратный индекс user_id -> chat_id, где он админ. Главный админ
+        # есть во всех чатах и в индекс не попадает. Ленивое хранилище
+        # индекса в памяти не держит и отвечает запросом к своему индексу.
+        self.admin_index = defaultdict(set)
+        self._flush_task = None
+        self._flush_lock = None
+
+    def _remember(self, chat_data):
+        """Кладет чат в память, вытесняя холодные чаты для ленивых хранилищ"""
+        self.chats[chat_data.chat_id] = chat_data
+        if self.storage.lazy:
+            while len(self.chats) > self.cache_size:
+                self.chats.popitem(last=False)
+
+    def _apply_record(self, record):
+        """Применяет изменение к данным в памяти (идемпотентно)"""
+        chat_id = record['chat']
+        chat_data = self.chats.get(chat_id)
+        if chat_data is None:
+            chat_data = ChatData(chat_id)
+            self._remember(chat_data)
+
+        op = record['op']
+        if op == 'add_admin':
+            chat_data.add_admin(record['user'])
+            self._index_admin(record['user'], chat_id)
+        elif op == 'remove_admin':
+            chat_data.remove_admin(record['user'])
+            self._unindex_admin(record['user'], chat_id)
+        # 'touch' из журналов прежних версий только обновляет время
+
+        # Старые записи журнала хранят время ISO-строкой
+        chat_data.last_updated = TimeManager.to_epoch(record['ts'])
+        return chat_data
+
+    def _index_admin(self, user_id, chat_id):
+        if user_id != MAIN_ADMIN_ID and not self.storage.lazy:
+            self.admin_index[user_id].add(chat_id)
+
+    def _unindex_admin(self, user_id, chat_id):
+        chat_ids = self.admin_index.get(user_id)
+        if chat_ids is not None:
+            chat_ids.discard(chat_id)
+            if not chat_ids:
+                del self.admin_index[user_id]
+
+    def _rebuild_admin_index(self):
+        """Строит обратный индекс заново после загрузки"""
+        self.admin_index.clear()
+        for chat_id, chat_data in self.chats.items():
+            for user_id in chat_data.admin_users:
+                self._index_admin(user_id, chat_id)
+
+    def get_admin_chats(self, user_id):
+        """Чаты, где пользователь назначен админом (без обхода всех чатов)"""
+        if user_id == MAIN_ADMIN_ID:
+            return set()
+        if not self.storage.lazy:
+            return set(self.admin_index.get(user_id, ()))
+
+        # В хранилище еще нет незаписанных изменений: для закрепленных чатов
+        # верны только данные в памяти
+        chat_ids = self.storage.admin_chats(user_id)
+        for chat_id, (_, chat_data) in self._pinned.items():
+            if user_id in chat_data.admin_users:
+                chat_ids.add(chat_id)
+            else:
+                chat_ids.discard(chat_id)
+        return chat_ids
+
+    def remove_admin_everywhere(self, user_id):
+        """Снимает пользователя с админов во всех чатах. Возвращает список чатов"""
+        removed = []
+        for chat_id in sorted(self.get_admin_chats(user_id)):
+            if self.remove_admin(chat_id, user_id):
+                removed.append(chat_id)
+        return removed
+
+    def _mutate(self, op, chat_id, user_id=None):
+        record = {'op': op, 'chat': chat_id, 'ts': int(time.time())}
+        if user_id is not None:
+            record['user'] = user_id
+        chat_data = self._apply_record(record)
+
+        self._record_seq += 1
+        if self.storage.lazy:
+            self._pinned[chat_id] = (self._record_seq, chat_data)
+        self.storage.stage(record)
+        self._schedule_flush()
+        return chat_data
+
+    def add_admin(self, chat_id, user_id):
+        """Добавляет администратора чата. Возвращает False, если он уже есть"""
+        if user_id in self.get_chat_data(chat_id).admin_users:
+            return False
+        self._mutate('add_admin', chat_id, user_id)
+        return True
+
+    def remove_admin(self, chat_id, user_id):
+        """Удаляет администратора чата. Возвращает False, если его нет"""
+        if user_id == MAIN_ADMIN_ID or user_id not in self.get_chat_data(chat_id).admin_users:
+            return False
+        self._mutate('remove_admin', chat_id, user_id)
+        return True
+
+    def _schedule_flush(self):
+        """Объединяет серию изменений в одно сохранение за интервал"""
+        if self._flush_task is not None and not self._flush_task.done():
+            return
+
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Нет event loop (например, при остановке) - пишем сразу
+            self.save_data()
+            return
+
+        self._flush_task = loop.create_task(self._delayed_flush())
+
+    async def _delayed_flush(self):
+        await asyncio.sleep(self.flush_interval)
+        await self.flush()
+
+    def _unpin(self, seq):
+        """Разрешает вытеснение чатов, все изменения которых записаны"""
+        written = [chat_id for chat_id, (pinned_seq, _) in self._pinned.items() if pinned_seq <= seq]
+        for chat_id in written:
+            del self._pinned[chat_id]
+
+    async def flush(self):
+        """Сохраняет накопленные изменения, не блокируя event loop"""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+
+        async with self._flush_lock:
+            if not self.storage.has_pending():
+                return
+
+            seq = self._record_seq
+            batch = self.storage.prepare_flush(self.chats)
+            try:
+                await asyncio.to_thread(self.storage.write_batch, batch)
+            except Exception as e:
+                logger.error(f"Ошибка сохранения: {e}")
+                self.storage.restore_batch(batch)
+                return
+            self._unpin(seq)
 
     def save_data(self):
-        """Сохраняет данные в файл"""
+        """Сохраняет данные немедленно (синхронно)"""
+        seq = self._record_seq
+        batch = self.storage.prepare_flush(self.chats, compact=True)
         try:
-            data = {
-                'chats': {
-                    str(chat_id): chat_data.to_dict()
-                    for chat_id, chat_data in self.chats.items()
-                },
-                'last_updated': datetime.now().isoformat()
-            }
-            with open(self.filename, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, default=str, indent=2)
+            self.storage.write_batch(batch)
         except Exception as e:
             logger.error(f"Ошибка сохранения: {e}")
+            self.storage.restore_batch(batch)
+            return
+        self._unpin(seq)
+
+    def close(self):
+        """Принудительно сохраняет несохраненные изменения и закрывает хранилище"""
+        if self.storage.has_pending():
+            self.save_data()
+        self.storage.close()
 
     def load_data(self):
-        """Загружает данные из файла"""
-        try:
-            if os.path.exists(self.filename):
-                with open(self.filename, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
+        """Загружает данные из хранилища"""
+        self.storage.load(self.chats, self._apply_record)
+        self._rebuild_admin_index()
 
-                    if 'chats' in data:
-                        for chat_id_str, chat_data in data['chats'].items():
-                            chat_id = int(chat_id_str)
-                            self.chats[chat_id] = ChatData.from_dict(chat_id, chat_data)
+    def get_chat_data(self, chat_id):
+        """Получает данные чата; для нового чата - данные по умолчанию без записи"""
+        chat_data = self.chats.get(chat_id)
+        if chat_data is not None:
+            if self.storage.lazy:
+                self.chats.move_to_end(chat_id)
+            return chat_data
+
+        if self.storage.lazy:
+            pinned = self._pinned.get(chat_id)
+            chat_data = pinned[1] if pinned is not None else self.storage.load_chat(chat_id)
+            if chat_data is not None:
+                self._remember(chat_data)
+                return chat_data
+
+        # Чтение (/id, /status) не создает запись: чат сохраняется при первом изменении
+        return ChatData(chat_id)
+
+
+class BackupManager:
+    """Инкрементальные сжатые резервные копии файлов данных.
+
+    Файл режется на куски по границам строк, причем граница зависит от
+    содержимого строки - вставка или правка сдвигает только соседние куски.
+    Куски хранятся сжатыми под своим хэшем и не дублируются, копия - это
+    манифест со списками хэшей. Поэтому каждая копия полная (восстановление
+    не собирает цепочку дельт), а места занимают только изменившиеся куски.
+    Старые копии прореживаются по схеме час/день/неделя, ненужные куски удаляются.
+    """
+
+    CHUNK_MIN = 16 * 1024
+    CHUNK_MAX = 256 * 1024
+    CHUNK_MASK = 0x1f  # граница в среднем через 32 строки после CHUNK_MIN
+
+    def __init__(self, directory=BACKUP_DIR, files=None,
+                 keep_hourly=BACKUP_KEEP_HOURLY, keep_daily=BACKUP_KEEP_DAILY, keep_weekly=BACKUP_KEEP_WEEKLY):
+        self.directory = directory
+        self.files = files if files is not None else self.default_files()
+        self.retention = ((3600, keep_hourly), (86400, keep_daily), (604800, keep_weekly))
+        self.chunks_directory = os.path.join(directory, 'chunks')
 
-        except Exception as e:
-            logger.error(f"Ошибка загрузки: {e}")
-            self.chats = {}
+    @staticmethod
+    def default_files():
+        """Файлы из BACKUP_FILES, а без него - данные бота и опросов"""
+        return [name.strip() for name in BACKUP_FILES.split(',') if name.strip()] or [
+            'bot_data.sqlite3' if STORAGE_MODE == 'sqlite' else 'bot_data.json', ATTENDANCE_FILE
+        ]
 
-    def get_chat_data(self, chat_id):
-        """Получает данные чата, создает если нет"""
-        if chat_id not in self.chats:
-            self.chats[chat_id] = ChatData(chat_id)
-        return self.chats[chat_id]
+    @classmethod
+    def for_shard(cls, shard):
+        """Копии шарда: свой каталог и свои файлы данных"""
+        return cls(shard.path(BACKUP_DIR), [shard.path(name) for name in cls.default_files()])
+
+    @staticmethod
+    def companions(filename):
+        """Файлы, которые дополняют основной файл данных"""
+        if filename.endswith('.sqlite3'):
+            return [f"{filename}-wal", f"{filename}-shm"]
+        return [f"{filename}.journal"]
+
+    def list_backups(self):
+        """Номера (время создания) имеющихся копий по возрастанию"""
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(
+            int(name[:-5]) for name in os.listdir(self.directory)
+            if name.endswith('.json') and name[:-5].isdigit()
+        )
+
+    def load_manifest(self, backup_id):
+        with open(os.path.join(self.directory, f"{backup_id}.json"), 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _chunk_path(self, digest):
+        return os.path.join(self.chunks_directory, digest[:2], digest)
+
+    @staticmethod
+    def _read_file(filename):
+        if filename.endswith('.sqlite3'):
+            # Согласованный образ базы вместе с WAL
+            conn = sqlite3.connect(filename)
+            try:
+                return conn.serialize()
+            finally:
+                conn.close()
+        with open(filename, 'rb') as f:
+            return f.read()
+
+    def _split(self, data):
+        """Куски по границам строк, зависящим от содержимого"""
+        chunk = []
+        size = 0
+        for line in data.splitlines(keepends=True):
+            chunk.append(line)
+            size += len(line)
+            if size >= self.CHUNK_MAX or (size >= self.CHUNK_MIN and zlib.crc32(line) & self.CHUNK_MASK == 0):
+                yield b''.join(chunk)
+                chunk = []
+                size = 0
+        if chunk:
+            yield b''.join(chunk)
+
+    def _load_chunk(self, digest):
+        with open(self._chunk_path(digest), 'rb') as f:
+            return zlib.decompress(f.read())
+
+    def _store_chunk(self, chunk):
+        """Сохраняет кусок, если его еще нет; возвращает (хэш, записано байт)"""
+        digest = hashlib.blake2b(chunk, digest_size=20).hexdigest()
+        path = self._chunk_path(digest)
+        if os.path.exists(path):
+            return digest, 0
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        compressed = zlib.compress(chunk, 6)
+        atomic_write(path, lambda f: f.write(compressed), binary=True)
+        return digest, len(compressed)
+
+    def create_backup(self):
+        """Создает копию (вызывается в рабочем потоке). Возвращает (номер, записано байт)"""
+        os.makedirs(self.chunks_directory, exist_ok=True)
+        backup_ids = self.list_backups()
+        previous = self.load_manifest(backup_ids[-1])['files'] if backup_ids else {}
+        backup_id = max(int(time.time()), backup_ids[-1] + 1 if backup_ids else 0)
+
+        files = {}
+        written = 0
+        for base in self.files:
+            for filename in [base] + self.companions(base):
+                if not os.path.exists(filename) or filename.endswith(('-wal', '-shm')):
+                    continue
+                stat = os.stat(filename)
+                entry = previous.get(filename)
+                if entry is not None and entry['mtime_ns'] == stat.st_mtime_ns and entry['size'] == stat.st_size \
+                        and not filename.endswith('.sqlite3'):
+                    files[filename] = entry  # файл не менялся - те же куски
+                    continue
+
+                data = self._read_file(filename)
+                chunks = []
+                for chunk in self._split(data):
+                    digest, size = self._store_chunk(chunk)
+                    chunks.append(digest)
+                    written += size
+                files[filename] = {'size': len(data), 'mtime_ns': stat.st_mtime_ns, 'chunks': chunks}
+
+        manifest = {'created': backup_id, 'files': files}
+        atomic_write(
+            os.path.join(self.directory, f"{backup_id}.json"),
+            lambda f: json.dump(manifest, f, ensure_ascii=False)
+        )
+        self.apply_retention()
+        return backup_id, written
+
+    def apply_retention(self):
+        """Оставляет последние копии каждого часа, дня и недели; удаляет лишние куски"""
+        backup_ids = self.list_backups()
+        keep = set(backup_ids[-1:])
+        for period, count in self.retention:
+            periods = set()
+            for backup_id in reversed(backup_ids):
+                if len(periods) >= count:
+                    break
+                if backup_id // period not in periods:
+                    periods.add(backup_id // period)
+                    keep.add(backup_id)
+
+        removed = [backup_id for backup_id in backup_ids if backup_id not in keep]
+        if not removed:
+            return
+        for backup_id in removed:
+            os.remove(os.path.join(self.directory, f"{backup_id}.json"))
+
+        referenced = set()
+        for backup_id in keep:
+            for entry in self.load_manifest(backup_id)['files'].values():
+                referenced.update(entry['chunks'])
+        for prefix in os.listdir(self.chunks_directory):
+            prefix_directory = os.path.join(self.chunks_directory, prefix)
+            for digest in os.listdir(prefix_directory):
+                if digest not in referenced:
+                    os.remove(os.path.join(prefix_directory, digest))
+
+    def restore(self, backup_id):
+        """Восстанавливает файлы из копии (бот должен быть остановлен)"""
+        files = self.load_manifest(backup_id)['files']
+        for base in files:
+            for filename in self.companions(base):
+                if filename not in files and os.path.exists(filename):
+                    # Журнал или WAL новее копии применился бы поверх нее
+                    os.remove(filename)
+
+        for filename, entry in files.items():
+            data = b''.join(self._load_chunk(digest) for digest in entry['chunks'])
+            if len(data) != entry['size']:
+                raise ValueError(f"копия {backup_id} повреждена: {filename}")
+            atomic_write(filename, lambda f: f.write(data), binary=True)
+        return sorted(files)
 
 
 class PermissionManager:
     """Класс для управления правами доступа"""
 
-    def __init__(self, data_manager):
+    def __init__(self, data_manager, chat_admins_cache=None):
         self.data_manager = data_manager
+        self.chat_admins_cache = chat_admins_cache
 
     async def is_admin(self, chat_id, user_id):
         """Проверяет, является ли пользователь администратором"""
         chat_data = self.data_manager.get_chat_data(chat_id)
         return user_id in chat_data.admin_users
 
+    async def is_chat_admin(self, bot, chat_id, user_id):
+        """Проверяет, является ли пользователь администратором чата в Telegram"""
+        if self.chat_admins_cache is None:
+            member = await bot.get_chat_member(chat_id, user_id)
+            return member.status in ChatAdministratorsCache.ADMIN_STATUSES
+        return await self.chat_admins_cache.is_admin(bot, chat_id, user_id)
+
     async def check_admin_access(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Проверяет права администратора и отправляет сообщение при отказе"""
         user_id = update.effective_user.id
         chat_id = update.effective_chat.id
 
         if not await self.is_admin(chat_id, user_id):
-            await MessageSender.send_safe_message(
-                context, chat_id,
-                "🚫 У вас нет прав администратора в этом чате!"
-            )
+            await MessageSender.send_safe_message(context, chat_id, Templates.ACCESS_DENIED)
             return False
         return True
 
 
+class PooledRequest(HTTPXRequest):
+    """HTTPXRequest с настройками пула из конфигурации и счетчиками его загрузки.
+
+    Запрос сверх размера пула ждет свободное соединение не дольше pool_timeout,
+    поэтому по числу ждавших и таймаутов пула видно, что пул мал.
+    """
+
+    def __init__(self, name, pool_size=HTTP_POOL_SIZE, keepalive=HTTP_KEEPALIVE,
+                 keepalive_expiry=HTTP_KEEPALIVE_EXPIRY, http_version=HTTP_VERSION,
+                 connect_timeout=HTTP_CONNECT_TIMEOUT, read_timeout=HTTP_READ_TIMEOUT,
+                 write_timeout=HTTP_WRITE_TIMEOUT, pool_timeout=HTTP_POOL_TIMEOUT):
+        super().__init__(
+            connection_pool_size=pool_size,
+            read_timeout=read_timeout,
+            write_timeout=write_timeout,
+            connect_timeout=connect_timeout,
+            pool_timeout=pool_timeout,
+            http_version=http_version,
+            httpx_kwargs={'limits': httpx.Limits(
+                max_connections=pool_size,
+                max_keepalive_connections=min(keepalive, pool_size),
+                keepalive_expiry=keepalive_expiry
+            )}
+        )
+        self.name = name
+        self.pool_size = pool_size
+        self.in_flight = 0      # запросов в работе, включая ждущих соединение
+        self.peak = 0
+        self.requests = 0
+        self.queued = 0         # запросов, которым не хватило свободного соединения
+        self.pool_timeouts = 0
+
+    async def do_request(self, *args, **kwargs):
+        self.requests += 1
+        if self.in_flight >= self.pool_size:
+            self.queued += 1
+        self.in_flight += 1
+        if self.in_flight > self.peak:
+            self.peak = self.in_flight
+        try:
+            return await super().do_request(*args, **kwargs)
+        except TimedOut as e:
+            if isinstance(e.__cause__, httpx.PoolTimeout):
+                self.pool_timeouts += 1
+            raise
+        finally:
+            self.in_flight -= 1
+
+    @property
+    def saturation(self):
+        """Доля занятых соединений пула, 0..1"""
+        return min(self.in_flight, self.pool_size) / self.pool_size
+
+    def format_stats(self):
+        return (
+            f"{self.name}: занято {min(self.in_flight, self.pool_size)}/{self.pool_size} "
+            f"({self.saturation:.0%}), пик {self.peak}, ждали пул {self.queued}, "
+            f"таймаутов пула {self.pool_timeouts}, запросов {self.requests}"
+        )
+
+
+class TokenBucket:
+    """Ведро токенов: rate токенов в секунду, не больше capacity"""
+
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now):
+        """Сколько ждать до появления токена (0 - можно сейчас)"""
+        self._refill(now)
+        return 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def consume(self, now):
+        self._refill(now)
+        self.tokens -= 1
+
+    def is_full(self, now):
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class OutboundJob:
+    """Одна исходящая операция в очереди планировщика"""
+
+    __slots__ = ('priority', 'seq', 'send', 'future', 'attempts')
+
+    def __init__(self, priority, seq, send, future):
+        self.priority = priority
+        self.seq = seq
+        self.send = send
+        self.future = future
+        self.attempts = 0
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class OutboundChat:
+    """Очередь и лимит одного чата"""
+
+    __slots__ = ('jobs', 'bucket', 'blocked_until', 'busy', 'ready_key', 'wake_at')
+
+    def __init__(self, bucket):
+        self.jobs = []
+        self.bucket = bucket
+        self.blocked_until = 0.0
+        self.busy = False
+        # Ключ актуальной записи чата в очереди готовых (None - чата там нет)
+        self.ready_key = None
+        # Время актуальной записи чата в очереди ждущих (None - чата там нет)
+        self.wake_at = None
+
+
+class OutboundScheduler:
+    """Планировщик исходящих запросов с лимитами Telegram.
+
+    У каждого чата своя очередь с приоритетами и ведро токенов, плюс общее
+    ведро на всего бота. В одном чате запросы уходят строго по очереди,
+    разные чаты не ждут друг друга. RetryAfter приостанавливает чат на
+    указанное время, таймауты повторяются с экспоненциальной задержкой;
+    число повторов запроса в обоих случаях ограничено max_retries.
+    """
+
+    def __init__(self, chat_rate=SEND_CHAT_RATE, chat_burst=SEND_CHAT_BURST,
+                 global_rate=SEND_GLOBAL_RATE, global_burst=SEND_GLOBAL_BURST,
+                 max_retries=SEND_MAX_RETRIES, backoff_base=SEND_BACKOFF_BASE, backoff_max=SEND_BACKOFF_MAX):
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.global_bucket = TokenBucket(global_rate, global_burst)
+        self._chats = {}
+        self._ready = []     # (приоритет, номер, chat_id) чатов, готовых к отправке
+        self._sleeping = []  # (время готовности, chat_id) чатов, ждущих лимита
+        self._seq = 0
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._last_sweep = time.monotonic()
+
+    @property
+    def running(self):
+        return self._task is not None and not self._task.done()
+
+    async def start(self):
+        if not self.running:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Останавливает планировщик; неотправленные запросы завершаются ошибкой"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+        self._ready.clear()
+        self._sleeping.clear()
+        for chat in self._chats.values():
+            for job in chat.jobs:
+                if not job.future.done():
+                    job.future.set_exception(RuntimeError("Планировщик отправки остановлен"))
+        self._chats.clear()
+
+    def submit(self, chat_id, send, priority):
+        """Ставит в очередь корутину-фабрику send; возвращает future с результатом"""
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            chat = self._chats[chat_id] = OutboundChat(TokenBucket(self.chat_rate, self.chat_burst))
+
+        self._seq += 1
+        job = OutboundJob(priority, self._seq, send, asyncio.get_running_loop().create_future())
+        heapq.heappush(chat.jobs, job)
+        self._activate(chat_id, chat)
+        return job.future
+
+    def _activate(self, chat_id, chat):
+        """Помещает чат в очередь готовых, если у него есть что отправлять"""
+        if chat.busy or not chat.jobs:
+            return
+        head = chat.jobs[0]
+        key = (head.priority, head.seq, chat_id)
+        # Более приоритетная задача обгоняет прежнюю запись чата
+        if chat.ready_key is None or key < chat.ready_key:
+            chat.ready_key = key
+            heapq.heappush(self._ready, key)
+            self._wakeup.set()
+
+    def _sleep_chat(self, chat_id, chat, until):
+        chat.ready_key = None
+        # Чат уже ждет и проснется не позже - вторая запись не нужна
+        if chat.wake_at is not None and chat.wake_at <= until:
+            return
+        chat.wake_at = until
+        heapq.heappush(self._sleeping, (until, chat_id))
+
+    async def _run(self):
+        while True:
+            now = time.monotonic()
+            while self._sleeping and self._sleeping[0][0] <= now:
+                until, chat_id = heapq.heappop(self._sleeping)
+                chat = self._chats.get(chat_id)
+                if chat is not None and chat.wake_at == until:
+                    chat.wake_at = None
+                    self._activate(chat_id, chat)
+
+            if not self._ready:
+                self._sweep(now)
+                timeout = self._sleeping[0][0] - now if self._sleeping else None
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            global_delay = self.global_bucket.delay(now)
+            if global_delay > 0:
+                await asyncio.sleep(global_delay)
+                continue
+
+            key = heapq.heappop(self._ready)
+            chat_id = key[2]
+            chat = self._chats.get(chat_id)
+            if chat is None or chat.ready_key != key:
+                continue  # устаревшая запись
+
+            wait = max(chat.bucket.delay(now), chat.blocked_until - now)
+            if wait > 0:
+                self._sleep_chat(chat_id, chat, now + wait)
+                continue
+
+            job = heapq.heappop(chat.jobs)
+            chat.ready_key = None
+            chat.busy = True
+            chat.bucket.consume(now)
+            self.global_bucket.consume(now)
+            asyncio.create_task(self._execute(chat_id, chat, job))
+
+    async def _execute(self, chat_id, chat, job):
+        try:
+            result = await job.send()
+        except RetryAfter as e:
+            retry_after = e.retry_after
+            if isinstance(retry_after, timedelta):
+                retry_after = retry_after.total_seconds()
+            job.attempts += 1
+            if job.attempts > self.max_retries:
+                job.future.set_exception(e)
+            else:
+                logger.warning(f"Флуд-контроль в чате {chat_id}: пауза {retry_after} сек")
+                heapq.heappush(chat.jobs, job)
+            # Пауза касается всего чата, а не только этого запроса
+            chat.blocked_until = time.monotonic() + retry_after
+        except BadRequest as e:
+            job.future.set_exception(e)
+        except (TimedOut, NetworkError) as e:
+            job.attempts += 1
+            if job.attempts > self.max_retries:
+                job.future.set_exception(e)
+            else:
+                # Экспоненциальная задержка со случайным разбросом
+                backoff = min(self.backoff_max, self.backoff_base * 2 ** (job.attempts - 1))
+                backoff *= random.uniform(0.5, 1.5)
+                logger.warning(f"Сетевая ошибка в чате {chat_id}, повтор через {backoff:.1f} сек: {e}")
+                chat.blocked_until = time.monotonic() + backoff
+                heapq.heappush(chat.jobs, job)
+        except Exception as e:
+            job.future.set_exception(e)
+        else:
+            job.future.set_result(result)
+        finally:
+            chat.busy = False
+            now = time.monotonic()
+            if chat.jobs and chat.blocked_until > now:
+                self._sleep_chat(chat_id, chat, chat.blocked_until)
+                self._wakeup.set()
+            else:
+                self._activate(chat_id, chat)
+
+    def _sweep(self, now):
+        """Удаляет состояние простаивающих чатов с полным ведром"""
+        if now - self._last_sweep < 60:
+            return
+        self._last_sweep = now
+        idle = [
+            chat_id for chat_id, chat in self._chats.items()
+            if not chat.jobs and not chat.busy and chat.blocked_until <= now and chat.bucket.is_full(now)
+        ]
+        for chat_id in idle:
+            del self._chats[chat_id]
+
+
+class CoalescedBatch:
+    """Накопленные за окно сообщения одного чата"""
+
+    __slots__ = ('texts', 'priority', 'context', 'timer')
+
+    def __init__(self, priority, context):
+        self.texts = []
+        self.priority = priority
+        self.context = context
+        self.timer = None
+
+
+class MessageCoalescer:
+    """Объединяет подтверждения и ошибки одного чата за короткое окно.
+
+    Первое сообщение открывает окно, все пришедшие за него уходят одним
+    сообщением (или несколькими, если не влезают в лимит Telegram).
+    Обработчик не ждет конца окна: иначе следующая команда чата, которая
+    выполняется только после текущей, никогда не попала бы в то же окно.
+    """
+
+    MAX_LENGTH = 4096
+    SEPARATOR = "\n\n"
+
+    def __init__(self, window=COALESCE_WINDOW):
+        self.window = window
+        self._pending = {}
+        # Идущие отправки: ссылка не дает сборщику мусора забрать задачу
+        self._deliveries = set()
+
+    def send(self, context, chat_id, text, priority):
+        """Добавляет текст в окно чата, не дожидаясь отправки"""
+        batch = self._pending.get(chat_id)
+        if batch is None:
+            batch = self._pending[chat_id] = CoalescedBatch(priority, context)
+            batch.timer = asyncio.get_running_loop().call_later(self.window, self._flush, chat_id)
+
+        batch.texts.append(text)
+        batch.priority = min(batch.priority, priority)
+
+    def _flush(self, chat_id):
+        batch = self._pending.pop(chat_id)
+        task = asyncio.ensure_future(self._deliver(chat_id, batch))
+        self._deliveries.add(task)
+        task.add_done_callback(self._delivered)
+
+    def _delivered(self, task):
+        self._deliveries.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Ошибка отправки объединенного сообщения: {task.exception()}")
+
+    async def _deliver(self, chat_id, batch):
+        for text in self._pack(batch.texts):
+            await MessageSender.send_safe_message(batch.context, chat_id, text, priority=batch.priority)
+
+    async def close(self):
+        """Отправляет открытые окна, не дожидаясь их конца, и ждет всех отправок"""
+        for chat_id in list(self._pending):
+            self._pending[chat_id].timer.cancel()
+            self._flush(chat_id)
+        if self._deliveries:
+            await asyncio.gather(*self._deliveries, return_exceptions=True)
+
+    def _pack(self, texts):
+        """Склеивает тексты в сообщения не длиннее MAX_LENGTH"""
+        current = ""
+        for text in texts:
+            candidate = f"{current}{self.SEPARATOR}{text}" if current else text
+            if len(candidate) <= self.MAX_LENGTH or not current:
+                current = candidate
+            else:
+                yield current
+                current = text
+        if current:
+            yield current
+
+
 class MessageSender:
     """Класс для безопасной отправки сообщений"""
 
+    # Подтверждения модерации уходят раньше информационных ответов
+    PRIORITY_HIGH = 0
+    PRIORITY_NORMAL = 1
+
+    # Планировщик исходящих сообщений; без него отправка идет напрямую
+    scheduler = None
+    # Объединение сообщений (coalesce=True); без него каждое уходит отдельно
+    coalescer = None
+
+    @classmethod
+    async def submit(cls, chat_id, send, priority=PRIORITY_NORMAL):
+        """Выполняет запрос к чату через планировщик (с учетом лимитов)"""
+        if cls.scheduler is None or not cls.scheduler.running:
+            return await send()
+        return await cls.scheduler.submit(chat_id, send, priority)
+
     @staticmethod
-    async def send_safe_message(context, chat_id, text, parse_mode='HTML', reply_to_message_id=None, reply_markup=None):
-        """Безопасная отправка сообщения с обработкой ошибок"""
-        try:
-            await context.bot.send_message(
-                chat_id=chat_id,
-                text=text,
-                parse_mode=parse_mode,
-                reply_to_message_id=reply_to_message_id,
-                reply_markup=reply_markup
-            )
-            return True
-        except BadRequest as e:
-            if "Message to be replied not found" in str(e):
-                await context.bot.send_message(
+    def _log_failure(future):
+        if not future.cancelled() and future.exception() is not None:
+            logger.error(f"Ошибка отправки сообщения: {future.exception()}")
+
+    @classmethod
+    async def send_safe_message(cls, context, chat_id, text, parse_mode='HTML', reply_to_message_id=None,
+                                reply_markup=None, priority=PRIORITY_NORMAL, coalesce=False):
+        """Безопасная отправка сообщения с обработкой ошибок.
+
+        С планировщиком сообщение только ставится в очередь чата, и обработчик
+        не ждет доставки: пауза RetryAfter в одном чате не задерживает его.
+        Поэтому результата нет, ошибки доставки пишутся в лог. Кому нужно
+        само сообщение или исход отправки, используют send_tracked_message.
+
+        coalesce=True разрешает объединить сообщение с соседними в этом чате
+        (только простой HTML-текст без клавиатуры и ответа).
+        """
+        if coalesce and cls.coalescer is not None and parse_mode == 'HTML' \
+                and reply_to_message_id is None and reply_markup is None:
+            cls.coalescer.send(context, chat_id, text, priority)
+            return
+
+        async def send():
+            try:
+                return await context.bot.send_message(
                     chat_id=chat_id,
                     text=text,
                     parse_mode=parse_mode,
+                    reply_to_message_id=reply_to_message_id,
                     reply_markup=reply_markup
                 )
-                return True
-            else:
-                logger.error(f"Ошибка отправки сообщения: {e}")
-                return False
+            except BadRequest as e:
+                if "Message to be replied not found" in str(e):
+                    return await context.bot.send_message(
+                        chat_id=chat_id,
+                        text=text,
+                        parse_mode=parse_mode,
+                        reply_markup=reply_markup
+                    )
+                raise
+
+        if cls.scheduler is not None and cls.scheduler.running:
+            cls.scheduler.submit(chat_id, send, priority).add_done_callback(cls._log_failure)
+            return
+
+        try:
+            await send()
+        except Exception as e:
+            logger.error(f"Ошибка отправки сообщения: {e}")
+
+    @classmethod
+    async def send_tracked_message(cls, context, chat_id, text, priority=PRIORITY_NORMAL, reply_markup=None):
+        """Отправляет сообщение и возвращает его (None при ошибке) для последующих правок"""
+        try:
+            return await cls.submit(
+                chat_id,
+                lambda: context.bot.send_message(
+                    chat_id=chat_id, text=text, parse_mode='HTML', reply_markup=reply_markup
+                ),
+                priority
+            )
         except Exception as e:
             logger.error(f"Ошибка отправки сообщения: {e}")
+            return None
+
+    @classmethod
+    async def edit_safe_message(cls, context, chat_id, message_id, text, priority=PRIORITY_NORMAL, reply_markup=None):
+        """Безопасное редактирование сообщения через планировщик"""
+        async def edit():
+            try:
+                return await context.bot.edit_message_text(
+                    text, chat_id=chat_id, message_id=message_id, parse_mode='HTML', reply_markup=reply_markup
+                )
+            except BadRequest as e:
+                if "message is not modified" in str(e).lower():
+                    return None
+                raise
+
+        try:
+            await cls.submit(chat_id, edit, priority)
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка редактирования сообщения: {e}")
             return False
 
 
@@ -170,6 +1618,22 @@ class TimeManager:
         except:
             return None
 
+    @staticmethod
+    def to_epoch(value):
+        """Приводит время (epoch, строка с epoch или ISO-строка) к целым секундам"""
+        if value is None:
+            return int(time.time())
+        if isinstance(value, str):
+            if value.isdigit():
+                return int(value)
+            return int(datetime.fromisoformat(value).timestamp())
+        return int(value)
+
+    @staticmethod
+    def format_timestamp(epoch):
+        """Форматирует время epoch для показа пользователю"""
+        return datetime.fromtimestamp(epoch).strftime('%d.%m.%Y %H:%M:%S')
+
     @staticmethod
     def format_duration(seconds):
         """Форматирует секунды в читаемый вид"""
@@ -193,12 +1657,599 @@ class TimeManager:
                 return f"{days} дн"
 
 
+class UserProfile:
+    """Имя и username пользователя для показа в сообщениях"""
+
+    __slots__ = ('user_id', 'full_name', 'username')
+
+    def __init__(self, user_id, full_name, username=None):
+        self.user_id = user_id
+        self.full_name = full_name
+        self.username = username
+
+
+class UserProfileCache:
+    """Кэш профилей пользователей перед context.bot.get_chat (TTL + LRU).
+
+    Неудачные запросы тоже кэшируются (на меньший срок), а профили
+    пополняются пассивно из входящих обновлений.
+    """
+
+    def __init__(self, max_size=USER_CACHE_SIZE, ttl=USER_CACHE_TTL, negative_ttl=USER_CACHE_NEGATIVE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        # user_id -> (истекает, UserProfile или None для неудачного запроса)
+        self._entries = OrderedDict()
+        # Одновременные запросы одного пользователя объединяются в один
+        self._inflight = {}
+
+    def _store(self, user_id, profile, ttl):
+        self._entries[user_id] = (time.monotonic() + ttl, profile)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def remember(self, user):
+        """Запоминает профиль из объекта User/Chat Telegram"""
+        if user is None:
+            return
+        self._store(user.id, UserProfile(user.id, user.full_name, user.username), self.ttl)
+
+    async def observe_update(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Пассивно пополняет кэш из каждого обновления"""
+        self.remember(update.effective_user)
+        message = update.effective_message
+        if message is not None and message.reply_to_message is not None:
+            self.remember(message.reply_to_message.from_user)
+
+    def get_cached(self, user_id):
+        """Возвращает (найден_в_кэше, профиль или None)"""
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return False, None
+        expires_at, profile = entry
+        if expires_at < time.monotonic():
+            del self._entries[user_id]
+            return False, None
+        self._entries.move_to_end(user_id)
+        return True, profile
+
+    async def get(self, bot, user_id):
+        """Профиль пользователя или None, если Telegram его не вернул"""
+        found, profile = self.get_cached(user_id)
+        if found:
+            return profile
+
+        task = self._inflight.get(user_id)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch(bot, user_id))
+            self._inflight[user_id] = task
+            task.add_done_callback(lambda _: self._inflight.pop(user_id, None))
+        return await asyncio.shield(task)
+
+    async def _fetch(self, bot, user_id):
+        try:
+            chat = await bot.get_chat(user_id)
+        except Exception as e:
+            logger.debug(f"Не удалось получить профиль {user_id}: {e}")
+            self._store(user_id, None, self.negative_ttl)
+            return None
+        profile = UserProfile(user_id, chat.full_name, chat.username)
+        self._store(user_id, profile, self.ttl)
+        return profile
+
+    async def get_name(self, bot, user_id):
+        """Имя пользователя для показа; запасной вариант - ID"""
+        profile = await self.get(bot, user_id)
+        if profile is None or not profile.full_name:
+            return f"Пользователь ({user_id})"
+        return profile.full_name
+
+
+class ChatAdministratorsCache:
+    """Кэш списков администраторов Telegram по чатам.
+
+    Обновляется по событиям chat_member (повышение/понижение), TTL - страховка
+    на случай пропущенных событий.
+    """
+
+    ADMIN_STATUSES = (ChatMember.ADMINISTRATOR, ChatMember.OWNER)
+
+    def __init__(self, ttl=CHAT_ADMINS_CACHE_TTL):
+        self.ttl = ttl
+        # chat_id -> (истекает, {user_id: ChatMember})
+        self._entries = {}
+        self._inflight = {}
+
+    async def get(self, bot, chat_id):
+        """Список администраторов чата (ChatMember), из кэша если возможно"""
+        entry = self._entries.get(chat_id)
+        if entry is not None:
+            if entry[0] >= time.monotonic():
+                return list(entry[1].values())
+            self.invalidate(chat_id)
+
+        task = self._inflight.get(chat_id)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch(bot, chat_id))
+            self._inflight[chat_id] = task
+            task.add_done_callback(lambda _: self._inflight.pop(chat_id, None))
+        return list((await asyncio.shield(task)).values())
+
+    async def _fetch(self, bot, chat_id):
+        admins = await bot.get_chat_administrators(chat_id)
+        members = {admin.user.id: admin for admin in admins}
+        self._entries[chat_id] = (time.monotonic() + self.ttl, members)
+        return members
+
+    async def is_admin(self, bot, chat_id, user_id):
+        return any(admin.user.id == user_id for admin in await self.get(bot, chat_id))
+
+    def invalidate(self, chat_id):
+        self._entries.pop(chat_id, None)
+
+    async def handle_chat_member(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Точечно обновляет кэш при изменении прав участника"""
+        member_update = update.chat_member or update.my_chat_member
+        entry = self._entries.get(member_update.chat.id)
+        if entry is None:
+            return
+        if entry[0] < time.monotonic():
+            # Устаревший список не исправляем, а забываем - следующий запрос загрузит свежий
+            self.invalidate(member_update.chat.id)
+            return
+
+        new_member = member_update.new_chat_member
+        members = entry[1]
+        if new_member.status in self.ADMIN_STATUSES:
+            members[new_member.user.id] = new_member
+        else:
+            members.pop(new_member.user.id, None)
+
+
+class Templates:
+    """Тексты и клавиатуры бота, собранные один раз при запуске.
+
+    Статические части готовы заранее, в шаблонах с {полями} подставляются
+    только данные конкретного запроса (имя, ID, счетчики).
+    """
+
+    ADMIN_PANEL_KEYBOARD = InlineKeyboardMarkup([
+        [InlineKeyboardButton("👥 Управление админами", callback_data="admin_manage")],
+        [InlineKeyboardButton("🔇 Мут пользователя", callback_data="admin_mute")],
+        [InlineKeyboardButton("🚫 Бан пользователя", callback_data="admin_ban")],
+        [InlineKeyboardButton("👢 Кик пользователя", callback_data="admin_kick")],
+        [InlineKeyboardButton("📊 Статус бота", callback_data="admin_status")],
+        [InlineKeyboardButton("🆔 Получить ID", callback_data="admin_get_id")]
+    ])
+
+    ADMIN_MANAGEMENT_KEYBOARD = InlineKeyboardMarkup([
+        [InlineKeyboardButton("📋 Список админов", callback_data="admin_list")],
+        [InlineKeyboardButton("➕ Добавить админа", callback_data="admin_add")],
+        [InlineKeyboardButton("➖ Удалить админа", callback_data="admin_remove")],
+        [InlineKeyboardButton("🔙 Назад", callback_data="admin_back")]
+    ])
+
+    BACK_KEYBOARD = InlineKeyboardMarkup([[InlineKeyboardButton("🔙 Назад", callback_data="admin_back")]])
+
+    ADMIN_PANEL = (
+        "👑 <b>Панель администратора</b>\n\n"
+        "👤 <b>Пользователь:</b> {full_name}\n"
+        "🆔 <b>Ваш ID:</b> <code>{user_id}</code>\n"
+        "💬 <b>Чат ID:</b> <code>{chat_id}</code>\n\n"
+        "⚡ <b>Выберите действие:</b>"
+    )
+
+    ADMIN_MANAGEMENT = (
+        "👑 <b>Управление администраторами</b>\n\n"
+        "📊 <b>Всего админов:</b> {admin_count}\n\n"
+        "⚡ <b>Выберите действие:</b>"
+    )
+
+    MUTE_HELP = (
+        "🔇 <b>Мут пользователя</b>\n\n"
+        "📝 <b>Использование:</b>\n"
+        "<code>/mute ID</code> - мут на 10 мин\n"
+        "<code>/mute ID 1h</code> - мут на 1 час\n"
+        "<code>/mute ID 2d</code> - мут на 2 дня\n\n"
+        "💡 <b>Примеры времени:</b>\n"
+        "• 30m - 30 минут\n"
+        "• 2h - 2 часа\n"
+        "• 1d - 1 день\n"
+        "• 1w - 1 неделя\n\n"
+        "🔄 <b>Или ответьте на сообщение:</b>\n"
+        "<code>/mute 1h</code>"
+    )
+
+    BAN_HELP = (
+        "🚫 <b>Бан пользователя</b>\n\n"
+        "📝 <b>Использование:</b>\n"
+        "<code>/ban ID</code> - бан навсегда\n"
+        "<code>/ban ID 1h</code> - бан на 1 час\n"
+        "<code>/ban ID 2d</code> - бан на 2 дня\n\n"
+        "💡 <b>Примеры времени:</b>\n"
+        "• 30m - 30 минут\n"
+        "• 2h - 2 часа\n"
+        "• 1d - 1 день\n"
+        "• 1w - 1 неделя\n\n"
+        "🔄 <b>Или ответьте на сообщение:</b>\n"
+        "<code>/ban 1h</code>"
+    )
+
+    KICK_HELP = (
+        "👢 <b>Кик пользователя</b>\n\n"
+        "📝 <b>Использование:</b>\n"
+        "<code>/kick ID</code> - кикнуть пользователя\n\n"
+        "🔄 <b>Или ответьте на сообщение:</b>\n"
+        "<code>/kick</code>\n\n"
+        "💡 <i>Пользователь сможет вернуться по приглашению</i>"
+    )
+
+    PANEL_STATUS = (
+        "🤖 <b>Статус бота</b>\n\n"
+        "✅ <b>Бот активен</b>\n"
+        "👑 <b>Администраторов:</b> {admin_count}\n"
+        "💬 <b>ID чата:</b> <code>{chat_id}</code>\n"
+        "🕒 <b>Последнее обновление:</b> {last_updated}\n"
+        "🌐 <b>Пулы Bot API:</b>\n{http_pools}\n\n"
+        "💡 <i>Бот работает стабильно</i> 🚀"
+    )
+
+    GET_ID_HELP = (
+        "🆔 <b>Получение ID</b>\n\n"
+        "📝 <b>Команды:</b>\n"
+        "<code>/id</code> - ваш ID\n"
+        "<code>/get_id</code> - в ответ на сообщение\n"
+        "<code>/all_ids</code> - ID всех админов чата\n"
+        "<code>/chat_info</code> - информация о чате\n\n"
+        "💡 <i>Используйте ID для команд управления</i>"
+    )
+
+    _HELP_USER = (
+        "🤖 <b>Помощь по командам бота</b>\n\n"
+        "🆔 <b>Получение ID:</b>\n"
+        "<code>/id</code> - ваш ID\n"
+        "<code>/get_id</code> - ID пользователя\n"
+        "<code>/all_ids</code> - ID всех администраторов\n"
+        "<code>/chat_info</code> - информация о чате\n"
+        "<code>/status</code> - статус бота\n\n"
+    )
+
+    _DURATION_HINT = "💡 <i>Время указывайте с единицей: 30m, 1h, 1d, 1w - число без единицы считается ID</i>"
+
+    _HELP_ADMIN = (
+        "👑 <b>Администраторские команды:</b>\n"
+        "<code>/admin</code> - панель администратора\n"
+        "<code>/admins</code> - список администраторов\n"
+        "<code>/add_admin ID</code> - добавить администратора\n"
+        "<code>/remove_admin ID</code> - удалить администратора\n"
+        "<code>/revoke_admin ID</code> - снять админа во всех чатах (главный админ)\n"
+        "<code>/admin_chats</code> - чаты, где вы администратор\n\n"
+        "🔇 <b>Мут:</b>\n"
+        "<code>/mute ID [время]</code> - мут пользователя\n"
+        "<code>/mute ID1 ID2 ... [время]</code> - мут нескольких\n"
+        "<code>/unmute ID</code> - размутить\n"
+        "🛡 <i>За флуд в группе бот мутит сам</i>\n\n"
+        "🚫 <b>Бан:</b>\n"
+        "<code>/ban ID [время]</code> - бан пользователя\n"
+        "<code>/ban ID1 ID2 ... [время]</code> - бан нескольких\n"
+        "<code>/ban_repliers [время]</code> - бан всех ответивших (ответом)\n"
+        "<code>/unban ID</code> - разбанить\n\n"
+        "⏳ <b>Сроки наказаний:</b>\n"
+        "<code>/punishments</code> - активные муты и баны\n"
+        "<code>/extend ID время</code> - продлить мут или бан\n\n"
+        "📋 <b>Посещаемость:</b>\n"
+        "<code>/poll</code> - открыть новый опрос в чате\n"
+        "<code>/attendance_stats [4w]</code> - статистика посещаемости\n\n"
+        "💾 <b>Резервные копии (главный админ):</b>\n"
+        "<code>/backup</code> - сделать копию сейчас\n"
+        "<code>/backups</code> - список копий\n\n"
+        "👢 <b>Кик:</b>\n"
+        "<code>/kick ID</code> - кикнуть пользователя\n"
+        "<code>/kick ID1 ID2 ...</code> - кикнуть нескольких\n"
+    ) + _DURATION_HINT + "\n"
+
+    _HELP_TIPS = (
+        "\n💡 <b>Советы:</b>\n"
+        "• Используйте ID вместо username\n"
+        "• Для команд можно отвечать на сообщения\n"
+        "• Каждый чат имеет отдельный список администраторов"
+    )
+
+    HELP = _HELP_USER + _HELP_TIPS
+    HELP_ADMIN = _HELP_USER + _HELP_ADMIN + _HELP_TIPS
+
+    START = (
+        "✅ <b>Продвинутый бот-администратор активирован!</b>\n\n"
+        "⚡ <b>Основные возможности:</b>\n"
+        "• Управление администраторами\n"
+        "• Мут, бан и кик пользователей\n"
+        "• Получение ID пользователей\n\n"
+        "💡 <i>Используйте /help для полного списка команд</i>"
+    )
+
+    # Варианты ответа опроса посещаемости: (код в данных, подпись)
+    ATTENDANCE_OPTIONS = (
+        ('1', "✅ Буду"),
+        ('2', "❌ Не буду"),
+        ('3', "🤔 Под вопросом"),
+    )
+
+    ATTENDANCE_HEADER = "📋 <b>Опрос посещаемости</b>\n🗓 {date}\n"
+    ATTENDANCE_OPTION = "\n{label}: <b>{count}</b>\n"
+    ATTENDANCE_TOTAL = "\n👥 <b>Всего голосов:</b> {total}"
+
+    STATUS = (
+        "🤖 <b>Статус бота:</b>\n\n"
+        "✅ <b>Бот активен</b>\n"
+        "👑 <b>Администраторов:</b> {admin_count}\n"
+        "💬 <b>ID чата:</b> <code>{chat_id}</code>\n"
+        "🎯 <b>Ваш статус:</b> {admin_status}\n\n"
+        "💡 <i>Бот работает стабильно</i> 🚀"
+    )
+
+    STATUS_ADMIN = "👑 Администратор"
+    STATUS_USER = "👤 Пользователь"
+
+    ACCESS_DENIED = "🚫 У вас нет прав администратора в этом чате!"
+    NO_ADMIN_RIGHTS = "🚫 У вас нет прав администратора!"
+    CHAT_ADMIN_PROTECTED = "❌ Нельзя наказать администратора чата!"
+    INVALID_ID = "❌ Неверный формат ID. Используйте числовой ID."
+    ERROR = "❌ Ошибка: {error}"
+
+    ADMINS_EMPTY = "📝 <b>Список администраторов пуст</b>"
+    ADMINS_ITEM_ID = "{index}. 🆔 <code>{user_id}</code>"
+    ADMINS_ITEM = "{index}. 👤 {full_name}{username} | 🆔 <code>{user_id}</code>{mark}"
+    ADMINS = (
+        "👑 <b>Администраторы чата:</b>\n\n{admin_list}\n\n"
+        "📊 <b>Всего:</b> {admin_count} администраторов"
+    )
+
+    ADD_ADMIN_USAGE = (
+        "❌ <b>Использование:</b>\n"
+        "<code>/add_admin 123456789</code> - добавить по ID\n\n"
+        "💡 <i>Или ответьте на сообщение пользователя с командой /add_admin</i>"
+    )
+    ADMIN_ALREADY = "ℹ️ <b>Пользователь уже является администратором</b>\n\n👤 {user_name}\n🆔 <code>{user_id}</code>"
+    ADMIN_ADDED = "✅ <b>Новый администратор добавлен</b>\n\n👤 {user_name}\n🆔 <code>{user_id}</code>"
+    ADD_ADMIN_ERROR = "❌ Ошибка добавления: {error}"
+
+    REMOVE_ADMIN_USAGE = (
+        "❌ <b>Использование:</b>\n"
+        "<code>/remove_admin 123456789</code> - удалить по ID\n\n"
+        "💡 <i>Или ответьте на сообщение пользователя с командой /remove_admin</i>"
+    )
+    MAIN_ADMIN_PROTECTED = "❌ Нельзя удалить главного администратора!"
+    NOT_ADMIN = "❌ Пользователь не является администратором"
+    ADMIN_REMOVED = "✅ <b>Администратор удален</b>\n\n👤 {user_name}\n🆔 <code>{user_id}</code>"
+    REMOVE_ADMIN_ERROR = "❌ Ошибка удаления: {error}"
+
+    ADMIN_CHATS_FORBIDDEN = "🚫 Смотреть права других пользователей может только главный администратор!"
+    ADMIN_CHATS_MAIN = "👑 <b>Главный администратор управляет всеми чатами</b>"
+    ADMIN_CHATS_EMPTY = (
+        "📝 <b>Пользователь не является администратором ни в одном чате</b>\n\n"
+        "🆔 <code>{user_id}</code>"
+    )
+    ADMIN_CHATS_ITEM = "{index}. 💬 <code>{chat_id}</code>"
+    ADMIN_CHATS = (
+        "👑 <b>Чаты, где пользователь является администратором:</b>\n"
+        "🆔 <code>{user_id}</code>\n\n{chat_list}\n\n"
+        "📊 <b>Всего:</b> {chat_count} чатов"
+    )
+
+    REVOKE_ADMIN_FORBIDDEN = "🚫 Снимать администраторов во всех чатах может только главный администратор!"
+    REVOKE_ADMIN_USAGE = (
+        "❌ <b>Использование:</b>\n"
+        "<code>/revoke_admin 123456789</code> - снять админа во всех чатах"
+    )
+    ADMIN_REVOKED = (
+        "✅ <b>Администратор снят во всех чатах</b>\n\n"
+        "🆔 <code>{user_id}</code>\n"
+        "📊 <b>Чатов:</b> {chat_count}"
+    )
+
+    MY_ID = (
+        "👤 <b>Ваша информация:</b>\n\n"
+        "🆔 <b>ID:</b> <code>{user_id}</code>\n"
+        "📛 <b>Имя:</b> {full_name}\n"
+        "🔖 <b>Username:</b> @{username}\n"
+        "💬 <b>ID чата:</b> <code>{chat_id}</code>\n"
+        "🎯 <b>Статус:</b> {admin_status}"
+    )
+
+    GET_ID_USAGE = (
+        "❌ <b>Использование:</b>\n"
+        "<code>/get_id</code> - в ответ на сообщение пользователя\n"
+        "<code>/get_id 123456789</code> - по ID"
+    )
+    USER_INFO = (
+        "👤 <b>Информация о пользователе:</b>\n\n"
+        "🆔 <b>ID:</b> <code>{user_id}</code>\n"
+        "📛 <b>Имя:</b> {full_name}\n"
+        "🔖 <b>Username:</b> @{username}"
+    )
+    USER_NOT_FOUND = "❌ Пользователь с ID {user_id} не найден"
+    NUMERIC_ID_REQUIRED = "❌ Используйте числовой ID пользователя"
+
+    CHAT_ADMINS_UNAVAILABLE = "❌ Не удалось получить список администраторов"
+    CHAT_ADMINS_ITEM = "{index}. {full_name}{username} - <code>{user_id}</code>{mark}"
+    CHAT_ADMINS = "👥 <b>Администраторы чата:</b>\n\n{admin_list}"
+
+    CHAT_INFO = (
+        "💬 <b>Информация о чате:</b>\n\n"
+        "📛 <b>Название:</b> {title}\n"
+        "🆔 <b>ID чата:</b> <code>{chat_id}</code>\n"
+        "👥 <b>Тип:</b> {chat_type}\n"
+        "👑 <b>Админов бота:</b> {admin_count}"
+    )
+
+    LIST_MORE = "… и еще {count}"
+    DURATION_FOR = "на {duration}"
+    DURATION_FOREVER = "навсегда"
+    INVALID_DURATION = "❌ Неверный формат времени. Используйте: 10m, 1h, 1d, 1w"
+
+    BULK_PROGRESS = "{title}\n\n⏳ Обработано: {done}/{total}"
+    BULK_ITEM_OK = "✅ <code>{user_id}</code>"
+    BULK_ITEM_FAILED = "❌ <code>{user_id}</code> - {error}"
+    BULK_SUMMARY = "{title}\n\n{result_list}\n\n📊 <b>Успешно:</b> {succeeded}/{total}"
+
+    MUTE_SELF = "❌ Не могу замутить самого себя!"
+    MUTE_BOT_ADMIN = "❌ Нельзя замутить администратора бота!"
+    MUTE_USAGE = (
+        "❌ <b>Использование:</b>\n"
+        "<code>/mute ID</code> - мут на 10 мин\n"
+        "<code>/mute ID 1h</code> - мут на 1 час\n"
+        "<code>/mute ID1 ID2 ... 1h</code> - мут нескольких\n\n"
+        "💡 <i>Или ответьте на сообщение командой /mute</i>\n"
+    ) + _DURATION_HINT
+    MUTE_BULK = "🔇 <b>Массовый мут на {duration}</b>"
+    MUTED = (
+        "🔇 <b>{user_name} замьючен на {duration}</b>\n\n"
+        "⏰ До: {until}\n"
+        "🆔 ID: <code>{user_id}</code>"
+    )
+    AUTO_MUTED = (
+        "🔇 <b>{user_name} замьючен на {duration}</b>\n\n"
+        "🛡 Причина: {reason}\n"
+        "⏰ До: {until}\n"
+        "🆔 ID: <code>{user_id}</code>"
+    )
+    MUTE_ERROR = "❌ Ошибка мута: {error}"
+
+    UNMUTE_USAGE = (
+        "❌ <b>Использование:</b>\n"
+        "<code>/unmute ID</code> - размутить по ID\n\n"
+        "💡 <i>Или ответьте на сообщение командой /unmute</i>"
+    )
+    UNMUTED = "🔊 <b>{user_name} размьючен</b>\n\n🆔 ID: <code>{user_id}</code>"
+    UNMUTE_ERROR = "❌ Ошибка размута: {error}"
+
+    BAN_SELF = "❌ Не могу забанить самого себя!"
+    BAN_BOT_ADMIN = "❌ Нельзя забанить администратора бота!"
+    BAN_USAGE = (
+        "❌ <b>Использование:</b>\n"
+        "<code>/ban ID</code> - бан навсегда\n"
+        "<code>/ban ID 1h</code> - бан на 1 час\n"
+        "<code>/ban ID1 ID2 ... 1h</code> - бан нескольких\n\n"
+        "💡 <i>Или ответьте на сообщение командой /ban</i>\n"
+    ) + _DURATION_HINT
+    BAN_BULK = "🚫 <b>Массовый бан {duration_text}</b>"
+    BAN_UNTIL = "⏰ До: {until}"
+    BAN_FOREVER = "⏰ Навсегда"
+    BANNED = "🚫 <b>{user_name} забанен {duration_text}</b>\n\n{until_text}\n🆔 ID: <code>{user_id}</code>"
+    BAN_ERROR = "❌ Ошибка бана: {error}"
+
+    BAN_REPLIERS_USAGE = (
+        "❌ <b>Использование:</b>\n"
+        "Ответьте на сообщение командой <code>/ban_repliers [время]</code> - "
+        "бан всех, кто на него ответил"
+    )
+    NO_REPLIERS = "📝 <b>На это сообщение никто не отвечал</b>"
+    BAN_REPLIERS = "🚫 <b>Бан ответивших {duration_text}</b>"
+
+    UNBAN_USAGE = (
+        "❌ <b>Использование:</b>\n"
+        "<code>/unban ID</code> - разбанить по ID\n\n"
+        "💡 <i>Или ответьте на сообщение командой /unban</i>"
+    )
+    UNBANNED = "✅ <b>{user_name} разбанен</b>\n\n🆔 ID: <code>{user_id}</code>"
+    UNBAN_ERROR = "❌ Ошибка разбана: {error}"
+
+    KICK_SELF = "❌ Не могу кикнуть самого себя!"
+    KICK_BOT_ADMIN = "❌ Нельзя кикнуть администратора бота!"
+    KICK_USAGE = (
+        "❌ <b>Использование:</b>\n"
+        "<code>/kick ID</code> - кикнуть по ID\n"
+        "<code>/kick ID1 ID2 ...</code> - кикнуть нескольких\n\n"
+        "💡 <i>Или ответьте на сообщение командой /kick</i>"
+    )
+    KICK_BULK = "👢 <b>Массовый кик</b>"
+    KICKED = (
+        "👢 <b>{user_name} кикнут из чата</b>\n\n"
+        "🆔 ID: <code>{user_id}</code>\n"
+        "💡 <i>Пользователь может вернуться по приглашению</i>"
+    )
+    KICK_ERROR = "❌ Ошибка кика: {error}"
+
+    PUNISHMENTS_EMPTY = "📝 <b>Активных временных наказаний нет</b>"
+    PUNISHMENTS_ITEM = "{icon} <code>{user_id}</code> - до {until} (осталось {left})"
+    PUNISHMENTS = "⏳ <b>Активные наказания:</b>\n\n{punishment_list}\n\n📊 <b>Всего:</b> {count}"
+
+    EXTEND_USAGE = (
+        "❌ <b>Использование:</b>\n"
+        "<code>/extend ID 1h</code> - продлить мут или бан на 1 час\n\n"
+        "💡 <i>Или ответьте на сообщение командой /extend 1h</i>"
+    )
+    EXTEND_MUTE = "🔇 Мут до {until}"
+    EXTEND_BAN = "🚫 Бан до {until}"
+    NOTHING_TO_EXTEND = "ℹ️ <b>У пользователя нет временных наказаний</b>\n\n🆔 ID: <code>{user_id}</code>"
+    EXTENDED = (
+        "⏳ <b>{user_name}: наказание продлено на {duration}</b>\n\n"
+        "{extended}\n"
+        "🆔 ID: <code>{user_id}</code>"
+    )
+    EXTEND_ERROR = "❌ Ошибка продления: {error}"
+
+    ATTENDANCE_NAME = "• {name}"
+    ATTENDANCE_CLOSED = "⏳ Этот опрос уже закрыт"
+    ATTENDANCE_VOTED = "Ваш ответ: {label}"
+    INVALID_PERIOD = "❌ Неверный формат периода. Используйте: 4w, 30d"
+    ATTENDANCE_STATS_EMPTY = "📝 <b>Закрытых опросов пока нет</b>"
+    ATTENDANCE_STATS_PERIOD = " за {duration}"
+    ATTENDANCE_STATS_POLL = "• {date}: ✅ {came} из {voted}"
+    ATTENDANCE_STATS_USER = "{index}. {name} - {percent}% ({attended}/{eligible}), серия {current} (лучшая {best})"
+    ATTENDANCE_STATS = (
+        "📊 <b>Статистика посещаемости{period}</b>\n\n"
+        "🗓 <b>Опросов:</b> {poll_count} (с {since})\n"
+        "👥 <b>Средняя явка:</b> {turnout:.1f}\n\n"
+        "<b>Последние опросы:</b>\n{poll_list}\n\n"
+        "<b>Участники:</b>\n{user_list}"
+    )
+
+    BACKUP_FORBIDDEN = "🚫 Резервные копии доступны только главному администратору!"
+    BACKUP_ERROR = "❌ Ошибка резервного копирования: {error}"
+    BACKUP_CREATED = (
+        "💾 <b>Резервная копия создана</b>\n\n"
+        "🆔 <code>{backup_id}</code>\n"
+        "📦 Новых данных: {written} байт"
+    )
+    BACKUPS_EMPTY = "📝 <b>Резервных копий пока нет</b>"
+    BACKUPS_ITEM = "• <code>{backup_id}</code> - {created}"
+    BACKUPS = (
+        "💾 <b>Резервные копии:</b>\n\n{backup_list}\n\n"
+        "💡 <i>Восстановление при остановленном боте:</i>\n"
+        "<code>python bot.py restore НОМЕР</code>"
+    )
+
+
 class AdminPanel:
     """Класс для управления панелью администратора"""
 
-    def __init__(self, permission_manager, data_manager):
+    # Сколько последних отрисовок панели помнить для пропуска пустых правок
+    RENDER_CACHE_SIZE = 1000
+
+    def __init__(self, permission_manager, data_manager, http_requests=()):
         self.permission_manager = permission_manager
         self.data_manager = data_manager
+        # Пулы HTTP-клиента для показа загрузки в статусе
+        self.http_requests = http_requests
+        # callback_data -> async (query, context) -> (text, reply_markup)
+        self.sections = {}
+        # (chat_id, message_id) -> хэш показанного содержимого
+        self._rendered = OrderedDict()
+
+        self.register_section("admin_manage", self._show_admin_management)
+        self.register_section("admin_mute", self._show_mute_help)
+        self.register_section("admin_ban", self._show_ban_help)
+        self.register_section("admin_kick", self._show_kick_help)
+        self.register_section("admin_status", self._show_status)
+        self.register_section("admin_get_id", self._show_get_id_help)
+        self.register_section("admin_back", self.show_admin_panel_from_query)
+
+    def register_section(self, callback_data, handler):
+        """Добавляет раздел панели: handler(query, context) возвращает (text, reply_markup)"""
+        self.sections[callback_data] = handler
 
     async def show_admin_panel(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Показывает панель администратора"""
@@ -208,203 +2259,98 @@ class AdminPanel:
         chat_id = update.effective_chat.id
         user = update.effective_user
 
-        keyboard = [
-            [InlineKeyboardButton("👥 Управление админами", callback_data="admin_manage")],
-            [InlineKeyboardButton("🔇 Мут пользователя", callback_data="admin_mute")],
-            [InlineKeyboardButton("🚫 Бан пользователя", callback_data="admin_ban")],
-            [InlineKeyboardButton("👢 Кик пользователя", callback_data="admin_kick")],
-            [InlineKeyboardButton("📊 Статус бота", callback_data="admin_status")],
-            [InlineKeyboardButton("🆔 Получить ID", callback_data="admin_get_id")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-
-        text = (
-            f"👑 <b>Панель администратора</b>\n\n"
-            f"👤 <b>Пользователь:</b> {user.full_name}\n"
-            f"🆔 <b>Ваш ID:</b> <code>{user.id}</code>\n"
-            f"💬 <b>Чат ID:</b> <code>{chat_id}</code>\n\n"
-            f"⚡ <b>Выберите действие:</b>"
-        )
+        text = Templates.ADMIN_PANEL.format(full_name=user.full_name, user_id=user.id, chat_id=chat_id)
 
         await MessageSender.send_safe_message(
-            context, chat_id, text, reply_markup=reply_markup
+            context, chat_id, text, reply_markup=Templates.ADMIN_PANEL_KEYBOARD
         )
 
     async def handle_admin_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обрабатывает нажатия на кнопки панели администратора"""
         query = update.callback_query
-        await query.answer()
 
         if not await self.permission_manager.is_admin(query.message.chat_id, query.from_user.id):
-            await query.edit_message_text("🚫 У вас нет прав администратора!")
-            return
-
-        callback_data = query.data
-
-        if callback_data == "admin_manage":
-            await self._show_admin_management(query, context)
-        elif callback_data == "admin_mute":
-            await self._show_mute_help(query, context)
-        elif callback_data == "admin_ban":
-            await self._show_ban_help(query, context)
-        elif callback_data == "admin_kick":
-            await self._show_kick_help(query, context)
-        elif callback_data == "admin_status":
-            await self._show_status(query, context)
-        elif callback_data == "admin_get_id":
-            await self._show_get_id_help(query, context)
-        elif callback_data == "admin_back":
-            await self.show_admin_panel_from_query(query, context)
+            await asyncio.gather(query.answer(), self._edit(query, Templates.NO_ADMIN_RIGHTS))
+            return
 
-    async def show_admin_panel_from_query(self, query, context):
-        """Показывает панель администратора из callback query"""
-        chat_id = query.message.chat_id
-        user = query.from_user
+        handler = self.sections.get(query.data)
+        if handler is None:
+            await query.answer()
+            return
 
-        keyboard = [
-            [InlineKeyboardButton("👥 Управление админами", callback_data="admin_manage")],
-            [InlineKeyboardButton("🔇 Мут пользователя", callback_data="admin_mute")],
-            [InlineKeyboardButton("🚫 Бан пользователя", callback_data="admin_ban")],
-            [InlineKeyboardButton("👢 Кик пользователя", callback_data="admin_kick")],
-            [InlineKeyboardButton("📊 Статус бота", callback_data="admin_status")],
-            [InlineKeyboardButton("🆔 Получить ID", callback_data="admin_get_id")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-
-        text = (
-            f"👑 <b>Панель администратора</b>\n\n"
-            f"👤 <b>Пользователь:</b> {user.full_name}\n"
-            f"🆔 <b>Ваш ID:</b> <code>{user.id}</code>\n"
-            f"💬 <b>Чат ID:</b> <code>{chat_id}</code>\n\n"
-            f"⚡ <b>Выберите действие:</b>"
-        )
+        text, reply_markup = await handler(query, context)
+        # Ответ на нажатие и правка сообщения независимы - отправляем одновременно
+        await asyncio.gather(query.answer(), self._edit(query, text, reply_markup))
 
-        await query.edit_message_text(text, reply_markup=reply_markup, parse_mode='HTML')
+    async def _edit(self, query, text, reply_markup=None):
+        """Правит сообщение панели, пропуская правки без изменений"""
+        key = (query.message.chat_id, query.message.message_id)
+        content = text if reply_markup is None else text + reply_markup.to_json()
+        digest = hashlib.blake2b(content.encode(), digest_size=8).digest()
+        if self._rendered.get(key) == digest:
+            return
 
-    async def _show_admin_management(self, query, context):
-        """Показывает управление администраторами"""
-        chat_id = query.message.chat_id
-        chat_data = self.data_manager.get_chat_data(chat_id)
+        try:
+            await query.edit_message_text(text, reply_markup=reply_markup, parse_mode='HTML')
+        except BadRequest as e:
+            if "message is not modified" not in str(e).lower():
+                raise
 
-        keyboard = [
-            [InlineKeyboardButton("📋 Список админов", callback_data="admin_list")],
-            [InlineKeyboardButton("➕ Добавить админа", callback_data="admin_add")],
-            [InlineKeyboardButton("➖ Удалить админа", callback_data="admin_remove")],
-            [InlineKeyboardButton("🔙 Назад", callback_data="admin_back")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        self._rendered[key] = digest
+        self._rendered.move_to_end(key)
+        if len(self._rendered) > self.RENDER_CACHE_SIZE:
+            self._rendered.popitem(last=False)
 
-        text = (
-            "👑 <b>Управление администраторами</b>\n\n"
-            f"📊 <b>Всего админов:</b> {len(chat_data.admin_users)}\n\n"
-            "⚡ <b>Выберите действие:</b>"
+    async def show_admin_panel_from_query(self, query, context):
+        """Показывает панель администратора из callback query"""
+        user = query.from_user
+        text = Templates.ADMIN_PANEL.format(
+            full_name=user.full_name, user_id=user.id, chat_id=query.message.chat_id
         )
+        return text, Templates.ADMIN_PANEL_KEYBOARD
 
-        await query.edit_message_text(text, reply_markup=reply_markup, parse_mode='HTML')
+    async def _show_admin_management(self, query, context):
+        """Показывает управление администраторами"""
+        chat_data = self.data_manager.get_chat_data(query.message.chat_id)
+        text = Templates.ADMIN_MANAGEMENT.format(admin_count=len(chat_data.admin_users))
+        return text, Templates.ADMIN_MANAGEMENT_KEYBOARD
 
     async def _show_mute_help(self, query, context):
         """Показывает справку по муту"""
-        text = (
-            "🔇 <b>Мут пользователя</b>\n\n"
-            "📝 <b>Использование:</b>\n"
-            "<code>/mute ID</code> - мут на 10 мин\n"
-            "<code>/mute ID 1h</code> - мут на 1 час\n"
-            "<code>/mute ID 2d</code> - мут на 2 дня\n\n"
-            "💡 <b>Примеры времени:</b>\n"
-            "• 30m - 30 минут\n"
-            "• 2h - 2 часа\n"
-            "• 1d - 1 день\n"
-            "• 1w - 1 неделя\n\n"
-            "🔄 <b>Или ответьте на сообщение:</b>\n"
-            "<code>/mute 1h</code>"
-        )
-
-        keyboard = [[InlineKeyboardButton("🔙 Назад", callback_data="admin_back")]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-
-        await query.edit_message_text(text, reply_markup=reply_markup, parse_mode='HTML')
+        return Templates.MUTE_HELP, Templates.BACK_KEYBOARD
 
     async def _show_ban_help(self, query, context):
         """Показывает справку по бану"""
-        text = (
-            "🚫 <b>Бан пользователя</b>\n\n"
-            "📝 <b>Использование:</b>\n"
-            "<code>/ban ID</code> - бан навсегда\n"
-            "<code>/ban ID 1h</code> - бан на 1 час\n"
-            "<code>/ban ID 2d</code> - бан на 2 дня\n\n"
-            "💡 <b>Примеры времени:</b>\n"
-            "• 30m - 30 минут\n"
-            "• 2h - 2 часа\n"
-            "• 1d - 1 день\n"
-            "• 1w - 1 неделя\n\n"
-            "🔄 <b>Или ответьте на сообщение:</b>\n"
-            "<code>/ban 1h</code>"
-        )
-
-        keyboard = [[InlineKeyboardButton("🔙 Назад", callback_data="admin_back")]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-
-        await query.edit_message_text(text, reply_markup=reply_markup, parse_mode='HTML')
+        return Templates.BAN_HELP, Templates.BACK_KEYBOARD
 
     async def _show_kick_help(self, query, context):
         """Показывает справку по кику"""
-        text = (
-            "👢 <b>Кик пользователя</b>\n\n"
-            "📝 <b>Использование:</b>\n"
-            "<code>/kick ID</code> - кикнуть пользователя\n\n"
-            "🔄 <b>Или ответьте на сообщение:</b>\n"
-            "<code>/kick</code>\n\n"
-            "💡 <i>Пользователь сможет вернуться по приглашению</i>"
-        )
-
-        keyboard = [[InlineKeyboardButton("🔙 Назад", callback_data="admin_back")]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-
-        await query.edit_message_text(text, reply_markup=reply_markup, parse_mode='HTML')
+        return Templates.KICK_HELP, Templates.BACK_KEYBOARD
 
     async def _show_status(self, query, context):
         """Показывает статус бота"""
         chat_id = query.message.chat_id
         chat_data = self.data_manager.get_chat_data(chat_id)
-
-        text = (
-            "🤖 <b>Статус бота</b>\n\n"
-            f"✅ <b>Бот активен</b>\n"
-            f"👑 <b>Администраторов:</b> {len(chat_data.admin_users)}\n"
-            f"💬 <b>ID чата:</b> <code>{chat_id}</code>\n"
-            f"🕒 <b>Последнее обновление:</b> {chat_data.last_updated}\n\n"
-            f"💡 <i>Бот работает стабильно</i> 🚀"
+        text = Templates.PANEL_STATUS.format(
+            admin_count=len(chat_data.admin_users),
+            chat_id=chat_id,
+            last_updated=TimeManager.format_timestamp(chat_data.last_updated),
+            http_pools="\n".join(request.format_stats() for request in self.http_requests) or "-",
         )
-
-        keyboard = [[InlineKeyboardButton("🔙 Назад", callback_data="admin_back")]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-
-        await query.edit_message_text(text, reply_markup=reply_markup, parse_mode='HTML')
+        return text, Templates.BACK_KEYBOARD
 
     async def _show_get_id_help(self, query, context):
         """Показывает справку по получению ID"""
-        text = (
-            "🆔 <b>Получение ID</b>\n\n"
-            "📝 <b>Команды:</b>\n"
-            "<code>/id</code> - ваш ID\n"
-            "<code>/get_id</code> - в ответ на сообщение\n"
-            "<code>/all_ids</code> - ID всех админов чата\n"
-            "<code>/chat_info</code> - информация о чате\n\n"
-            "💡 <i>Используйте ID для команд управления</i>"
-        )
-
-        keyboard = [[InlineKeyboardButton("🔙 Назад", callback_data="admin_back")]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-
-        await query.edit_message_text(text, reply_markup=reply_markup, parse_mode='HTML')
+        return Templates.GET_ID_HELP, Templates.BACK_KEYBOARD
 
 
 class AdminCommands:
     """Класс для команд управления администраторами"""
 
-    def __init__(self, data_manager, permission_manager):
+    def __init__(self, data_manager, permission_manager, profile_cache):
         self.data_manager = data_manager
         self.permission_manager = permission_manager
+        self.profile_cache = profile_cache
 
     async def admins_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Показывает список администраторов"""
@@ -415,85 +2361,83 @@ class AdminCommands:
         chat_data = self.data_manager.get_chat_data(chat_id)
 
         if not chat_data.admin_users:
-            await MessageSender.send_safe_message(context, chat_id, "📝 <b>Список администраторов пуст</b>")
+            await MessageSender.send_safe_message(context, chat_id, Templates.ADMINS_EMPTY)
             return
 
+        admin_ids = chat_data.sorted_admins()
+        profiles = await self._resolve_profiles(context.bot, admin_ids)
+
         admin_list = []
-        for i, admin_id in enumerate(chat_data.admin_users, 1):
-            try:
-                user = await context.bot.get_chat(admin_id)
-                admin_info = f"{i}. 👤 {user.full_name}"
-                if user.username:
-                    admin_info += f" (@{user.username})"
-                admin_info += f" | 🆔 <code>{admin_id}</code>"
+        for i, (admin_id, user) in enumerate(zip(admin_ids, profiles), 1):
+            if user is None:
+                admin_list.append(Templates.ADMINS_ITEM_ID.format(index=i, user_id=admin_id))
+                continue
+
+            admin_list.append(Templates.ADMINS_ITEM.format(
+                index=i, full_name=user.full_name, user_id=admin_id,
+                username=f" (@{user.username})" if user.username else "",
+                mark=" 👑" if admin_id == MAIN_ADMIN_ID else ""
+            ))
+
+        text = Templates.ADMINS.format(admin_list="\n".join(admin_list), admin_count=len(chat_data.admin_users))
+        await MessageSender.send_safe_message(context, chat_id, text)
 
-                if admin_id == MAIN_ADMIN_ID:
-                    admin_info += " 👑"
+    async def _resolve_profiles(self, bot, user_ids):
+        """Параллельно получает профили с ограничением числа запросов.
 
-                admin_list.append(admin_info)
-            except:
-                admin_list.append(f"{i}. 🆔 <code>{admin_id}</code>")
+        Медленный запрос дает None (показываем голый ID), но продолжает
+        выполняться в фоне и пополнит кэш для следующего раза.
+        """
+        semaphore = asyncio.Semaphore(ADMIN_LOOKUP_CONCURRENCY)
 
-        text = f"👑 <b>Администраторы чата:</b>\n\n" + "\n".join(admin_list)
-        text += f"\n\n📊 <b>Всего:</b> {len(chat_data.admin_users)} администраторов"
+        async def resolve(user_id):
+            found, profile = self.profile_cache.get_cached(user_id)
+            if found:
+                return profile
+            async with semaphore:
+                try:
+                    return await asyncio.wait_for(
+                        self.profile_cache.get(bot, user_id), ADMIN_LOOKUP_TIMEOUT
+                    )
+                except asyncio.TimeoutError:
+                    return None
 
-        await MessageSender.send_safe_message(context, chat_id, text)
+        return await asyncio.gather(*(resolve(user_id) for user_id in user_ids))
 
     async def add_admin_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Добавляет администратора"""
         if not await self.permission_manager.check_admin_access(update, context):
             return
 
-        if not context.args and not update.message.reply_to_message:
-            await MessageSender.send_safe_message(
-                context, update.effective_chat.id,
-                "❌ <b>Использование:</b>\n"
-                "<code>/add_admin 123456789</code> - добавить по ID\n\n"
-                "💡 <i>Или ответьте на сообщение пользователя с командой /add_admin</i>"
-            )
+        if not context.args and not context.reply_target:
+            await MessageSender.send_safe_message(context, update.effective_chat.id, Templates.ADD_ADMIN_USAGE)
             return
 
         try:
             chat_id = update.effective_chat.id
-            chat_data = self.data_manager.get_chat_data(chat_id)
 
-            if update.message.reply_to_message:
-                user_id = update.message.reply_to_message.from_user.id
-                user_name = update.message.reply_to_message.from_user.full_name
+            if context.reply_target:
+                user_id = context.reply_target.id
+                user_name = context.reply_target.full_name
             else:
                 user_id = int(context.args[0])
-                try:
-                    user = await context.bot.get_chat(user_id)
-                    user_name = user.full_name
-                except:
-                    user_name = f"Пользователь ({user_id})"
+                user_name = await self.profile_cache.get_name(context.bot, user_id)
 
-            if user_id in chat_data.admin_users:
+            if not self.data_manager.add_admin(chat_id, user_id):
                 await MessageSender.send_safe_message(
-                    context, chat_id,
-                    f"ℹ️ <b>Пользователь уже является администратором</b>\n\n"
-                    f"👤 {user_name}\n🆔 <code>{user_id}</code>"
+                    context, chat_id, Templates.ADMIN_ALREADY.format(user_name=user_name, user_id=user_id)
                 )
                 return
 
-            chat_data.admin_users.append(user_id)
-            self.data_manager.save_data()
-
             await MessageSender.send_safe_message(
-                context, chat_id,
-                f"✅ <b>Новый администратор добавлен</b>\n\n"
-                f"👤 {user_name}\n🆔 <code>{user_id}</code>"
+                context, chat_id, Templates.ADMIN_ADDED.format(user_name=user_name, user_id=user_id)
             )
 
         except ValueError:
-            await MessageSender.send_safe_message(
-                context, update.effective_chat.id,
-                "❌ Неверный формат ID. Используйте числовой ID."
-            )
+            await MessageSender.send_safe_message(context, update.effective_chat.id, Templates.INVALID_ID)
         except Exception as e:
             await MessageSender.send_safe_message(
-                context, update.effective_chat.id,
-                f"❌ Ошибка добавления: {e}"
+                context, update.effective_chat.id, Templates.ADD_ADMIN_ERROR.format(error=e)
             )
 
     async def remove_admin_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -501,65 +2445,114 @@ class AdminCommands:
         if not await self.permission_manager.check_admin_access(update, context):
             return
 
-        if not context.args and not update.message.reply_to_message:
-            await MessageSender.send_safe_message(
-                context, update.effective_chat.id,
-                "❌ <b>Использование:</b>\n"
-                "<code>/remove_admin 123456789</code> - удалить по ID\n\n"
-                "💡 <i>Или ответьте на сообщение пользователя с командой /remove_admin</i>"
-            )
+        if not context.args and not context.reply_target:
+            await MessageSender.send_safe_message(context, update.effective_chat.id, Templates.REMOVE_ADMIN_USAGE)
             return
 
         try:
             chat_id = update.effective_chat.id
-            chat_data = self.data_manager.get_chat_data(chat_id)
 
-            if update.message.reply_to_message:
-                user_id = update.message.reply_to_message.from_user.id
-                user_name = update.message.reply_to_message.from_user.full_name
+            if context.reply_target:
+                user_id = context.reply_target.id
+                user_name = context.reply_target.full_name
             else:
                 user_id = int(context.args[0])
-                try:
-                    user = await context.bot.get_chat(user_id)
-                    user_name = user.full_name
-                except:
-                    user_name = f"Пользователь ({user_id})"
+                user_name = await self.profile_cache.get_name(context.bot, user_id)
 
             if user_id == MAIN_ADMIN_ID:
-                await MessageSender.send_safe_message(context, chat_id, "❌ Нельзя удалить главного администратора!")
+                await MessageSender.send_safe_message(context, chat_id, Templates.MAIN_ADMIN_PROTECTED)
                 return
 
-            if user_id not in chat_data.admin_users:
-                await MessageSender.send_safe_message(context, chat_id, "❌ Пользователь не является администратором")
+            if not self.data_manager.remove_admin(chat_id, user_id):
+                await MessageSender.send_safe_message(context, chat_id, Templates.NOT_ADMIN)
                 return
 
-            chat_data.admin_users.remove(user_id)
-            self.data_manager.save_data()
-
             await MessageSender.send_safe_message(
-                context, chat_id,
-                f"✅ <b>Администратор удален</b>\n\n"
-                f"👤 {user_name}\n🆔 <code>{user_id}</code>"
+                context, chat_id, Templates.ADMIN_REMOVED.format(user_name=user_name, user_id=user_id)
             )
 
         except ValueError:
+            await MessageSender.send_safe_message(context, update.effective_chat.id, Templates.INVALID_ID)
+        except Exception as e:
             await MessageSender.send_safe_message(
-                context, update.effective_chat.id,
-                "❌ Неверный формат ID. Используйте числовой ID."
+                context, update.effective_chat.id, Templates.REMOVE_ADMIN_ERROR.format(error=e)
             )
-        except Exception as e:
+
+    async def admin_chats_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Показывает чаты, где пользователь является администратором"""
+        chat_id = update.effective_chat.id
+        target_id = update.effective_user.id
+
+        if context.args:
+            if update.effective_user.id != MAIN_ADMIN_ID:
+                await MessageSender.send_safe_message(context, chat_id, Templates.ADMIN_CHATS_FORBIDDEN)
+                return
+            try:
+                target_id = int(context.args[0])
+            except ValueError:
+                await MessageSender.send_safe_message(context, chat_id, Templates.INVALID_ID)
+                return
+
+        if target_id == MAIN_ADMIN_ID:
+            await MessageSender.send_safe_message(context, chat_id, Templates.ADMIN_CHATS_MAIN)
+            return
+
+        chat_ids = sorted(self.data_manager.get_admin_chats(target_id))
+        if not chat_ids:
             await MessageSender.send_safe_message(
-                context, update.effective_chat.id,
-                f"❌ Ошибка удаления: {e}"
+                context, chat_id, Templates.ADMIN_CHATS_EMPTY.format(user_id=target_id)
             )
+            return
+
+        chat_list = [
+            Templates.ADMIN_CHATS_ITEM.format(index=i, chat_id=admin_chat_id)
+            for i, admin_chat_id in enumerate(chat_ids, 1)
+        ]
+        text = Templates.ADMIN_CHATS.format(
+            user_id=target_id, chat_list="\n".join(chat_list), chat_count=len(chat_ids)
+        )
+        await MessageSender.send_safe_message(context, chat_id, text)
+
+    async def revoke_admin_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Снимает администратора во всех чатах (только главный админ)"""
+        chat_id = update.effective_chat.id
+
+        if update.effective_user.id != MAIN_ADMIN_ID:
+            await MessageSender.send_safe_message(context, chat_id, Templates.REVOKE_ADMIN_FORBIDDEN)
+            return
+
+        if not context.args:
+            await MessageSender.send_safe_message(context, chat_id, Templates.REVOKE_ADMIN_USAGE)
+            return
+
+        try:
+            user_id = int(context.args[0])
+        except ValueError:
+            await MessageSender.send_safe_message(context, chat_id, Templates.INVALID_ID)
+            return
+
+        if user_id == MAIN_ADMIN_ID:
+            await MessageSender.send_safe_message(context, chat_id, Templates.MAIN_ADMIN_PROTECTED)
+            return
+
+        removed = self.data_manager.remove_admin_everywhere(user_id)
+        if not removed:
+            await MessageSender.send_safe_message(context, chat_id, Templates.NOT_ADMIN)
+            return
+
+        await MessageSender.send_safe_message(
+            context, chat_id, Templates.ADMIN_REVOKED.format(user_id=user_id, chat_count=len(removed))
+        )
 
 
 class UserCommands:
     """Класс для пользовательских команд"""
 
-    def __init__(self, permission_manager, data_manager):
+    def __init__(self, permission_manager, data_manager, profile_cache, chat_admins_cache):
         self.permission_manager = permission_manager
         self.data_manager = data_manager
+        self.profile_cache = profile_cache
+        self.chat_admins_cache = chat_admins_cache
 
     async def id_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Показывает ID пользователя"""
@@ -567,138 +2560,75 @@ class UserCommands:
         chat_id = update.effective_chat.id
         is_admin = await self.permission_manager.is_admin(chat_id, user.id)
 
-        admin_status = "👑 Администратор" if is_admin else "👤 Пользователь"
+        admin_status = Templates.STATUS_ADMIN if is_admin else Templates.STATUS_USER
 
         await MessageSender.send_safe_message(
             context, chat_id,
-            f"👤 <b>Ваша информация:</b>\n\n"
-            f"🆔 <b>ID:</b> <code>{user.id}</code>\n"
-            f"📛 <b>Имя:</b> {user.full_name}\n"
-            f"🔖 <b>Username:</b> @{user.username if user.username else 'нет'}\n"
-            f"💬 <b>ID чата:</b> <code>{chat_id}</code>\n"
-            f"🎯 <b>Статус:</b> {admin_status}"
+            Templates.MY_ID.format(
+                user_id=user.id, full_name=user.full_name, username=user.username or 'нет',
+                chat_id=chat_id, admin_status=admin_status
+            )
         )
 
     async def get_id_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Получает ID пользователя"""
-        if not context.args and not update.message.reply_to_message:
-            await MessageSender.send_safe_message(
-                context, update.effective_chat.id,
-                "❌ <b>Использование:</b>\n"
-                "<code>/get_id</code> - в ответ на сообщение пользователя\n"
-                "<code>/get_id 123456789</code> - по ID"
-            )
+        if not context.args and not context.reply_target:
+            await MessageSender.send_safe_message(context, update.effective_chat.id, Templates.GET_ID_USAGE)
             return
 
         try:
-            if update.message.reply_to_message:
-                user = update.message.reply_to_message.from_user
+            if context.reply_target:
+                user = context.reply_target
                 await MessageSender.send_safe_message(
                     context, update.effective_chat.id,
-                    f"👤 <b>Информация о пользователе:</b>\n\n"
-                    f"🆔 <b>ID:</b> <code>{user.id}</code>\n"
-                    f"📛 <b>Имя:</b> {user.full_name}\n"
-                    f"🔖 <b>Username:</b> @{user.username if user.username else 'нет'}"
+                    Templates.USER_INFO.format(user_id=user.id, full_name=user.full_name, username=user.username or 'нет')
                 )
             elif context.args:
                 target = context.args[0]
                 if target.isdigit():
-                    user_id = int(target)
-                    try:
-                        user = await context.bot.get_chat(user_id)
+                    user = await self.profile_cache.get(context.bot, int(target))
+                    if user is not None:
                         await MessageSender.send_safe_message(
                             context, update.effective_chat.id,
-                            f"👤 <b>Информация о пользователе:</b>\n\n"
-                            f"🆔 <b>ID:</b> <code>{user.id}</code>\n"
-                            f"📛 <b>Имя:</b> {user.full_name}\n"
-                            f"🔖 <b>Username:</b> @{user.username if user.username else 'нет'}"
+                            Templates.USER_INFO.format(
+                                user_id=user.user_id, full_name=user.full_name, username=user.username or 'нет'
+                            )
                         )
-                    except:
+                    else:
                         await MessageSender.send_safe_message(
-                            context, update.effective_chat.id,
-                            f"❌ Пользователь с ID {target} не найден"
+                            context, update.effective_chat.id, Templates.USER_NOT_FOUND.format(user_id=target)
                         )
                 else:
                     await MessageSender.send_safe_message(
-                        context, update.effective_chat.id,
-                        "❌ Используйте числовой ID пользователя"
+                        context, update.effective_chat.id, Templates.NUMERIC_ID_REQUIRED
                     )
 
         except Exception as e:
-            await MessageSender.send_safe_message(
-                context, update.effective_chat.id,
-                f"❌ Ошибка: {e}"
-            )
+            await MessageSender.send_safe_message(context, update.effective_chat.id, Templates.ERROR.format(error=e))
 
     async def help_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Показывает справку по командам"""
         chat_id = update.effective_chat.id
         is_admin = await self.permission_manager.is_admin(chat_id, update.effective_user.id)
 
-        help_text = (
-            "🤖 <b>Помощь по командам бота</b>\n\n"
-            "🆔 <b>Получение ID:</b>\n"
-            "<code>/id</code> - ваш ID\n"
-            "<code>/get_id</code> - ID пользователя\n"
-            "<code>/all_ids</code> - ID всех администраторов\n"
-            "<code>/chat_info</code> - информация о чате\n"
-            "<code>/status</code> - статус бота\n\n"
-        )
-
-        if is_admin:
-            help_text += (
-                "👑 <b>Администраторские команды:</b>\n"
-                "<code>/admin</code> - панель администратора\n"
-                "<code>/admins</code> - список администраторов\n"
-                "<code>/add_admin ID</code> - добавить администратора\n"
-                "<code>/remove_admin ID</code> - удалить администратора\n\n"
-                "🔇 <b>Мут:</b>\n"
-                "<code>/mute ID [время]</code> - мут пользователя\n"
-                "<code>/unmute ID</code> - размутить\n\n"
-                "🚫 <b>Бан:</b>\n"
-                "<code>/ban ID [время]</code> - бан пользователя\n"
-                "<code>/unban ID</code> - разбанить\n\n"
-                "👢 <b>Кик:</b>\n"
-                "<code>/kick ID</code> - кикнуть пользователя\n"
-            )
-
-        help_text += (
-            "\n💡 <b>Советы:</b>\n"
-            "• Используйте ID вместо username\n"
-            "• Для команд можно отвечать на сообщения\n"
-            "• Каждый чат имеет отдельный список администраторов"
-        )
-
+        help_text = Templates.HELP_ADMIN if is_admin else Templates.HELP
         await MessageSender.send_safe_message(context, chat_id, help_text)
 
     async def start_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Команда start"""
         chat_id = update.effective_chat.id
 
-        await MessageSender.send_safe_message(
-            context, chat_id,
-            f"✅ <b>Продвинутый бот-администратор активирован!</b>\n\n"
-            f"⚡ <b>Основные возможности:</b>\n"
-            f"• Управление администраторами\n"
-            f"• Мут, бан и кик пользователей\n"
-            f"• Получение ID пользователей\n\n"
-            f"💡 <i>Используйте /help для полного списка команд</i>"
-        )
+        await MessageSender.send_safe_message(context, chat_id, Templates.START)
 
     async def status_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Показывает статус бота"""
         chat_id = update.effective_chat.id
         chat_data = self.data_manager.get_chat_data(chat_id)
         is_admin = await self.permission_manager.is_admin(chat_id, update.effective_user.id)
-        admin_status = "👑 Администратор" if is_admin else "👤 Пользователь"
-
-        status_text = (
-            "🤖 <b>Статус бота:</b>\n\n"
-            f"✅ <b>Бот активен</b>\n"
-            f"👑 <b>Администраторов:</b> {len(chat_data.admin_users)}\n"
-            f"💬 <b>ID чата:</b> <code>{chat_id}</code>\n"
-            f"🎯 <b>Ваш статус:</b> {admin_status}\n\n"
-            f"💡 <i>Бот работает стабильно</i> 🚀"
+        admin_status = Templates.STATUS_ADMIN if is_admin else Templates.STATUS_USER
+
+        status_text = Templates.STATUS.format(
+            admin_count=len(chat_data.admin_users), chat_id=chat_id, admin_status=admin_status
         )
         await MessageSender.send_safe_message(context, chat_id, status_text)
 
@@ -706,30 +2636,25 @@ class UserCommands:
         """Показывает ID всех администраторов чата"""
         try:
             chat_id = update.effective_chat.id
-            admins = await context.bot.get_chat_administrators(chat_id)
+            admins = await self.chat_admins_cache.get(context.bot, chat_id)
 
             if not admins:
-                await MessageSender.send_safe_message(context, chat_id, "❌ Не удалось получить список администраторов")
+                await MessageSender.send_safe_message(context, chat_id, Templates.CHAT_ADMINS_UNAVAILABLE)
                 return
 
-            admin_list = []
-            for i, admin in enumerate(admins, 1):
-                user = admin.user
-                admin_info = f"{i}. {user.full_name}"
-                if user.username:
-                    admin_info += f" (@{user.username})"
-                admin_info += f" - <code>{user.id}</code>"
-
-                if admin.status == 'creator':
-                    admin_info += " 👑"
-
-                admin_list.append(admin_info)
-
-            text = "👥 <b>Администраторы чата:</b>\n\n" + "\n".join(admin_list)
+            admin_list = [
+                Templates.CHAT_ADMINS_ITEM.format(
+                    index=i, full_name=admin.user.full_name, user_id=admin.user.id,
+                    username=f" (@{admin.user.username})" if admin.user.username else "",
+                    mark=" 👑" if admin.status == 'creator' else ""
+                )
+                for i, admin in enumerate(admins, 1)
+            ]
+            text = Templates.CHAT_ADMINS.format(admin_list="\n".join(admin_list))
             await MessageSender.send_safe_message(context, chat_id, text)
 
         except Exception as e:
-            await MessageSender.send_safe_message(context, update.effective_chat.id, f"❌ Ошибка: {e}")
+            await MessageSender.send_safe_message(context, update.effective_chat.id, Templates.ERROR.format(error=e))
 
     async def chat_info_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Показывает информацию о чате"""
@@ -738,115 +2663,655 @@ class UserCommands:
             chat_id = chat.id
             chat_data = self.data_manager.get_chat_data(chat_id)
 
-            admin_count = len(chat_data.admin_users)
-
             await MessageSender.send_safe_message(
                 context, chat_id,
-                f"💬 <b>Информация о чате:</b>\n\n"
-                f"📛 <b>Название:</b> {chat.title}\n"
-                f"🆔 <b>ID чата:</b> <code>{chat.id}</code>\n"
-                f"👥 <b>Тип:</b> {chat.type}\n"
-                f"👑 <b>Админов бота:</b> {admin_count}"
+                Templates.CHAT_INFO.format(
+                    title=chat.title, chat_id=chat.id, chat_type=chat.type, admin_count=len(chat_data.admin_users)
+                )
+            )
+        except Exception as e:
+            await MessageSender.send_safe_message(context, update.effective_chat.id, Templates.ERROR.format(error=e))
+
+
+class ModerationError(Exception):
+    """Действие модерации отклонено проверкой; текст - сообщение пользователю"""
+
+
+class ReplyTracker:
+    """Помнит, кто отвечал на недавние сообщения чата (для /ban_repliers)"""
+
+    def __init__(self, messages_per_chat=REPLY_TRACKER_MESSAGES, max_chats=REPLY_TRACKER_CHATS):
+        self.messages_per_chat = messages_per_chat
+        self.max_chats = max_chats
+        # chat_id -> OrderedDict(message_id -> set(user_id))
+        self._chats = OrderedDict()
+
+    async def observe_update(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        message = update.message
+        if message is None or message.reply_to_message is None or message.from_user is None:
+            return
+
+        chat_id = message.chat_id
+        replies = self._chats.get(chat_id)
+        if replies is None:
+            replies = self._chats[chat_id] = OrderedDict()
+            if len(self._chats) > self.max_chats:
+                self._chats.popitem(last=False)
+        else:
+            self._chats.move_to_end(chat_id)
+
+        target_id = message.reply_to_message.message_id
+        repliers = replies.get(target_id)
+        if repliers is None:
+            repliers = replies[target_id] = set()
+            if len(replies) > self.messages_per_chat:
+                replies.popitem(last=False)
+        repliers.add(message.from_user.id)
+
+    def get_repliers(self, chat_id, message_id):
+        replies = self._chats.get(chat_id)
+        if replies is None:
+            return set()
+        return set(replies.get(message_id, ()))
+
+
+class ModerationPipeline:
+    """Массовые действия модерации: ограниченная параллельность,
+    прогресс в одном редактируемом сообщении и итог по каждой цели"""
+
+    MAX_SUMMARY_LINES = 50
+
+    def __init__(self, concurrency=BULK_MODERATION_CONCURRENCY, progress_interval=BULK_PROGRESS_INTERVAL):
+        self.concurrency = concurrency
+        self.progress_interval = progress_interval
+
+    async def run(self, context, chat_id, title, targets, action):
+        """Выполняет action(user_id) для всех целей; возвращает {user_id: ошибка или None}"""
+        progress = await MessageSender.send_tracked_message(
+            context, chat_id, Templates.BULK_PROGRESS.format(title=title, done=0, total=len(targets)),
+            priority=MessageSender.PRIORITY_HIGH
+        )
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        results = {}
+
+        async def process(user_id):
+            async with semaphore:
+                try:
+                    await action(user_id)
+                    results[user_id] = None
+                except ModerationError as e:
+                    results[user_id] = str(e)
+                except Exception as e:
+                    results[user_id] = f"❌ {e}"
+
+        work = asyncio.gather(*(process(user_id) for user_id in targets))
+        reported = 0
+        while not work.done():
+            await asyncio.wait([work], timeout=self.progress_interval)
+            if progress is not None and not work.done() and len(results) != reported:
+                reported = len(results)
+                await MessageSender.edit_safe_message(
+                    context, chat_id, progress.message_id,
+                    Templates.BULK_PROGRESS.format(title=title, done=reported, total=len(targets))
+                )
+        await work
+
+        summary = self._summary(title, targets, results)
+        if progress is not None:
+            await MessageSender.edit_safe_message(
+                context, chat_id, progress.message_id, summary, priority=MessageSender.PRIORITY_HIGH
+            )
+        else:
+            await MessageSender.send_safe_message(context, chat_id, summary, priority=MessageSender.PRIORITY_HIGH)
+        return results
+
+    def _summary(self, title, targets, results):
+        succeeded = sum(1 for user_id in targets if results.get(user_id) is None)
+        lines = []
+        for user_id in targets[:self.MAX_SUMMARY_LINES]:
+            error = results.get(user_id)
+            if error is None:
+                lines.append(Templates.BULK_ITEM_OK.format(user_id=user_id))
+            else:
+                lines.append(Templates.BULK_ITEM_FAILED.format(user_id=user_id, error=error.removeprefix('❌ ')))
+        if len(targets) > self.MAX_SUMMARY_LINES:
+            lines.append(Templates.LIST_MORE.format(count=len(targets) - self.MAX_SUMMARY_LINES))
+
+        return Templates.BULK_SUMMARY.format(
+            title=title, result_list="\n".join(lines), succeeded=succeeded, total=len(targets)
+        )
+
+
+class PunishmentStore:
+    """Файл активных временных наказаний: снимок и журнал изменений.
+
+    Запись журнала - {"op": "set", "chat", "user", "kind", "until"[, "forever"]}
+    или {"op": "del", "chat", "user", "kind"}. forever - срок, который Telegram
+    считает вечным: такое наказание бот снимает сам.
+    """
+
+    def __init__(self, filename=PUNISHMENTS_FILE, compact_size=JOURNAL_COMPACT_SIZE,
+                 import_filename=None, chat_filter=None):
+        self.filename = filename
+        self.journal_filename = f"{filename}.journal"
+        self.compact_size = compact_size
+        # Общий файл, из которого шард при первом запуске берет свои чаты
+        self.import_filename = import_filename
+        self.chat_filter = chat_filter
+        self._buffer = []
+        self._journal_size = 0
+
+    @staticmethod
+    def _load_snapshot(filename, apply_record):
+        with open(filename, encoding='utf-8') as f:
+            data = json.load(f)
+        for chat_id, user_id, kind, until, *forever in data.get('punishments', ()):
+            apply_record({
+                'op': 'set', 'chat': chat_id, 'user': user_id, 'kind': kind, 'until': until, 'forever': bool(forever)
+            })
+
+    def load(self, apply_record):
+        try:
+            if os.path.exists(self.filename):
+                self._load_snapshot(self.filename, apply_record)
+            elif self.import_filename:
+                # Первый запуск шарда: свои записи из общего снимка и его журнала
+                def apply_own(record):
+                    if self.chat_filter(record['chat']):
+                        apply_record(record)
+
+                if os.path.exists(self.import_filename):
+                    self._load_snapshot(self.import_filename, apply_own)
+                replay_journal(f"{self.import_filename}.journal", apply_own)
+        except Exception as e:
+            logger.error(f"Ошибка загрузки наказаний: {e}")
+
+        _, self._journal_size = replay_journal(self.journal_filename, apply_record)
+
+    def stage(self, record):
+        self._buffer.append(record)
+
+    def has_pending(self):
+        return bool(self._buffer)
+
+    def prepare_flush(self, entries, forever, compact=False):
+        records = self._buffer
+        self._buffer = []
+        snapshot = None
+        if compact or self._journal_size >= self.compact_size:
+            snapshot = [[*key, until, 1] if key in forever else [*key, until] for key, until in entries.items()]
+        return records, snapshot
+
+    def write_batch(self, batch):
+        records, snapshot = batch
+        size = append_journal(self.journal_filename, records)
+
+        if snapshot is not None:
+            def write(f):
+                f.write('{"version": 1, "punishments": [')
+                separator = '\n'
+                for row in snapshot:
+                    f.write(separator)
+                    f.write(json.dumps(row))
+                    separator = ',\n'
+                f.write('\n]}\n')
+
+            atomic_write(self.filename, write)
+            truncate_journal(self.journal_filename)
+            size = 0
+
+        self._journal_size = size
+
+    def restore_batch(self, batch):
+        records, snapshot = batch
+        self._buffer = records + self._buffer
+
+
+class PunishmentScheduler:
+    """Сроки временных мутов и банов.
+
+    Сроки лежат в min-куче, а в event loop стоит один таймер - на ближайший
+    из них, поэтому ожидающие наказания не требуют опроса. Замененные и
+    отмененные записи остаются в куче и пропускаются при извлечении.
+    Состояние переживает перезапуск через PunishmentStore.
+    """
+
+    KINDS = ('mute', 'ban')
+
+    # Сроки дальше 366 дней и ближе 30 секунд Telegram считает вечными
+    FOREVER_AFTER = 366 * 86400
+    FOREVER_BEFORE = 30
+
+    def __init__(self, store=None, flush_interval=SAVE_INTERVAL,
+                 retry_delay=PUNISHMENT_RETRY_DELAY, concurrency=BULK_MODERATION_CONCURRENCY):
+        self.store = store if store is not None else PunishmentStore()
+        self.flush_interval = flush_interval
+        self.retry_delay = retry_delay
+        self.concurrency = concurrency
+        self.entries = {}                # (chat_id, user_id, kind) -> срок (epoch)
+        self.by_chat = defaultdict(set)  # chat_id -> ключи его записей
+        self.forever = set()             # ключи, которые Telegram сам не снимет
+        self._heap = []                  # (срок, chat_id, user_id, kind)
+        self._timer = None
+        self._timer_at = None
+        self._bot = None
+        self._expire = None
+        self._active = 0
+        self._flush_task = None
+        self._flush_lock = None
+
+    def _apply_record(self, record):
+        key = (record['chat'], record['user'], record['kind'])
+        if record['op'] == 'set':
+            self._set(key, int(record['until']), record.get('forever', False))
+        else:
+            self._discard(key)
+
+    def _set(self, key, until, forever):
+        self.entries[key] = until
+        self.by_chat[key[0]].add(key)
+        if forever:
+            self.forever.add(key)
+        else:
+            self.forever.discard(key)
+        heapq.heappush(self._heap, (until, *key))
+
+    def _discard(self, key):
+        if self.entries.pop(key, None) is None:
+            return False
+        self.forever.discard(key)
+        keys = self.by_chat[key[0]]
+        keys.discard(key)
+        if not keys:
+            del self.by_chat[key[0]]
+        return True
+
+    def _rebuild_heap(self):
+        self._heap = [(until, *key) for key, until in self.entries.items()]
+        heapq.heapify(self._heap)
+
+    def load(self):
+        """Загружает наказания с диска"""
+        self.store.load(self._apply_record)
+        self._rebuild_heap()
+        logger.info(f"Загружено временных наказаний: {len(self.entries)}")
+
+    def start(self, bot, expire):
+        """Запускает таймер; expire(bot, chat_id, user_id, kind, forever) снимает наказание"""
+        self._bot = bot
+        self._expire = expire
+        self._arm()
+
+    def stop(self):
+        self._expire = None
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def schedule(self, chat_id, user_id, kind, until, forever=None):
+        """Запоминает (или заменяет) срок наказания, только что выставленный в Telegram"""
+        until = int(until)
+        if forever is None:
+            term = until - time.time()
+            forever = term > self.FOREVER_AFTER or term < self.FOREVER_BEFORE
+        self._set((chat_id, user_id, kind), until, forever)
+        record = {'op': 'set', 'chat': chat_id, 'user': user_id, 'kind': kind, 'until': until}
+        if forever:
+            record['forever'] = True
+        self._record(record)
+        self._arm()
+
+    def cancel(self, chat_id, user_id, kind):
+        """Забывает наказание. Возвращает False, если его не было"""
+        if not self._discard((chat_id, user_id, kind)):
+            return False
+        self._record({'op': 'del', 'chat': chat_id, 'user': user_id, 'kind': kind})
+        return True
+
+    def get(self, chat_id, user_id, kind):
+        """Срок наказания (epoch) или None"""
+        return self.entries.get((chat_id, user_id, kind))
+
+    def list_chat(self, chat_id):
+        """Активные наказания чата: список (срок, user_id, kind) по возрастанию срока"""
+        return sorted((self.entries[key], key[1], key[2]) for key in self.by_chat.get(chat_id, ()))
+
+    def _drop_stale(self):
+        heap = self._heap
+        while heap and self.entries.get(heap[0][1:]) != heap[0][0]:
+            heapq.heappop(heap)
+        # Частые продления копят устаревшие записи - пересобираем кучу
+        if len(heap) > 2 * len(self.entries) + 1024:
+            self._rebuild_heap()
+
+    def _arm(self):
+        """Ставит таймер на ближайший срок, если он раньше уже заведенного"""
+        if self._expire is None:
+            return
+        self._drop_stale()
+        if not self._heap:
+            return
+
+        until = self._heap[0][0]
+        now = time.time()
+        if until <= now and self._active >= self.concurrency:
+            return  # таймер заведет освободившееся снятие
+        if self._timer is not None:
+            if self._timer_at <= until:
+                return
+            self._timer.cancel()
+        self._timer_at = until
+        self._timer = asyncio.get_running_loop().call_later(max(0, until - now), self._fire)
+
+    def _fire(self):
+        self._timer = None
+        now = time.time()
+        while self._active < self.concurrency:
+            self._drop_stale()
+            if not self._heap or self._heap[0][0] > now:
+                break
+            _, chat_id, user_id, kind = heapq.heappop(self._heap)
+            forever = (chat_id, user_id, kind) in self.forever
+            self.cancel(chat_id, user_id, kind)
+            self._active += 1
+            asyncio.create_task(self._lift(chat_id, user_id, kind, forever))
+        self._arm()
+
+    async def _lift(self, chat_id, user_id, kind, forever):
+        try:
+            await self._expire(self._bot, chat_id, user_id, kind, forever)
+        except BadRequest as e:
+            logger.warning(f"Не удалось снять {kind} с {user_id} в чате {chat_id}: {e}")
+        except Exception as e:
+            logger.warning(
+                f"Ошибка снятия {kind} с {user_id} в чате {chat_id}, повтор через {self.retry_delay} сек: {e}"
             )
+            if self.get(chat_id, user_id, kind) is None:
+                self.schedule(chat_id, user_id, kind, time.time() + self.retry_delay, forever)
+        finally:
+            self._active -= 1
+            self._arm()
+
+    def _record(self, record):
+        self.store.stage(record)
+        self._schedule_flush()
+
+    def _schedule_flush(self):
+        if self._flush_task is not None and not self._flush_task.done():
+            return
+
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.save()
+            return
+
+        self._flush_task = loop.create_task(self._delayed_flush())
+
+    async def _delayed_flush(self):
+        await asyncio.sleep(self.flush_interval)
+        await self.flush()
+
+    async def flush(self):
+        """Сохраняет накопленные изменения, не блокируя event loop"""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+
+        async with self._flush_lock:
+            if not self.store.has_pending():
+                return
+
+            batch = self.store.prepare_flush(self.entries, self.forever)
+            try:
+                await asyncio.to_thread(self.store.write_batch, batch)
+            except Exception as e:
+                logger.error(f"Ошибка сохранения наказаний: {e}")
+                self.store.restore_batch(batch)
+
+    def save(self):
+        """Сохраняет наказания немедленно (синхронно) со сжатием журнала"""
+        batch = self.store.prepare_flush(self.entries, self.forever, compact=True)
+        try:
+            self.store.write_batch(batch)
         except Exception as e:
-            await MessageSender.send_safe_message(context, update.effective_chat.id, f"❌ Ошибка: {e}")
+            logger.error(f"Ошибка сохранения наказаний: {e}")
+            self.store.restore_batch(batch)
+
+    def close(self):
+        if self.store.has_pending():
+            self.save()
 
 
 class ModerationCommands:
     """Класс для команд модерации"""
 
-    def __init__(self, permission_manager, time_manager):
+    # Права, которые возвращает размут
+    UNMUTED_PERMISSIONS = ChatPermissions(
+        can_send_messages=True,
+        can_send_other_messages=True,
+        can_add_web_page_previews=True
+    )
+
+    MAX_LIST_LINES = 50
+
+    def __init__(self, permission_manager, time_manager, profile_cache, reply_tracker, pipeline, punishments):
         self.permission_manager = permission_manager
         self.time_manager = time_manager
+        self.profile_cache = profile_cache
+        self.reply_tracker = reply_tracker
+        self.pipeline = pipeline
+        self.punishments = punishments
+
+    @staticmethod
+    async def _send(context, chat_id, text, priority=MessageSender.PRIORITY_NORMAL):
+        """Ответы модерации можно объединять при наплыве команд"""
+        await MessageSender.send_safe_message(
+            context, chat_id, text, priority=priority, coalesce=True
+        )
+
+    @staticmethod
+    def _is_duration(arg):
+        # Срок после ID пишется только с единицей (30m, 1h): число без нее - это ID
+        return not arg.removeprefix('-').isdigit()
+
+    def _parse_targets(self, args, default_duration=None):
+        """Разбирает /cmd id1 id2 ... [время] в список ID и строку времени"""
+        targets = []
+        duration_str = default_duration
+        for i, arg in enumerate(args):
+            if default_duration is not None and i > 0 and i == len(args) - 1 and self._is_duration(arg):
+                duration_str = arg
+                break
+            user_id = int(arg)
+            if user_id not in targets:
+                targets.append(user_id)
+        return targets, duration_str
+
+    async def _check_target(self, context, chat_id, user_id, self_error, admin_error):
+        if user_id == context.bot.id:
+            raise ModerationError(self_error)
+        if await self.permission_manager.is_admin(chat_id, user_id):
+            raise ModerationError(admin_error)
+        # Администраторов чата Telegram все равно не даст ограничить - отвечаем из кэша без запроса
+        if await self.permission_manager.is_chat_admin(context.bot, chat_id, user_id):
+            raise ModerationError(Templates.CHAT_ADMIN_PROTECTED)
+
+    async def _mute_user(self, context, chat_id, user_id, duration):
+        await self._check_target(
+            context, chat_id, user_id,
+            Templates.MUTE_SELF, Templates.MUTE_BOT_ADMIN
+        )
+        until_date = datetime.now(timezone.utc) + timedelta(seconds=duration)
+        await context.bot.restrict_chat_member(
+            chat_id=chat_id,
+            user_id=user_id,
+            permissions=ChatPermissions(can_send_messages=False),
+            until_date=until_date
+        )
+        self.punishments.schedule(chat_id, user_id, 'mute', until_date.timestamp())
+        return until_date
+
+    async def _ban_user(self, context, chat_id, user_id, duration=None):
+        await self._check_target(
+            context, chat_id, user_id,
+            Templates.BAN_SELF, Templates.BAN_BOT_ADMIN
+        )
+        until_date = None
+        if duration:
+            until_date = datetime.now(timezone.utc) + timedelta(seconds=duration)
+        await context.bot.ban_chat_member(
+            chat_id=chat_id,
+            user_id=user_id,
+            until_date=until_date
+        )
+        if until_date:
+            self.punishments.schedule(chat_id, user_id, 'ban', until_date.timestamp())
+        else:
+            self.punishments.cancel(chat_id, user_id, 'ban')
+        return until_date
+
+    async def _kick_user(self, context, chat_id, user_id):
+        await self._check_target(
+            context, chat_id, user_id,
+            Templates.KICK_SELF, Templates.KICK_BOT_ADMIN
+        )
+        # Выполняем кик (бан на 30 секунд + разбан)
+        until_date = datetime.now(timezone.utc) + timedelta(seconds=30)
+        await context.bot.ban_chat_member(
+            chat_id=chat_id,
+            user_id=user_id,
+            until_date=until_date
+        )
+
+        # Сразу разбаниваем, чтобы пользователь мог вернуться по приглашению
+        await context.bot.unban_chat_member(
+            chat_id=chat_id,
+            user_id=user_id
+        )
+        # Кик снимает и мут, и бан - снимать по сроку больше нечего
+        for kind in PunishmentScheduler.KINDS:
+            self.punishments.cancel(chat_id, user_id, kind)
+
+    async def auto_mute(self, context, chat_id, user_id, duration, reason):
+        """Мут по решению самого бота (антифлуд); администраторов не трогает"""
+        try:
+            until_date = await self._mute_user(context, chat_id, user_id, duration)
+        except ModerationError:
+            return
+        except Exception as e:
+            logger.warning(f"Не удалось замутить {user_id} в чате {chat_id} ({reason}): {e}")
+            return
+
+        user_name = await self.profile_cache.get_name(context.bot, user_id)
+        await self._send(
+            context, chat_id,
+            Templates.AUTO_MUTED.format(
+                user_name=user_name, duration=self.time_manager.format_duration(duration), reason=reason,
+                until=until_date.strftime('%d.%m.%Y %H:%M:%S'), user_id=user_id
+            ),
+            priority=MessageSender.PRIORITY_HIGH
+        )
+
+    @classmethod
+    async def lift_punishment(cls, bot, chat_id, user_id, kind, forever):
+        """Снимает истекшее наказание.
+
+        Обычный срок Telegram снимает сам - остается только забыть запись.
+        Срок, который Telegram посчитал вечным, снимаем, только если вечное
+        ограничение все еще на месте: иначе его уже сменили вручную.
+        """
+        if not forever:
+            return
+
+        member = await bot.get_chat_member(chat_id=chat_id, user_id=user_id)
+        status = ChatMember.RESTRICTED if kind == 'mute' else ChatMember.BANNED
+        until_date = getattr(member, 'until_date', None)
+        if member.status != status or (until_date is not None and until_date.timestamp() > 0):
+            logger.info(f"{kind} пользователя {user_id} в чате {chat_id} изменен вручную, не снимаем")
+            return
+
+        if kind == 'mute':
+            await bot.restrict_chat_member(
+                chat_id=chat_id, user_id=user_id, permissions=cls.UNMUTED_PERMISSIONS
+            )
+        else:
+            await bot.unban_chat_member(chat_id=chat_id, user_id=user_id, only_if_banned=True)
+
+    def _parse_duration_or_none(self, duration_str):
+        """Секунды для строки времени; None - навсегда; False - неверный формат"""
+        if duration_str == "forever":
+            return None
+        return self.time_manager.parse_duration(duration_str) or False
 
     async def mute_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Мут пользователя"""
         if not await self.permission_manager.check_admin_access(update, context):
             return
 
-        if not context.args and not update.message.reply_to_message:
-            await MessageSender.send_safe_message(
-                context, update.effective_chat.id,
-                "❌ <b>Использование:</b>\n"
-                "<code>/mute ID</code> - мут на 10 мин\n"
-                "<code>/mute ID 1h</code> - мут на 1 час\n\n"
-                "💡 <i>Или ответьте на сообщение командой /mute</i>"
-            )
+        if not context.args and not context.reply_target:
+            await self._send(context, update.effective_chat.id, Templates.MUTE_USAGE)
             return
 
         try:
             chat_id = update.effective_chat.id
 
-            if update.message.reply_to_message:
-                user_to_mute = update.message.reply_to_message.from_user
-                user_id = user_to_mute.id
+            if context.reply_target:
+                user_to_mute = context.reply_target
+                targets = [user_to_mute.id]
                 duration_str = context.args[0] if context.args else "10m"
             else:
-                user_id = int(context.args[0])
-                duration_str = context.args[1] if len(context.args) > 1 else "10m"
+                targets, duration_str = self._parse_targets(context.args, "10m")
 
             duration = self.time_manager.parse_duration(duration_str)
             if not duration:
-                await MessageSender.send_safe_message(
-                    context, chat_id,
-                    "❌ Неверный формат времени. Используйте: 10m, 1h, 1d, 1w"
-                )
+                await self._send(context, chat_id, Templates.INVALID_DURATION)
                 return
 
-            # Проверки
-            if user_id == context.bot.id:
-                await MessageSender.send_safe_message(context, chat_id, "❌ Не могу замутить самого себя!")
+            if len(targets) > 1:
+                await self.pipeline.run(
+                    context, chat_id,
+                    Templates.MUTE_BULK.format(duration=self.time_manager.format_duration(duration)),
+                    targets, lambda user_id: self._mute_user(context, chat_id, user_id, duration)
+                )
                 return
 
-            if await self.permission_manager.is_admin(chat_id, user_id):
-                await MessageSender.send_safe_message(context, chat_id, "❌ Нельзя замутить администратора бота!")
+            user_id = targets[0]
+            try:
+                until_date = await self._mute_user(context, chat_id, user_id, duration)
+            except ModerationError as e:
+                await self._send(context, chat_id, str(e))
                 return
 
-            # Выполняем мут
-            until_date = datetime.now(timezone.utc) + timedelta(seconds=duration)
-            await context.bot.restrict_chat_member(
-                chat_id=chat_id,
-                user_id=user_id,
-                permissions=ChatPermissions(can_send_messages=False),
-                until_date=until_date
-            )
-
             # Получаем имя пользователя
-            try:
-                user = await context.bot.get_chat(user_id)
-                user_name = user.full_name
-            except:
-                user_name = f"Пользователь ({user_id})"
+            user_name = await self.profile_cache.get_name(context.bot, user_id)
 
-            await MessageSender.send_safe_message(
+            await self._send(
                 context, chat_id,
-                f"🔇 <b>{user_name} замьючен на {self.time_manager.format_duration(duration)}</b>\n\n"
-                f"⏰ До: {until_date.strftime('%d.%m.%Y %H:%M:%S')}\n"
-                f"🆔 ID: <code>{user_id}</code>"
+                Templates.MUTED.format(
+                    user_name=user_name, duration=self.time_manager.format_duration(duration),
+                    until=until_date.strftime('%d.%m.%Y %H:%M:%S'), user_id=user_id
+                ),
+                priority=MessageSender.PRIORITY_HIGH
             )
 
         except Exception as e:
-            await MessageSender.send_safe_message(context, update.effective_chat.id, f"❌ Ошибка мута: {e}")
+            await self._send(context, update.effective_chat.id, Templates.MUTE_ERROR.format(error=e))
 
     async def unmute_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Размут пользователя"""
         if not await self.permission_manager.check_admin_access(update, context):
             return
 
-        if not context.args and not update.message.reply_to_message:
-            await MessageSender.send_safe_message(
-                context, update.effective_chat.id,
-                "❌ <b>Использование:</b>\n"
-                "<code>/unmute ID</code> - размутить по ID\n\n"
-                "💡 <i>Или ответьте на сообщение командой /unmute</i>"
-            )
+        if not context.args and not context.reply_target:
+            await self._send(context, update.effective_chat.id, Templates.UNMUTE_USAGE)
             return
 
         try:
             chat_id = update.effective_chat.id
 
-            if update.message.reply_to_message:
-                user_id = update.message.reply_to_message.from_user.id
+            if context.reply_target:
+                user_id = context.reply_target.id
             else:
                 user_id = int(context.args[0])
 
@@ -854,126 +3319,134 @@ class ModerationCommands:
             await context.bot.restrict_chat_member(
                 chat_id=chat_id,
                 user_id=user_id,
-                permissions=ChatPermissions(
-                    can_send_messages=True,
-                    can_send_other_messages=True,
-                    can_add_web_page_previews=True
-                )
+                permissions=self.UNMUTED_PERMISSIONS
             )
+            self.punishments.cancel(chat_id, user_id, 'mute')
 
             # Получаем имя пользователя
-            try:
-                user = await context.bot.get_chat(user_id)
-                user_name = user.full_name
-            except:
-                user_name = f"Пользователь ({user_id})"
+            user_name = await self.profile_cache.get_name(context.bot, user_id)
 
-            await MessageSender.send_safe_message(
-                context, chat_id,
-                f"🔊 <b>{user_name} размьючен</b>\n\n"
-                f"🆔 ID: <code>{user_id}</code>"
+            await self._send(
+                context, chat_id, Templates.UNMUTED.format(user_name=user_name, user_id=user_id),
+                priority=MessageSender.PRIORITY_HIGH
             )
 
         except Exception as e:
-            await MessageSender.send_safe_message(context, update.effective_chat.id, f"❌ Ошибка размута: {e}")
+            await self._send(context, update.effective_chat.id, Templates.UNMUTE_ERROR.format(error=e))
 
     async def ban_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Бан пользователя"""
         if not await self.permission_manager.check_admin_access(update, context):
             return
 
-        if not context.args and not update.message.reply_to_message:
-            await MessageSender.send_safe_message(
-                context, update.effective_chat.id,
-                "❌ <b>Использование:</b>\n"
-                "<code>/ban ID</code> - бан навсегда\n"
-                "<code>/ban ID 1h</code> - бан на 1 час\n\n"
-                "💡 <i>Или ответьте на сообщение командой /ban</i>"
-            )
+        if not context.args and not context.reply_target:
+            await self._send(context, update.effective_chat.id, Templates.BAN_USAGE)
             return
 
         try:
             chat_id = update.effective_chat.id
 
-            if update.message.reply_to_message:
-                user_to_ban = update.message.reply_to_message.from_user
-                user_id = user_to_ban.id
+            if context.reply_target:
+                user_to_ban = context.reply_target
+                targets = [user_to_ban.id]
                 duration_str = context.args[0] if context.args else "forever"
             else:
-                user_id = int(context.args[0])
-                duration_str = context.args[1] if len(context.args) > 1 else "forever"
+                targets, duration_str = self._parse_targets(context.args, "forever")
 
             # Парсим время
-            until_date = None
-            if duration_str != "forever":
-                duration = self.time_manager.parse_duration(duration_str)
-                if not duration:
-                    await MessageSender.send_safe_message(
-                        context, chat_id,
-                        "❌ Неверный формат времени. Используйте: 10m, 1h, 1d, 1w"
-                    )
-                    return
-                until_date = datetime.now(timezone.utc) + timedelta(seconds=duration)
-
-            # Проверки
-            if user_id == context.bot.id:
-                await MessageSender.send_safe_message(context, chat_id, "❌ Не могу забанить самого себя!")
+            duration = self._parse_duration_or_none(duration_str)
+            if duration is False:
+                await self._send(context, chat_id, Templates.INVALID_DURATION)
                 return
 
-            if await self.permission_manager.is_admin(chat_id, user_id):
-                await MessageSender.send_safe_message(context, chat_id, "❌ Нельзя забанить администратора бота!")
+            if duration:
+                duration_text = Templates.DURATION_FOR.format(duration=self.time_manager.format_duration(duration))
+            else:
+                duration_text = Templates.DURATION_FOREVER
+
+            if len(targets) > 1:
+                await self.pipeline.run(
+                    context, chat_id, Templates.BAN_BULK.format(duration_text=duration_text),
+                    targets, lambda user_id: self._ban_user(context, chat_id, user_id, duration)
+                )
                 return
 
-            # Выполняем бан
-            await context.bot.ban_chat_member(
-                chat_id=chat_id,
-                user_id=user_id,
-                until_date=until_date
-            )
+            user_id = targets[0]
+            try:
+                until_date = await self._ban_user(context, chat_id, user_id, duration)
+            except ModerationError as e:
+                await self._send(context, chat_id, str(e))
+                return
 
             # Получаем имя пользователя
-            try:
-                user = await context.bot.get_chat(user_id)
-                user_name = user.full_name
-            except:
-                user_name = f"Пользователь ({user_id})"
+            user_name = await self.profile_cache.get_name(context.bot, user_id)
 
             if until_date:
-                duration_text = f"на {self.time_manager.format_duration(duration)}"
-                until_text = f"⏰ До: {until_date.strftime('%d.%m.%Y %H:%M:%S')}"
+                until_text = Templates.BAN_UNTIL.format(until=until_date.strftime('%d.%m.%Y %H:%M:%S'))
             else:
-                duration_text = "навсегда"
-                until_text = "⏰ Навсегда"
+                until_text = Templates.BAN_FOREVER
 
-            await MessageSender.send_safe_message(
+            await self._send(
                 context, chat_id,
-                f"🚫 <b>{user_name} забанен {duration_text}</b>\n\n"
-                f"{until_text}\n"
-                f"🆔 ID: <code>{user_id}</code>"
+                Templates.BANNED.format(
+                    user_name=user_name, duration_text=duration_text, until_text=until_text, user_id=user_id
+                ),
+                priority=MessageSender.PRIORITY_HIGH
+            )
+
+        except Exception as e:
+            await self._send(context, update.effective_chat.id, Templates.BAN_ERROR.format(error=e))
+
+    async def ban_repliers_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Бан всех, кто ответил на сообщение"""
+        if not await self.permission_manager.check_admin_access(update, context):
+            return
+
+        chat_id = update.effective_chat.id
+        target_message = update.message.reply_to_message
+        if not target_message:
+            await self._send(context, chat_id, Templates.BAN_REPLIERS_USAGE)
+            return
+
+        try:
+            duration = self._parse_duration_or_none(context.args[0] if context.args else "forever")
+            if duration is False:
+                await self._send(context, chat_id, Templates.INVALID_DURATION)
+                return
+
+            repliers = self.reply_tracker.get_repliers(chat_id, target_message.message_id)
+            repliers.discard(update.effective_user.id)
+            if not repliers:
+                await self._send(context, chat_id, Templates.NO_REPLIERS)
+                return
+
+            if duration:
+                duration_text = Templates.DURATION_FOR.format(duration=self.time_manager.format_duration(duration))
+            else:
+                duration_text = Templates.DURATION_FOREVER
+
+            await self.pipeline.run(
+                context, chat_id, Templates.BAN_REPLIERS.format(duration_text=duration_text),
+                sorted(repliers), lambda user_id: self._ban_user(context, chat_id, user_id, duration)
             )
 
         except Exception as e:
-            await MessageSender.send_safe_message(context, update.effective_chat.id, f"❌ Ошибка бана: {e}")
+            await self._send(context, chat_id, Templates.BAN_ERROR.format(error=e))
 
     async def unban_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Разбан пользователя"""
         if not await self.permission_manager.check_admin_access(update, context):
             return
 
-        if not context.args and not update.message.reply_to_message:
-            await MessageSender.send_safe_message(
-                context, update.effective_chat.id,
-                "❌ <b>Использование:</b>\n"
-                "<code>/unban ID</code> - разбанить по ID\n\n"
-                "💡 <i>Или ответьте на сообщение командой /unban</i>"
-            )
+        if not context.args and not context.reply_target:
+            await self._send(context, update.effective_chat.id, Templates.UNBAN_USAGE)
             return
 
         try:
             chat_id = update.effective_chat.id
 
-            if update.message.reply_to_message:
-                user_id = update.message.reply_to_message.from_user.id
+            if context.reply_target:
+                user_id = context.reply_target.id
             else:
                 user_id = int(context.args[0])
 
@@ -982,148 +3455,1282 @@ class ModerationCommands:
                 chat_id=chat_id,
                 user_id=user_id
             )
+            self.punishments.cancel(chat_id, user_id, 'ban')
 
             # Получаем имя пользователя
-            try:
-                user = await context.bot.get_chat(user_id)
-                user_name = user.full_name
-            except:
-                user_name = f"Пользователь ({user_id})"
+            user_name = await self.profile_cache.get_name(context.bot, user_id)
 
-            await MessageSender.send_safe_message(
-                context, chat_id,
-                f"✅ <b>{user_name} разбанен</b>\n\n"
-                f"🆔 ID: <code>{user_id}</code>"
+            await self._send(
+                context, chat_id, Templates.UNBANNED.format(user_name=user_name, user_id=user_id),
+                priority=MessageSender.PRIORITY_HIGH
             )
 
         except Exception as e:
-            await MessageSender.send_safe_message(context, update.effective_chat.id, f"❌ Ошибка разбана: {e}")
+            await self._send(context, update.effective_chat.id, Templates.UNBAN_ERROR.format(error=e))
 
     async def kick_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Кик пользователя"""
         if not await self.permission_manager.check_admin_access(update, context):
             return
 
-        if not context.args and not update.message.reply_to_message:
-            await MessageSender.send_safe_message(
-                context, update.effective_chat.id,
-                "❌ <b>Использование:</b>\n"
-                "<code>/kick ID</code> - кикнуть по ID\n\n"
-                "💡 <i>Или ответьте на сообщение командой /kick</i>"
-            )
+        if not context.args and not context.reply_target:
+            await self._send(context, update.effective_chat.id, Templates.KICK_USAGE)
             return
 
         try:
             chat_id = update.effective_chat.id
 
-            if update.message.reply_to_message:
-                user_id = update.message.reply_to_message.from_user.id
+            if context.reply_target:
+                targets = [context.reply_target.id]
             else:
-                user_id = int(context.args[0])
+                targets, _ = self._parse_targets(context.args)
 
-            # Проверки
-            if user_id == context.bot.id:
-                await MessageSender.send_safe_message(context, chat_id, "❌ Не могу кикнуть самого себя!")
+            if len(targets) > 1:
+                await self.pipeline.run(
+                    context, chat_id, Templates.KICK_BULK,
+                    targets, lambda user_id: self._kick_user(context, chat_id, user_id)
+                )
                 return
 
-            if await self.permission_manager.is_admin(chat_id, user_id):
-                await MessageSender.send_safe_message(context, chat_id, "❌ Нельзя кикнуть администратора бота!")
+            user_id = targets[0]
+            try:
+                await self._kick_user(context, chat_id, user_id)
+            except ModerationError as e:
+                await self._send(context, chat_id, str(e))
                 return
 
-            # Выполняем кик (бан на 30 секунд + разбан)
-            until_date = datetime.now(timezone.utc) + timedelta(seconds=30)
-            await context.bot.ban_chat_member(
-                chat_id=chat_id,
-                user_id=user_id,
-                until_date=until_date
-            )
-
-            # Сразу разбаниваем, чтобы пользователь мог вернуться по приглашению
-            await context.bot.unban_chat_member(
-                chat_id=chat_id,
-                user_id=user_id
-            )
-
             # Получаем имя пользователя
-            try:
-                user = await context.bot.get_chat(user_id)
-                user_name = user.full_name
-            except:
-                user_name = f"Пользователь ({user_id})"
+            user_name = await self.profile_cache.get_name(context.bot, user_id)
 
-            await MessageSender.send_safe_message(
-                context, chat_id,
-                f"👢 <b>{user_name} кикнут из чата</b>\n\n"
-                f"🆔 ID: <code>{user_id}</code>\n"
-                f"💡 <i>Пользователь может вернуться по приглашению</i>"
+            await self._send(
+                context, chat_id, Templates.KICKED.format(user_name=user_name, user_id=user_id),
+                priority=MessageSender.PRIORITY_HIGH
             )
 
         except Exception as e:
-            await MessageSender.send_safe_message(context, update.effective_chat.id, f"❌ Ошибка кика: {e}")
+            await self._send(context, update.effective_chat.id, Templates.KICK_ERROR.format(error=e))
 
+    async def punishments_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Показывает активные временные муты и баны чата"""
+        if not await self.permission_manager.check_admin_access(update, context):
+            return
 
-class AdvancedAdminBot:
+        chat_id = update.effective_chat.id
+        entries = self.punishments.list_chat(chat_id)
+        if not entries:
+            await self._send(context, chat_id, Templates.PUNISHMENTS_EMPTY)
+            return
+
+        now = int(time.time())
+        lines = []
+        for until, user_id, kind in entries[:self.MAX_LIST_LINES]:
+            icon = "🔇" if kind == 'mute' else "🚫"
+            lines.append(Templates.PUNISHMENTS_ITEM.format(
+                icon=icon, user_id=user_id, until=TimeManager.format_timestamp(until),
+                left=self.time_manager.format_duration(max(0, until - now))
+            ))
+        if len(entries) > self.MAX_LIST_LINES:
+            lines.append(Templates.LIST_MORE.format(count=len(entries) - self.MAX_LIST_LINES))
+
+        await self._send(
+            context, chat_id,
+            Templates.PUNISHMENTS.format(punishment_list="\n".join(lines), count=len(entries))
+        )
+
+    async def extend_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Продлевает временный мут и/или бан пользователя"""
+        if not await self.permission_manager.check_admin_access(update, context):
+            return
+
+        chat_id = update.effective_chat.id
+        if context.reply_target:
+            user_id = context.reply_target.id
+            duration_str = context.args[0] if context.args else None
+        elif len(context.args) >= 2:
+            user_id = None
+            duration_str = context.args[1]
+        else:
+            duration_str = None
+
+        if duration_str is None:
+            await self._send(context, chat_id, Templates.EXTEND_USAGE)
+            return
+
+        try:
+            if user_id is None:
+                user_id = int(context.args[0])
+
+            duration = self.time_manager.parse_duration(duration_str)
+            if not duration:
+                await self._send(context, chat_id, Templates.INVALID_DURATION)
+                return
+
+            extended = []
+            for kind in PunishmentScheduler.KINDS:
+                until = self.punishments.get(chat_id, user_id, kind)
+                if until is None:
+                    continue
+
+                until = max(until, int(time.time())) + duration
+                until_date = datetime.fromtimestamp(until, timezone.utc)
+                if kind == 'mute':
+                    await context.bot.restrict_chat_member(
+                        chat_id=chat_id,
+                        user_id=user_id,
+                        permissions=ChatPermissions(can_send_messages=False),
+                        until_date=until_date
+                    )
+                    extended.append(Templates.EXTEND_MUTE.format(until=TimeManager.format_timestamp(until)))
+                else:
+                    await context.bot.ban_chat_member(
+                        chat_id=chat_id,
+                        user_id=user_id,
+                        until_date=until_date
+                    )
+                    extended.append(Templates.EXTEND_BAN.format(until=TimeManager.format_timestamp(until)))
+                self.punishments.schedule(chat_id, user_id, kind, until)
+
+            if not extended:
+                await self._send(context, chat_id, Templates.NOTHING_TO_EXTEND.format(user_id=user_id))
+                return
+
+            user_name = await self.profile_cache.get_name(context.bot, user_id)
+
+            await self._send(
+                context, chat_id,
+                Templates.EXTENDED.format(
+                    user_name=user_name, duration=self.time_manager.format_duration(duration),
+                    extended="\n".join(extended), user_id=user_id
+                ),
+                priority=MessageSender.PRIORITY_HIGH
+            )
+
+        except ValueError:
+            await self._send(context, chat_id, Templates.INVALID_ID)
+        except Exception as e:
+            await self._send(context, chat_id, Templates.EXTEND_ERROR.format(error=e))
+
+
+class FloodLimiter:
+    """Скользящее окно сообщений для пар (чат, пользователь).
+
+    Времена последних max_messages сообщений пары лежат в кольцевом буфере -
+    ее участке общего массива, выделенного один раз при создании. Сообщение
+    считается флудом, если самое старое из запомненных пришло меньше окна
+    назад: проверка за O(1) без новых объектов, кроме ключа словаря. Пар не
+    больше capacity; новой паре отдается участок той, что писала давнее всех,
+    так что первыми вытесняются простаивающие.
+    """
+
+    def __init__(self, max_messages, window, capacity):
+        self.max_messages = max_messages
+        self.window = window
+        self.capacity = capacity
+        self.times = array('d', bytes(8 * capacity * max_messages))
+        self.heads = array('H', bytes(2 * capacity))   # позиция следующей записи в кольце
+        self.counts = array('H', bytes(2 * capacity))  # заполнено позиций кольца
+        # (chat_id, user_id) -> номер участка, от давно писавших к недавним
+        self.slots = OrderedDict()
+
+    def hit(self, chat_id, user_id, now):
+        """Учитывает сообщение; True, если пара превысила лимит"""
+        key = (chat_id, user_id)
+        slot = self.slots.get(key)
+        if slot is None:
+            if len(self.slots) < self.capacity:
+                slot = len(self.slots)
+            else:
+                _, slot = self.slots.popitem(last=False)
+            self.slots[key] = slot
+            self.heads[slot] = 0
+            self.counts[slot] = 0
+        else:
+            self.slots.move_to_end(key)
+
+        head = self.heads[slot]
+        index = slot * self.max_messages + head
+        flooding = False
+        if self.counts[slot] < self.max_messages:
+            self.counts[slot] += 1
+        else:
+            flooding = now - self.times[index] < self.window
+        self.times[index] = now
+        head += 1
+        self.heads[slot] = head if head < self.max_messages else 0
+        return flooding
+
+    def reset(self, chat_id, user_id):
+        """Забывает сообщения пары (после наказания счет начинается заново)"""
+        slot = self.slots.get((chat_id, user_id))
+        if slot is not None:
+            self.counts[slot] = 0
+
+
+class AntiFlood:
+    """Автоматический мут за флуд: проверка каждого сообщения в группах"""
+
+    def __init__(self, moderation_commands, max_messages=FLOOD_MAX_MESSAGES, window=FLOOD_WINDOW,
+                 mute_duration=FLOOD_MUTE_DURATION, capacity=FLOOD_MAX_TRACKED):
+        self.moderation = moderation_commands
+        self.mute_duration = TimeManager.parse_duration(mute_duration)
+        if not self.mute_duration:
+            raise ValueError(f"Неверный срок мута за флуд: {mute_duration}")
+        self.limiter = FloodLimiter(max_messages, window, capacity) if max_messages > 0 else None
+        self._muting = set()  # пары, мут которых уже отправлен
+
+    async def observe_update(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        message = update.message
+        # Отрицательный ID - группа; сообщения ботов и каналов не считаем
+        if self.limiter is None or message is None or message.chat_id >= 0:
+            return
+        user = message.from_user
+        if user is None or user.is_bot:
+            return
+        if not self.limiter.hit(message.chat_id, user.id, time.monotonic()):
+            return
+
+        key = (message.chat_id, user.id)
+        if key in self._muting:
+            return
+        self._muting.add(key)
+        self.limiter.reset(*key)
+        # Мут не задерживает обработку следующих сообщений чата
+        context.application.create_task(self._mute(context, *key), update=update)
+
+    async def _mute(self, context, chat_id, user_id):
+        try:
+            await self.moderation.auto_mute(context, chat_id, user_id, self.mute_duration, "флуд")
+        finally:
+            self._muting.discard((chat_id, user_id))
+
+
+class AttendancePoll:
+    """Текущий опрос посещаемости чата с готовыми счетчиками по вариантам"""
+
+    __slots__ = (
+        'chat_id', 'poll_id', 'message_id', 'votes', 'extra', 'counts', 'version', 'rendered_at', 'render_task'
+    )
+
+    # Ключи записи чата, которыми управляет опрос; остальные хранятся как есть
+    FIELDS = ('last_poll_message_id', 'current_poll_id', 'votes')
+
+    def __init__(self, chat_id, poll_id=None, message_id=None, votes=None, extra=None):
+        self.chat_id = chat_id
+        self.poll_id = poll_id
+        self.message_id = message_id
+        # Чужие поля записи чата (например, admin_users старых версий бота)
+        self.extra = extra if extra is not None else {}
+        # user_id -> {'option', 'name', 'timestamp', 'username'}
+        self.votes = votes if votes is not None else {}
+        self.counts = defaultdict(int)
+        for vote in self.votes.values():
+            self.counts[vote['option']] += 1
+        self.version = 0  # растет с каждым изменившимся голосом
+        self.rendered_at = 0.0
+        self.render_task = None
+
+    def vote(self, user_id, option, name, username):
+        """Учитывает голос за O(1); возвращает False, если он не изменился"""
+        previous = self.votes.get(user_id)
+        if previous is not None:
+            if previous['option'] == option:
+                return False
+            self.counts[previous['option']] -= 1
+        self.counts[option] += 1
+        self.version += 1
+        self.votes[user_id] = {
+            'option': option,
+            'name': name,
+            'timestamp': datetime.now().isoformat(),
+            'username': username
+        }
+        return True
+
+    def archive_record(self, closed_at):
+        """Запись закрытого опроса для архива"""
+        return {
+            'chat': self.chat_id,
+            'poll_id': self.poll_id,
+            'message_id': self.message_id,
+            'closed_at': closed_at,
+            'votes': {str(user_id): vote for user_id, vote in self.votes.items()}
+        }
+
+    def to_dict(self):
+        return {
+            **self.extra,
+            'last_poll_message_id': self.message_id,
+            'current_poll_id': self.poll_id,
+            # Записи голосов не меняются на месте, достаточно копии словаря
+            'votes': {str(user_id): vote for user_id, vote in self.votes.items()}
+        }
+
+    @classmethod
+    def from_dict(cls, chat_id, data):
+        votes = {int(user_id): vote for user_id, vote in (data.get('votes') or {}).items()}
+        extra = {key: value for key, value in data.items() if key not in cls.FIELDS}
+        return cls(chat_id, data.get('current_poll_id'), data.get('last_poll_message_id'), votes, extra)
+
+
+class AttendanceManager:
+    """Опросы посещаемости по чатам и их отложенное сохранение в attendance_data.json.
+
+    Закрытые опросы дописываются строками JSON в архив (attendance_archive.jsonl).
+    """
+
+    def __init__(self, filename=ATTENDANCE_FILE, archive_filename=ATTENDANCE_ARCHIVE_FILE,
+                 flush_interval=SAVE_INTERVAL, history=None, import_filename=None, chat_filter=None):
+        self.filename = filename
+        self.archive_filename = archive_filename
+        self.flush_interval = flush_interval
+        # Общий файл, из которого шард при первом запуске берет свои опросы
+        self.import_filename = import_filename
+        self.chat_filter = chat_filter
+        # Колоночная история закрытых опросов (обновляется после архивации)
+        self.history = history
+        self.polls = {}
+        self._dirty = False
+        self._flush_task = None
+        self._flush_lock = None
+
+    def load(self):
+        """Загружает опросы из файла"""
+        try:
+            filename = self.filename
+            if not os.path.exists(filename):
+                if not self.import_filename or not os.path.exists(self.import_filename):
+                    return
+                filename = self.import_filename
+            with open(filename, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+
+            for chat_id, record in data.get('chat_data', {}).items():
+                if filename == self.import_filename and not self.chat_filter(int(chat_id)):
+                    continue
+                self.polls[int(chat_id)] = AttendancePoll.from_dict(int(chat_id), record)
+            logger.info(f"Загружено опросов посещаемости: {len(self.polls)}")
+
+        except Exception as e:
+            logger.error(f"Ошибка загрузки опросов: {e}")
+
+    def get_poll(self, chat_id):
+        return self.polls.get(chat_id)
+
+    def configured_chats(self):
+        """Чаты для опроса по расписанию: из ATTENDANCE_CHATS или все, где уже были опросы"""
+        if ATTENDANCE_CHATS:
+            chat_ids = [int(chat_id) for chat_id in ATTENDANCE_CHATS.split(',') if chat_id.strip()]
+            # Шард публикует опрос только в своих чатах
+            if self.chat_filter is not None:
+                chat_ids = [chat_id for chat_id in chat_ids if self.chat_filter(chat_id)]
+            return chat_ids
+        return list(self.polls)
+
+    async def start_polls(self, chat_ids, poll_id):
+        """Архивирует текущие опросы чатов и заводит новые. Возвращает новые опросы.
+
+        Все или ничего: если архив не записался, прежние опросы остаются на месте.
+        Сохранение файла опросов ждет записи архива, чтобы пустые опросы не
+        попали на диск раньше, чем старые голоса - в архив.
+        """
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+
+        async with self._flush_lock:
+            closed_at = datetime.now().isoformat()
+            previous = {}
+            records = []
+            polls = []
+            for chat_id in chat_ids:
+                old = self.polls.get(chat_id)
+                previous[chat_id] = old
+                if old is not None and old.poll_id is not None:
+                    records.append(old.archive_record(closed_at))
+                # С этого момента кнопки старого опроса отвечают "опрос закрыт"
+                poll = self.polls[chat_id] = AttendancePoll(
+                    chat_id, poll_id, extra=old.extra if old is not None else None
+                )
+                polls.append(poll)
+
+            if records:
+                try:
+                    await asyncio.to_thread(append_journal, self.archive_filename, records)
+                except Exception as e:
+                    logger.error(f"Ошибка архивации опросов: {e}")
+                    for chat_id, old in previous.items():
+                        if old is None:
+                            del self.polls[chat_id]
+                        else:
+                            self.polls[chat_id] = old
+                    return []
+
+            for old in previous.values():
+                if old is not None and old.render_task is not None:
+                    old.render_task.cancel()
+
+        self.mark_dirty()
+        if records and self.history is not None:
+            asyncio.create_task(self.history.sync())
+        return polls
+
+    def set_message(self, poll, message_id):
+        poll.message_id = message_id
+        self.mark_dirty()
+
+    def vote(self, chat_id, poll_id, user, option):
+        """Учитывает голос. Возвращает опрос или None, если опрос уже закрыт"""
+        poll = self.polls.get(chat_id)
+        if poll is None or poll.poll_id != poll_id:
+            return None
+        if poll.vote(user.id, option, user.full_name, user.username):
+            self.mark_dirty()
+        return poll
+
+    def mark_dirty(self):
+        self._dirty = True
+        if self._flush_task is not None and not self._flush_task.done():
+            return
+
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.save()
+            return
+
+        self._flush_task = loop.create_task(self._delayed_flush())
+
+    async def _delayed_flush(self):
+        await asyncio.sleep(self.flush_interval)
+        await self.flush()
+
+    def _snapshot(self):
+        self._dirty = False
+        return {
+            'chat_data': {str(chat_id): poll.to_dict() for chat_id, poll in self.polls.items()},
+            'last_updated': datetime.now().isoformat()
+        }
+
+    def _write(self, snapshot):
+        atomic_write(self.filename, lambda f: json.dump(snapshot, f, ensure_ascii=False, indent=2))
+
+    async def flush(self):
+        """Сохраняет опросы, не блокируя event loop"""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+
+        async with self._flush_lock:
+            if not self._dirty:
+                return
+            snapshot = self._snapshot()
+            try:
+                await asyncio.to_thread(self._write, snapshot)
+            except Exception as e:
+                logger.error(f"Ошибка сохранения опросов: {e}")
+                self._dirty = True
+
+    def save(self):
+        """Сохраняет опросы немедленно (синхронно)"""
+        if not self._dirty:
+            return
+        try:
+            self._write(self._snapshot())
+        except Exception as e:
+            logger.error(f"Ошибка сохранения опросов: {e}")
+            self._dirty = True
+
+
+class AttendanceHistory:
+    """История закрытых опросов в колонках (array), собранная из архива.
+
+    Архив attendance_archive.jsonl остается источником истины, история -
+    его индекс для статистики: каждая колонка лежит в своем файле и только
+    дописывается. meta.json (пишется атомарно) фиксирует число строк и
+    прочитанную часть архива; все, что дописано после, при загрузке
+    отрезается и читается из архива заново.
+    """
+
+    VOTE_COLUMNS = (('chat', 'q'), ('poll', 'q'), ('user', 'q'), ('option', 'b'), ('ts', 'q'))
+    POLL_COLUMNS = (('chat', 'q'), ('poll', 'q'))
+
+    # Код варианта "буду" (первый в Templates.ATTENDANCE_OPTIONS)
+    ATTEND_OPTION = 1
+
+    def __init__(self, directory=ATTENDANCE_HISTORY_DIR, archive_filename=ATTENDANCE_ARCHIVE_FILE):
+        self.directory = directory
+        self.archive_filename = archive_filename
+        self.votes = {name: array(typecode) for name, typecode in self.VOTE_COLUMNS}
+        self.polls = {name: array(typecode) for name, typecode in self.POLL_COLUMNS}
+        self.names = {}
+        self.archive_offset = 0
+        self._seen = set()  # (chat_id, poll_id) уже учтенных опросов
+        self._sync_lock = None
+
+    def _column_filename(self, table, name):
+        return os.path.join(self.directory, f"{table}.{name}.bin")
+
+    @property
+    def _meta_filename(self):
+        return os.path.join(self.directory, 'meta.json')
+
+    def load(self):
+        """Загружает колонки и дочитывает архив (синхронно, при старте)"""
+        os.makedirs(self.directory, exist_ok=True)
+        try:
+            if os.path.exists(self._meta_filename):
+                with open(self._meta_filename, 'r', encoding='utf-8') as f:
+                    meta = json.load(f)
+                self._load_table('votes', self.votes, meta['votes'])
+                self._load_table('polls', self.polls, meta['polls'])
+                self.names = {int(user_id): name for user_id, name in meta.get('names', {}).items()}
+                self.archive_offset = meta['archive_offset']
+        except Exception as e:
+            logger.error(f"Ошибка загрузки истории опросов, перестраиваем из архива: {e}")
+            for columns in (self.votes, self.polls):
+                for name in columns:
+                    columns[name] = array(columns[name].typecode)
+            self.names = {}
+            self.archive_offset = 0
+            self._load_table('votes', self.votes, 0)
+            self._load_table('polls', self.polls, 0)
+
+        self._seen = set(zip(self.polls['chat'], self.polls['poll']))
+        chunk, offset = self._read_archive(self.archive_offset)
+        batch = self._build(self._dedupe(chunk))
+        self._write(batch, offset)
+        self._apply(batch, offset)
+        logger.info(f"История посещаемости: опросов {len(self.polls['poll'])}, голосов {len(self.votes['poll'])}")
+
+    def _load_table(self, table, columns, rows):
+        """Читает колонки таблицы, отрезая незафиксированный хвост файлов"""
+        for name, column in columns.items():
+            filename = self._column_filename(table, name)
+            size = rows * column.itemsize
+            if os.path.exists(filename):
+                with open(filename, 'r+b') as f:
+                    if f.seek(0, os.SEEK_END) > size:
+                        f.truncate(size)
+                    f.seek(0)
+                    column.fromfile(f, rows)
+            elif rows:
+                raise ValueError(f"нет файла колонки {filename}")
+
+    def _read_archive(self, offset):
+        """Разбирает новые строки архива в строки таблиц; возвращает (пакет, новое смещение)"""
+        chunk = []
+        if not os.path.exists(self.archive_filename):
+            return chunk, offset
+
+        with open(self.archive_filename, 'rb') as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break  # запись архива еще не завершена
+                offset += len(line)
+                try:
+                    record = json.loads(line)
+                    poll_id = int(record['poll_id'])
+                    votes = [
+                        (int(user_id), int(vote['option']), TimeManager.to_epoch(vote.get('timestamp')), vote.get('name'))
+                        for user_id, vote in record['votes'].items()
+                    ]
+                except (ValueError, KeyError, TypeError) as e:
+                    logger.warning(f"Пропущена запись архива опросов: {e}")
+                    continue
+                chunk.append((record['chat'], poll_id, votes))
+        return chunk, offset
+
+    def _dedupe(self, chunk):
+        """Отбрасывает опросы, уже учтенные в истории (повтор после сбоя)"""
+        unique = []
+        seen = set()
+        for chat_id, poll_id, votes in chunk:
+            key = (chat_id, poll_id)
+            if key not in self._seen and key not in seen:
+                seen.add(key)
+                unique.append((chat_id, poll_id, votes))
+        return unique
+
+    def _build(self, chunk):
+        """Раскладывает пакет опросов по новым колонкам"""
+        votes = {name: array(typecode) for name, typecode in self.VOTE_COLUMNS}
+        polls = {name: array(typecode) for name, typecode in self.POLL_COLUMNS}
+        names = {}
+        for chat_id, poll_id, poll_votes in chunk:
+            polls['chat'].append(chat_id)
+            polls['poll'].append(poll_id)
+            for user_id, option, ts, name in poll_votes:
+                votes['chat'].append(chat_id)
+                votes['poll'].append(poll_id)
+                votes['user'].append(user_id)
+                votes['option'].append(option)
+                votes['ts'].append(ts)
+                if name:
+                    names[user_id] = name
+        return votes, polls, names
+
+    def _write(self, batch, offset):
+        """Дописывает колонки в файлы и фиксирует их в meta.json"""
+        votes, polls, names = batch
+        for table, columns in (('votes', votes), ('polls', polls)):
+            for name, column in columns.items():
+                with open(self._column_filename(table, name), 'ab') as f:
+                    column.tofile(f)
+                    f.flush()
+                    os.fsync(f.fileno())
+
+        all_names = {**self.names, **names}
+        meta = {
+            'version': 1,
+            'votes': len(self.votes['poll']) + len(votes['poll']),
+            'polls': len(self.polls['poll']) + len(polls['poll']),
+            'archive_offset': offset,
+            'names': {str(user_id): name for user_id, name in all_names.items()}
+        }
+        atomic_write(self._meta_filename, lambda f: json.dump(meta, f, ensure_ascii=False))
+
+    def _apply(self, batch, offset):
+        votes, polls, names = batch
+        for name, column in votes.items():
+            self.votes[name].extend(column)
+        for name, column in polls.items():
+            self.polls[name].extend(column)
+        self._seen.update(zip(polls['chat'], polls['poll']))
+        self.names.update(names)
+        self.archive_offset = offset
+
+    async def sync(self):
+        """Дочитывает архив после закрытия опросов; файлы пишутся в рабочем потоке"""
+        if self._sync_lock is None:
+            self._sync_lock = asyncio.Lock()
+
+        async with self._sync_lock:
+            try:
+                chunk, offset = await asyncio.to_thread(self._read_archive, self.archive_offset)
+                batch = self._build(self._dedupe(chunk))
+                await asyncio.to_thread(self._write, batch, offset)
+            except Exception as e:
+                # Архив цел - история дочитает его при следующей синхронизации
+                logger.error(f"Ошибка обновления истории опросов: {e}")
+                return
+            # Колонки в памяти меняются только в потоке event loop
+            self._apply(batch, offset)
+
+    def chat_stats(self, chat_id, since=0):
+        """Статистика чата по опросам с poll_id >= since.
+
+        Возвращает None, если опросов нет, иначе словарь:
+        polls - [(poll_id, пришли, проголосовали)] по времени,
+        users - [(user_id, пришел, опросов с первого голоса, текущая серия, лучшая серия)].
+        """
+        if np is not None:
+            return self._chat_stats_numpy(chat_id, since)
+        return self._chat_stats_python(chat_id, since)
+
+    def _chat_stats_numpy(self, chat_id, since):
+        poll_chat = np.frombuffer(self.polls['chat'], dtype=np.int64)
+        poll_ids = np.frombuffer(self.polls['poll'], dtype=np.int64)
+        polls = np.sort(poll_ids[(poll_chat == chat_id) & (poll_ids >= since)])
+        total = len(polls)
+        if not total:
+            return None
+
+        vote_poll = np.frombuffer(self.votes['poll'], dtype=np.int64)
+        mask = (np.frombuffer(self.votes['chat'], dtype=np.int64) == chat_id) & (vote_poll >= since)
+        poll_index = np.searchsorted(polls, vote_poll[mask])
+        users_column = np.frombuffer(self.votes['user'], dtype=np.int64)[mask]
+        attend = np.frombuffer(self.votes['option'], dtype=np.int8)[mask] == self.ATTEND_OPTION
+
+        voted = np.bincount(poll_index, minlength=total)
+        came = np.bincount(poll_index[attend], minlength=total)
+
+        users, user_index = np.unique(users_column, return_inverse=True)
+        first = np.full(len(users), total, dtype=np.int64)
+        np.minimum.at(first, user_index, poll_index)
+        attended = np.bincount(user_index[attend], minlength=len(users))
+
+        # Серии: отсортированные пары (пользователь, опрос) с "пришел",
+        # новая серия начинается при смене пользователя или пропуске опроса
+        run_user = user_index[attend]
+        run_poll = poll_index[attend]
+        order = np.lexsort((run_poll, run_user))
+        run_user = run_user[order]
+        run_poll = run_poll[order]
+        current = np.zeros(len(users), dtype=np.int64)
+        best = np.zeros(len(users), dtype=np.int64)
+        if len(run_user):
+            starts = np.ones(len(run_user), dtype=bool)
+            starts[1:] = (run_user[1:] != run_user[:-1]) | (run_poll[1:] != run_poll[:-1] + 1)
+            start_positions = np.flatnonzero(starts)
+            lengths = np.diff(np.append(start_positions, len(run_user)))
+            owners = run_user[start_positions]
+            ends = run_poll[start_positions + lengths - 1]
+            np.maximum.at(best, owners, lengths)
+            latest = ends == total - 1
+            current[owners[latest]] = lengths[latest]
+
+        return {
+            'polls': list(zip(polls.tolist(), came.tolist(), voted.tolist())),
+            'users': list(zip(
+                users.tolist(), attended.tolist(), (total - first).tolist(), current.tolist(), best.tolist()
+            ))
+        }
+
+    def _chat_stats_python(self, chat_id, since):
+        polls = sorted(
+            poll_id for poll_chat, poll_id in zip(self.polls['chat'], self.polls['poll'])
+            if poll_chat == chat_id and poll_id >= since
+        )
+        total = len(polls)
+        if not total:
+            return None
+
+        index = {poll_id: i for i, poll_id in enumerate(polls)}
+        voted = [0] * total
+        came = [0] * total
+        first = {}
+        attended = defaultdict(list)
+        votes = self.votes
+        for vote_chat, poll_id, user_id, option in zip(votes['chat'], votes['poll'], votes['user'], votes['option']):
+            if vote_chat != chat_id or poll_id < since:
+                continue
+            i = index[poll_id]
+            voted[i] += 1
+            if first.get(user_id, total) > i:
+                first[user_id] = i
+            if option == self.ATTEND_OPTION:
+                came[i] += 1
+                attended[user_id].append(i)
+
+        users = []
+        for user_id in sorted(first):
+            polls_attended = sorted(attended.get(user_id, ()))
+            best = run = 0
+            previous = None
+            for i in polls_attended:
+                run = run + 1 if previous is not None and i == previous + 1 else 1
+                best = max(best, run)
+                previous = i
+            current = run if previous == total - 1 else 0
+            users.append((user_id, len(polls_attended), total - first[user_id], current, best))
+
+        return {'polls': list(zip(polls, came, voted)), 'users': users}
+
+
+class AttendanceCommands:
+    """Опрос посещаемости: открытие, голоса и отложенная перерисовка сообщения"""
+
+    OPTION_LABELS = dict(Templates.ATTENDANCE_OPTIONS)
+    MAX_NAMES_PER_OPTION = 30
+    STATS_POLLS = 10
+    STATS_USERS = 30
+
+    def __init__(self, permission_manager, attendance_manager,
+                 render_interval=ATTENDANCE_RENDER_INTERVAL, post_rate=ATTENDANCE_POST_RATE):
+        self.permission_manager = permission_manager
+        self.attendance = attendance_manager
+        self.render_interval = render_interval
+        self.post_rate = post_rate
+
+    @staticmethod
+    @functools.lru_cache(maxsize=1024)
+    def keyboard(poll_id):
+        return InlineKeyboardMarkup([
+            [InlineKeyboardButton(label, callback_data=f"att_vote:{poll_id}:{option}")]
+            for option, label in Templates.ATTENDANCE_OPTIONS
+        ])
+
+    def render(self, poll):
+        """Текст опроса: счетчики готовы, перебираются только имена для показа"""
+        names = defaultdict(list)
+        for vote in poll.votes.values():
+            option_names = names[vote['option']]
+            if len(option_names) < self.MAX_NAMES_PER_OPTION:
+                option_names.append(html.escape(vote.get('name') or ''))
+
+        date = TimeManager.format_timestamp(int(poll.poll_id)) if str(poll.poll_id).isdigit() else poll.poll_id
+        parts = [Templates.ATTENDANCE_HEADER.format(date=date)]
+        total = 0
+        for option, label in Templates.ATTENDANCE_OPTIONS:
+            count = poll.counts[option]
+            total += count
+            parts.append(Templates.ATTENDANCE_OPTION.format(label=label, count=count))
+            if names[option]:
+                parts.append("\n".join(Templates.ATTENDANCE_NAME.format(name=name) for name in names[option]) + "\n")
+            if count > len(names[option]):
+                parts.append(Templates.LIST_MORE.format(count=count - len(names[option])) + "\n")
+        parts.append(Templates.ATTENDANCE_TOTAL.format(total=total))
+        return "".join(parts)
+
+    async def open_polls(self, context, chat_ids):
+        """Закрывает прежние опросы и публикует новые. Возвращает число опубликованных.
+
+        Публикации идут с шагом 1/post_rate сек, поэтому время рассылки
+        предсказуемо (1000 чатов при 20/сек - около 50 сек), а остаток
+        общего лимита Telegram достается ответам на команды.
+        """
+        poll_id = str(int(time.time()))
+        polls = await self.attendance.start_polls(chat_ids, poll_id)
+
+        tasks = []
+        for i, poll in enumerate(polls):
+            if i:
+                await asyncio.sleep(1 / self.post_rate)
+            tasks.append(asyncio.create_task(self._post(context, poll)))
+        return sum(await asyncio.gather(*tasks))
+
+    async def _post(self, context, poll):
+        message = await MessageSender.send_tracked_message(
+            context, poll.chat_id, self.render(poll), reply_markup=self.keyboard(poll.poll_id)
+        )
+        if message is None:
+            return False
+        self.attendance.set_message(poll, message.message_id)
+        poll.rendered_at = time.monotonic()
+        return True
+
+    async def scheduled_polls_job(self, context: ContextTypes.DEFAULT_TYPE):
+        """Задача JobQueue: опрос во всех настроенных чатах"""
+        chat_ids = self.attendance.configured_chats()
+        started = time.monotonic()
+        posted = await self.open_polls(context, chat_ids)
+        logger.info(
+            f"Опрос посещаемости опубликован в {posted}/{len(chat_ids)} чатах "
+            f"за {time.monotonic() - started:.1f} сек"
+        )
+
+    async def poll_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Открывает новый опрос посещаемости"""
+        if not await self.permission_manager.check_admin_access(update, context):
+            return
+        await self.open_polls(context, [update.effective_chat.id])
+
+    async def attendance_stats_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Статистика посещаемости по закрытым опросам: /attendance_stats [период]"""
+        if not await self.permission_manager.check_admin_access(update, context):
+            return
+
+        chat_id = update.effective_chat.id
+        since = 0
+        period = ""
+        if context.args:
+            duration = TimeManager.parse_duration(context.args[0])
+            if not duration:
+                await MessageSender.send_safe_message(context, chat_id, Templates.INVALID_PERIOD)
+                return
+            since = int(time.time()) - duration
+            period = Templates.ATTENDANCE_STATS_PERIOD.format(duration=TimeManager.format_duration(duration))
+
+        history = self.attendance.history
+        stats = history.chat_stats(chat_id, since) if history is not None else None
+        if stats is None:
+            await MessageSender.send_safe_message(context, chat_id, Templates.ATTENDANCE_STATS_EMPTY)
+            return
+
+        polls = stats['polls']
+        turnout = sum(came for _, came, _ in polls) / len(polls)
+        poll_lines = [
+            Templates.ATTENDANCE_STATS_POLL.format(
+                date=TimeManager.format_timestamp(poll_id)[:10], came=came, voted=voted
+            )
+            for poll_id, came, voted in polls[-self.STATS_POLLS:]
+        ]
+
+        users = sorted(stats['users'], key=lambda user: (-user[1] / user[2], -user[1]))
+        user_lines = []
+        for i, (user_id, attended, eligible, current, best) in enumerate(users[:self.STATS_USERS], 1):
+            user_lines.append(Templates.ATTENDANCE_STATS_USER.format(
+                index=i, name=html.escape(history.names.get(user_id) or str(user_id)),
+                percent=attended * 100 // eligible, attended=attended, eligible=eligible,
+                current=current, best=best
+            ))
+        if len(users) > self.STATS_USERS:
+            user_lines.append(Templates.LIST_MORE.format(count=len(users) - self.STATS_USERS))
+
+        await MessageSender.send_safe_message(
+            context, chat_id,
+            Templates.ATTENDANCE_STATS.format(
+                period=period, poll_count=len(polls), since=TimeManager.format_timestamp(polls[0][0]),
+                turnout=turnout, poll_list="\n".join(poll_lines), user_list="\n".join(user_lines)
+            )
+        )
+
+    async def handle_vote_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Учитывает нажатие на вариант опроса"""
+        query = update.callback_query
+        try:
+            _, poll_id, option = query.data.split(':')
+        except ValueError:
+            await query.answer()
+            return
+
+        if option not in self.OPTION_LABELS:
+            await query.answer()
+            return
+
+        poll = self.attendance.vote(query.message.chat_id, poll_id, query.from_user, option)
+        if poll is None:
+            await query.answer(Templates.ATTENDANCE_CLOSED)
+            return
+
+        await query.answer(Templates.ATTENDANCE_VOTED.format(label=self.OPTION_LABELS[option]))
+        self._schedule_render(context, poll)
+
+    def _schedule_render(self, context, poll):
+        """Перерисовывает опрос не чаще раза за render_interval; голоса между перерисовками копятся"""
+        if poll.render_task is not None and not poll.render_task.done():
+            return
+        delay = max(0.0, poll.rendered_at + self.render_interval - time.monotonic())
+        poll.render_task = asyncio.create_task(self._render_later(context, poll, delay))
+
+    async def _render_later(self, context, poll, delay):
+        if delay:
+            await asyncio.sleep(delay)
+        poll.rendered_at = time.monotonic()
+        if poll.message_id is None or self.attendance.get_poll(poll.chat_id) is not poll:
+            return
+
+        version = poll.version
+        await MessageSender.edit_safe_message(
+            context, poll.chat_id, poll.message_id, self.render(poll),
+            reply_markup=self.keyboard(poll.poll_id)
+        )
+        if poll.version != version:
+            # Голоса, пришедшие во время правки, попадут в следующую перерисовку
+            poll.render_task = None
+            self._schedule_render(context, poll)
+
+
+class BackupCommands:
+    """Резервное копирование по расписанию и команды главного администратора"""
+
+    def __init__(self, backup_manager, flushers=()):
+        self.backup_manager = backup_manager
+        # Корутины, сбрасывающие несохраненные данные на диск перед копией
+        self.flushers = flushers
+
+    async def create_backup(self):
+        for flush in self.flushers:
+            await flush()
+        return await asyncio.to_thread(self.backup_manager.create_backup)
+
+    async def backup_job(self, context: ContextTypes.DEFAULT_TYPE):
+        """Задача JobQueue: очередная резервная копия"""
+        try:
+            backup_id, written = await self.create_backup()
+            logger.info(f"Резервная копия {backup_id}: записано {written} байт")
+        except Exception as e:
+            logger.error(f"Ошибка резервного копирования: {e}")
+
+    async def backup_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Создает резервную копию сейчас (только главный админ)"""
+        chat_id = update.effective_chat.id
+        if update.effective_user.id != MAIN_ADMIN_ID:
+            await MessageSender.send_safe_message(context, chat_id, Templates.BACKUP_FORBIDDEN)
+            return
+
+        try:
+            backup_id, written = await self.create_backup()
+        except Exception as e:
+            await MessageSender.send_safe_message(context, chat_id, Templates.BACKUP_ERROR.format(error=e))
+            return
+
+        await MessageSender.send_safe_message(
+            context, chat_id, Templates.BACKUP_CREATED.format(backup_id=backup_id, written=written)
+        )
+
+    async def backups_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Список резервных копий (только главный админ)"""
+        chat_id = update.effective_chat.id
+        if update.effective_user.id != MAIN_ADMIN_ID:
+            await MessageSender.send_safe_message(context, chat_id, Templates.BACKUP_FORBIDDEN)
+            return
+
+        backup_ids = await asyncio.to_thread(self.backup_manager.list_backups)
+        if not backup_ids:
+            await MessageSender.send_safe_message(context, chat_id, Templates.BACKUPS_EMPTY)
+            return
+
+        lines = [
+            Templates.BACKUPS_ITEM.format(backup_id=backup_id, created=TimeManager.format_timestamp(backup_id))
+            for backup_id in reversed(backup_ids)
+        ]
+        await MessageSender.send_safe_message(
+            context, chat_id, Templates.BACKUPS.format(backup_list="\n".join(lines))
+        )
+
+
+class CommandRouter(BaseHandler):
+    """Единая точка входа для всех команд.
+
+    Команда разбирается один раз и ищется в словаре, цель ответа
+    (context.reply_target) определяется общим шагом для всех команд.
+    Обычные сообщения отсекаются проверкой первого символа.
+    """
+
+    def __init__(self):
+        super().__init__(self._dispatch)
+        self.commands = {}
+
+    def add_command(self, name, callback):
+        self.commands[name.lower()] = callback
+
+    def check_update(self, update):
+        if not isinstance(update, Update):
+            return None
+        message = update.message or update.edited_message
+        if message is None:
+            return None
+        text = message.text
+        if not text or text[0] != '/':
+            return None
+
+        parts = text.split()
+        name, _, mention = parts[0][1:].partition('@')
+        if mention and mention.lower() != (message.get_bot().username or '').lower():
+            return None  # команда другому боту
+        callback = self.commands.get(name.lower())
+        if callback is None:
+            return None
+        return callback, parts[1:]
+
+    def collect_additional_context(self, context, update, application, check_result):
+        callback, args = check_result
+        message = update.effective_message
+        context.args = args
+        context.command_callback = callback
+        context.reply_target = message.reply_to_message.from_user if message.reply_to_message else None
+
+    @staticmethod
+    async def _dispatch(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        await context.command_callback(update, context)
+
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """Обновления разных чатов обрабатываются параллельно, одного чата - по очереди.
+
+    Базовый семафор ограничивает число принятых в работу обновлений (вместе
+    с ждущими своей очереди в чате), собственный - число одновременно
+    выполняемых. Обновление, ждущее свой чат, не занимает место выполняемого,
+    поэтому загруженный чат не останавливает остальные.
+    """
+
+    def __init__(self, concurrency=UPDATE_CONCURRENCY, max_pending=UPDATE_MAX_PENDING):
+        super().__init__(max(max_pending, concurrency))
+        self.concurrency = concurrency
+        self._running = None
+        # Ключ чата -> [Lock, сколько его обновлений в работе]; пустые записи удаляются
+        self._chats = {}
+
+    @staticmethod
+    def _key(update):
+        """Ключ очереди: чат, а для обновлений без чата (inline-запросы) - пользователь"""
+        if not isinstance(update, Update):
+            return None
+        if update.effective_chat is not None:
+            return update.effective_chat.id
+        if update.effective_user is not None:
+            return ('user', update.effective_user.id)
+        return None
+
+    async def do_process_update(self, update, coroutine):
+        key = self._key(update)
+        if key is None:
+            async with self._running:
+                await coroutine
+            return
+
+        entry = self._chats.get(key)
+        if entry is None:
+            entry = self._chats[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            # Lock отдает очередь в порядке ожидания, т.е. в порядке прихода обновлений
+            async with entry[0]:
+                async with self._running:
+                    await coroutine
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._chats[key]
+
+    async def initialize(self):
+        self._running = asyncio.Semaphore(self.concurrency)
+
+    async def shutdown(self):
+        pass
+
+
+class Shard:
+    """Номер процесса-шарда и правило распределения чатов между шардами"""
+
+    __slots__ = ('index', 'count')
+
+    def __init__(self, index=0, count=1):
+        self.index = index
+        self.count = count
+
+    @staticmethod
+    def key_of(update):
+        """Ключ распределения: чат, а для обновлений без чата - пользователь"""
+        if update.effective_chat is not None:
+            return update.effective_chat.id
+        if update.effective_user is not None:
+            return update.effective_user.id
+        return 0
+
+    @staticmethod
+    def index_for(key, count):
+        # ID чатов и пользователей распределены равномерно, отдельный хэш не нужен;
+        # % в Python неотрицателен и для отрицательных ID групп
+        return key % count
+
+    def owns(self, chat_id):
+        return self.index_for(chat_id, self.count) == self.index
+
+    def path(self, filename):
+        """Файл данных шарда: bot_data.json -> bot_data.shard2.json"""
+        if self.count == 1:
+            return filename
+        root, ext = os.path.splitext(filename)
+        return f"{root}.shard{self.index}{ext}"
+
+    def import_path(self, filename):
+        """Общий файл, из которого шард берет свои чаты при первом запуске"""
+        return filename if self.count > 1 else None
+
+
+class AdvancedAdminBot:
     """Главный класс бота"""
 
-    def __init__(self, token):
+    def __init__(self, token, mode=BOT_MODE, shard=None):
         self.token = token
-        self.data_manager = DataManager()
-        self.permission_manager = PermissionManager(self.data_manager)
+        self.mode = mode
+        # В режиме шарда (mode='shard') обновления приходят от супервизора,
+        # а все данные хранятся в файлах шарда
+        self.shard = shard if shard is not None else Shard()
+        shard = self.shard
+        self.data_manager = DataManager(create_storage(shard=shard))
+        self.chat_admins_cache = ChatAdministratorsCache()
+        self.permission_manager = PermissionManager(self.data_manager, self.chat_admins_cache)
         self.time_manager = TimeManager()
+        self.profile_cache = UserProfileCache()
+        # Общий лимит Telegram на бота делится между шардами поровну
+        self.outbound_scheduler = OutboundScheduler(
+            global_rate=SEND_GLOBAL_RATE / shard.count,
+            global_burst=max(1.0, SEND_GLOBAL_BURST / shard.count)
+        )
+        MessageSender.scheduler = self.outbound_scheduler
+        if COALESCE_WINDOW > 0:
+            MessageSender.coalescer = MessageCoalescer(COALESCE_WINDOW)
+
+        # Long polling держит соединение до ответа Telegram, поэтому у
+        # getUpdates свой пул и он не занимает соединения вызовов API
+        self.api_request = PooledRequest('api')
+        self.get_updates_request = None
+        if mode != 'shard':
+            self.get_updates_request = PooledRequest('get_updates', pool_size=GET_UPDATES_POOL_SIZE)
+        self.http_requests = tuple(
+            request for request in (self.api_request, self.get_updates_request) if request is not None
+        )
 
         # Инициализация компонентов
-        self.admin_panel = AdminPanel(self.permission_manager, self.data_manager)
-        self.admin_commands = AdminCommands(self.data_manager, self.permission_manager)
-        self.user_commands = UserCommands(self.permission_manager, self.data_manager)
-        self.moderation_commands = ModerationCommands(self.permission_manager, self.time_manager)
+        self.admin_panel = AdminPanel(self.permission_manager, self.data_manager, self.http_requests)
+        self.admin_commands = AdminCommands(self.data_manager, self.permission_manager, self.profile_cache)
+        self.user_commands = UserCommands(
+            self.permission_manager, self.data_manager, self.profile_cache, self.chat_admins_cache
+        )
+        self.reply_tracker = ReplyTracker()
+        self.punishments = PunishmentScheduler(PunishmentStore(
+            shard.path(PUNISHMENTS_FILE),
+            import_filename=shard.import_path(PUNISHMENTS_FILE), chat_filter=shard.owns
+        ))
+        self.attendance_history = AttendanceHistory(
+            shard.path(ATTENDANCE_HISTORY_DIR), shard.path(ATTENDANCE_ARCHIVE_FILE)
+        )
+        self.attendance_manager = AttendanceManager(
+            shard.path(ATTENDANCE_FILE), shard.path(ATTENDANCE_ARCHIVE_FILE), history=self.attendance_history,
+            import_filename=shard.import_path(ATTENDANCE_FILE), chat_filter=shard.owns
+        )
+        self.attendance_commands = AttendanceCommands(
+            self.permission_manager, self.attendance_manager, post_rate=ATTENDANCE_POST_RATE / shard.count
+        )
+        self.backup_commands = BackupCommands(
+            BackupManager.for_shard(shard),
+            (self.data_manager.flush, self.attendance_manager.flush)
+        )
+        self.moderation_commands = ModerationCommands(
+            self.permission_manager, self.time_manager, self.profile_cache,
+            self.reply_tracker, ModerationPipeline(), self.punishments
+        )
+        self.anti_flood = AntiFlood(self.moderation_commands)
 
         # Создание приложения
-        self.application = Application.builder().token(token).build()
+        builder = (
+            application_builder(token, self.api_request, self.get_updates_request)
+            .post_init(self.post_init)
+            .post_shutdown(self.post_shutdown)
+        )
+        if UPDATE_CONCURRENCY > 1:
+            builder = builder.concurrent_updates(ChatOrderedUpdateProcessor())
+        if mode == 'shard':
+            builder = builder.updater(None)
+        self.application = builder.build()
 
         # Загрузка данных и настройка обработчиков
         self.data_manager.load_data()
+        self.punishments.load()
+        self.attendance_manager.load()
+        self.attendance_history.load()
         self.setup_handlers()
+        self.setup_jobs()
 
     def setup_handlers(self):
         """Настройка обработчиков команд"""
+        # Пассивный сбор профилей и ответов (группа -1 выполняется до команд)
+        self.application.add_handler(TypeHandler(Update, self.observe_update), group=-1)
+
+        router = CommandRouter()
+
         # Основные команды
-        self.application.add_handler(CommandHandler("start", self.user_commands.start_command))
-        self.application.add_handler(CommandHandler("id", self.user_commands.id_command))
-        self.application.add_handler(CommandHandler("help", self.user_commands.help_command))
-        self.application.add_handler(CommandHandler("status", self.user_commands.status_command))
-        self.application.add_handler(CommandHandler("get_id", self.user_commands.get_id_command))
-        self.application.add_handler(CommandHandler("all_ids", self.user_commands.all_ids_command))
-        self.application.add_handler(CommandHandler("chat_info", self.user_commands.chat_info_command))
+        router.add_command("start", self.user_commands.start_command)
+        router.add_command("id", self.user_commands.id_command)
+        router.add_command("help", self.user_commands.help_command)
+        router.add_command("status", self.user_commands.status_command)
+        router.add_command("get_id", self.user_commands.get_id_command)
+        router.add_command("all_ids", self.user_commands.all_ids_command)
+        router.add_command("chat_info", self.user_commands.chat_info_command)
 
         # Команды администраторов
-        self.application.add_handler(CommandHandler("admin", self.admin_panel.show_admin_panel))
-        self.application.add_handler(CommandHandler("admins", self.admin_commands.admins_command))
-        self.application.add_handler(CommandHandler("add_admin", self.admin_commands.add_admin_command))
-        self.application.add_handler(CommandHandler("remove_admin", self.admin_commands.remove_admin_command))
+        router.add_command("admin", self.admin_panel.show_admin_panel)
+        router.add_command("admins", self.admin_commands.admins_command)
+        router.add_command("add_admin", self.admin_commands.add_admin_command)
+        router.add_command("remove_admin", self.admin_commands.remove_admin_command)
+        router.add_command("admin_chats", self.admin_commands.admin_chats_command)
+        router.add_command("revoke_admin", self.admin_commands.revoke_admin_command)
 
         # Команды модерации
-        self.application.add_handler(CommandHandler("mute", self.moderation_commands.mute_command))
-        self.application.add_handler(CommandHandler("unmute", self.moderation_commands.unmute_command))
-        self.application.add_handler(CommandHandler("ban", self.moderation_commands.ban_command))
-        self.application.add_handler(CommandHandler("unban", self.moderation_commands.unban_command))
-        self.application.add_handler(CommandHandler("kick", self.moderation_commands.kick_command))
-
-        # Обработчики ответов на сообщения
-        self.application.add_handler(
-            MessageHandler(filters.REPLY & filters.TEXT & filters.Regex(r'^/mute\b'), self.handle_reply_mute))
-        self.application.add_handler(
-            MessageHandler(filters.REPLY & filters.TEXT & filters.Regex(r'^/unmute\b'), self.handle_reply_unmute))
-        self.application.add_handler(
-            MessageHandler(filters.REPLY & filters.TEXT & filters.Regex(r'^/ban\b'), self.handle_reply_ban))
-        self.application.add_handler(
-            MessageHandler(filters.REPLY & filters.TEXT & filters.Regex(r'^/unban\b'), self.handle_reply_unban))
-        self.application.add_handler(
-            MessageHandler(filters.REPLY & filters.TEXT & filters.Regex(r'^/kick\b'), self.handle_reply_kick))
-        self.application.add_handler(
-            MessageHandler(filters.REPLY & filters.TEXT & filters.Regex(r'^/add_admin\b'), self.handle_reply_add_admin))
-        self.application.add_handler(
-            MessageHandler(filters.REPLY & filters.TEXT & filters.Regex(r'^/remove_admin\b'),
-                           self.handle_reply_remove_admin))
+        router.add_command("mute", self.moderation_commands.mute_command)
+        router.add_command("unmute", self.moderation_commands.unmute_command)
+        router.add_command("ban", self.moderation_commands.ban_command)
+        router.add_command("ban_repliers", self.moderation_commands.ban_repliers_command)
+        router.add_command("unban", self.moderation_commands.unban_command)
+        router.add_command("kick", self.moderation_commands.kick_command)
+        router.add_command("punishments", self.moderation_commands.punishments_command)
+        router.add_command("extend", self.moderation_commands.extend_command)
+
+        # Посещаемость
+        router.add_command("poll", self.attendance_commands.poll_command)
+        router.add_command("attendance_stats", self.attendance_commands.attendance_stats_command)
+
+        # Резервные копии
+        router.add_command("backup", self.backup_commands.backup_command)
+        router.add_command("backups", self.backup_commands.backups_command)
+        self.application.add_handler(router)
+
+        # Изменения прав участников обновляют кэш администраторов Telegram
+        self.application.add_handler(ChatMemberHandler(
+            self.chat_admins_cache.handle_chat_member, ChatMemberHandler.ANY_CHAT_MEMBER
+        ))
 
         # Обработчик callback-ов для панели администратора
         self.application.add_handler(CallbackQueryHandler(
@@ -1131,36 +4738,57 @@ class AdvancedAdminBot:
             pattern=r"^admin_"
         ))
 
+        # Голоса в опросах посещаемости
+        self.application.add_handler(CallbackQueryHandler(
+            self.attendance_commands.handle_vote_callback,
+            pattern=r"^att_vote:"
+        ))
+
         # Обработчик ошибок
         self.application.add_error_handler(self.error_handler)
 
-    async def handle_reply_mute(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Обработчик мута по ответу на сообщение"""
-        await self.moderation_commands.mute_command(update, context)
+    def setup_jobs(self):
+        """Задачи по расписанию (нужен python-telegram-bot[job-queue])"""
+        if not ATTENDANCE_POLL_TIME and not BACKUP_INTERVAL and not HTTP_STATS_INTERVAL:
+            return
+
+        job_queue = self.application.job_queue
+        if job_queue is None:
+            logger.warning("JobQueue недоступна (нет APScheduler) - опросы и копии по расписанию отключены")
+            return
 
-    async def handle_reply_unmute(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Обработчик размута по ответу на сообщение"""
-        await self.moderation_commands.unmute_command(update, context)
+        if HTTP_STATS_INTERVAL:
+            job_queue.run_repeating(
+                self.log_http_stats, interval=HTTP_STATS_INTERVAL, first=HTTP_STATS_INTERVAL, name="http_stats"
+            )
 
-    async def handle_reply_ban(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Обработчик бана по ответу на сообщение"""
-        await self.moderation_commands.ban_command(update, context)
+        if BACKUP_INTERVAL:
+            job_queue.run_repeating(
+                self.backup_commands.backup_job, interval=BACKUP_INTERVAL, first=BACKUP_INTERVAL, name="backup"
+            )
 
-    async def handle_reply_unban(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Обработчик разбана по ответу на сообщение"""
-        await self.moderation_commands.unban_command(update, context)
+        if not ATTENDANCE_POLL_TIME:
+            return
 
-    async def handle_reply_kick(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Обработчик кика по ответу на сообщение"""
-        await self.moderation_commands.kick_command(update, context)
+        hour, minute = map(int, ATTENDANCE_POLL_TIME.split(':'))
+        job_queue.run_daily(
+            self.attendance_commands.scheduled_polls_job,
+            time=dt_time(hour, minute, tzinfo=datetime.now().astimezone().tzinfo),
+            days=tuple(int(day) for day in ATTENDANCE_POLL_DAYS.split(',')),
+            name="attendance_polls"
+        )
 
-    async def handle_reply_add_admin(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Обработчик добавления админа по ответу на сообщение"""
-        await self.admin_commands.add_admin_command(update, context)
+    async def log_http_stats(self, context: ContextTypes.DEFAULT_TYPE):
+        """Пишет в лог загрузку пулов HTTP-клиента (задача JobQueue)"""
+        for request in self.http_requests:
+            log = logger.warning if request.pool_timeouts else logger.info
+            log(f"Пул HTTP {request.format_stats()}")
 
-    async def handle_reply_remove_admin(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Обработчик удаления админа по ответу на сообщение"""
-        await self.admin_commands.remove_admin_command(update, context)
+    async def observe_update(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Пассивно собирает данные из каждого обновления"""
+        await self.profile_cache.observe_update(update, context)
+        await self.reply_tracker.observe_update(update, context)
+        await self.anti_flood.observe_update(update, context)
 
     async def error_handler(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик ошибок"""
@@ -1175,6 +4803,87 @@ class AdvancedAdminBot:
         except Exception as e:
             logger.error(f"Ошибка при отправке сообщения об ошибке: {e}")
 
+    async def post_init(self, application):
+        """Запускает фоновые компоненты после инициализации приложения"""
+        await self.outbound_scheduler.start()
+        self.punishments.start(application.bot, self.moderation_commands.lift_punishment)
+
+    async def post_shutdown(self, application):
+        """Сохраняет накопленные изменения при остановке приложения"""
+        self.punishments.stop()
+        if MessageSender.coalescer is not None:
+            await MessageSender.coalescer.close()
+        await self.outbound_scheduler.stop()
+        await self.data_manager.flush()
+        await self.punishments.flush()
+        await self.attendance_manager.flush()
+
+    async def receive_updates(self, updates, acks):
+        """Передает приложению обновления из канала шарда, пока супервизор не пришлет STOP.
+
+        Пачка подтверждается, только когда приложение обработало все ее обновления.
+        """
+        loop = asyncio.get_running_loop()
+        parent = multiprocessing.parent_process()
+        while True:
+            try:
+                batch = await loop.run_in_executor(None, take_batch, updates, SHARD_BATCH_SIZE)
+            except queue.Empty:
+                # Супервизор убит без остановки шардов - завершаемся сами
+                if parent is not None and not parent.is_alive():
+                    logger.error("Супервизор завершился, останавливаем шард")
+                    return
+                continue
+            except EOFError:
+                logger.error("Супервизор закрыл канал обновлений, останавливаем шард")
+                return
+
+            seq = None
+            stop = False
+            for data in batch:
+                if data == ShardChannel.STOP:
+                    stop = True
+                    break
+                seq, _, data = data.partition(b' ')
+                await self.application.update_queue.put(Update.de_json(json.loads(data), self.application.bot))
+
+            # task_done вызывается после обработки обновления, а не после выдачи из очереди
+            await self.application.update_queue.join()
+            if seq is not None:
+                acks.send_bytes(seq)
+            if stop:
+                return
+
+    async def serve_shard(self, updates, acks):
+        """Жизненный цикл приложения шарда: без Updater, обновления - из очереди"""
+        application = self.application
+        await application.initialize()
+        try:
+            await self.post_init(application)
+            await application.start()
+            logger.info(f"Шард {self.shard.index + 1}/{self.shard.count} запущен")
+            await self.receive_updates(updates, acks)
+        finally:
+            if application.running:
+                await application.stop()
+            await application.shutdown()
+            await self.post_shutdown(application)
+
+    def close(self):
+        """Синхронно дописывает данные на диск после остановки цикла событий"""
+        self.data_manager.close()
+        self.punishments.close()
+        self.attendance_manager.save()
+
+    def run_shard(self, updates, acks):
+        """Запуск в процессе-шарде (вызывается из run_shard_worker)"""
+        try:
+            asyncio.run(self.serve_shard(updates, acks))
+        except Exception as e:
+            logger.error(f"Критическая ошибка шарда {self.shard.index}: {e}", exc_info=e)
+        finally:
+            self.close()
+
     def run(self):
         """Запуск бота"""
         print("🚀 Запуск продвинутого бота-администратора...")
@@ -1184,16 +4893,297 @@ class AdvancedAdminBot:
         print("💡 Используйте /help для списка команд")
 
         try:
-            self.application.run_polling()
+            serve_application(self.application, self.token, self.mode)
         except KeyboardInterrupt:
             print("\n🛑 Бот остановлен пользователем")
-            self.data_manager.save_data()
         except Exception as e:
             print(f"❌ Критическая ошибка: {e}")
             import traceback
             traceback.print_exc()
+        finally:
+            self.close()
+
+
+class ShardChannel:
+    """Канал обновлений от супервизора к шарду и подтверждений обратно.
+
+    Обновление нумеруется и хранится у супервизора, пока шард не подтвердит,
+    что обработал его. Упавший шард мог прочитать пачку и не успеть ее
+    обработать, поэтому новый процесс получает новый pipe и все
+    неподтвержденные обновления заново: обработка "хотя бы один раз".
+    Пишет в pipe отдельный поток, чтобы заполненный pipe (шард не успевает)
+    не останавливал цикл событий.
+    """
+
+    STOP = b''  # сигнал шарду дообработать обновления и завершиться
+
+    def __init__(self, context, name):
+        self.context = context
+        self.name = name
+        self.inflight = deque()  # (номер, байты JSON) неподтвержденных обновлений
+        self._seq = 0
+        self._reader = None
+        self._pending = None
+        self._acks = None
+        self._ack_writer = None
+
+    def put(self, data):
+        """Ставит обновление (байты JSON) в очередь на запись, не блокируя"""
+        self._seq += 1
+        item = b"%d %s" % (self._seq, data)
+        self.inflight.append((self._seq, item))
+        if self._pending is not None:
+            self._pending.put(item)
+
+    def stop(self):
+        if self._pending is not None:
+            self._pending.put(self.STOP)
+
+    def open(self):
+        """Новый pipe для нового процесса шарда; возвращает его концы (обновления, подтверждения)"""
+        self.close()
+        reader, writer = self.context.Pipe(duplex=False)
+        self._acks, ack_writer = self.context.Pipe(duplex=False)
+        self._pending = queue.SimpleQueue()
+        for _, item in self.inflight:
+            self._pending.put(item)
+        threading.Thread(
+            target=self._write_loop, args=(writer, self._pending), name=self.name, daemon=True
+        ).start()
+        asyncio.get_running_loop().add_reader(self._acks.fileno(), self._read_acks)
+        # Концы процесса шарда держим до его замены: с ними закрывается и старый pipe
+        self._reader, self._ack_writer = reader, ack_writer
+        return reader, ack_writer
+
+    def close(self):
+        if self._pending is None:
+            return
+        asyncio.get_running_loop().remove_reader(self._acks.fileno())
+        # Поток записи сам закроет свой конец: None, если он ждет очередь,
+        # а закрытый reader прервет запись в заполненный pipe
+        self._pending.put(None)
+        for conn in (self._reader, self._acks, self._ack_writer):
+            conn.close()
+        self._pending = None
+
+    def _read_acks(self):
+        """Шард подтвердил обработку обновлений до номера включительно"""
+        try:
+            while self._acks.poll():
+                seq = int(self._acks.recv_bytes())
+                while self.inflight and self.inflight[0][0] <= seq:
+                    self.inflight.popleft()
+        except (EOFError, OSError):
+            pass
+
+    def _write_loop(self, writer, pending):
+        try:
+            while True:
+                data = pending.get()
+                if data is None:
+                    return
+                writer.send_bytes(data)
+                if data == self.STOP:
+                    return
+        except OSError as e:
+            logger.warning(f"Передача обновлений прервана ({self.name}): {e}")
+        finally:
+            writer.close()
+
+
+class ShardSupervisor:
+    """Супервизор: один прием обновлений и N процессов-шардов.
+
+    Обновления принимаются как обычно (polling или webhook) и без разбора
+    передаются шарду по chat_id (без чата - по user_id). Все обновления чата
+    обрабатывает один процесс в порядке прихода, и только он хранит данные
+    этого чата. Ответы шарды отправляют в Bot API сами.
+    """
+
+    def __init__(self, token, shards=BOT_SHARDS, mode=BOT_MODE, watch_interval=SHARD_WATCH_INTERVAL):
+        self.token = token
+        self.shards = shards
+        self.mode = mode
+        self.watch_interval = watch_interval
+        # spawn: шард импортирует модуль заново и не наследует потоки и сокеты супервизора
+        self.context = multiprocessing.get_context('spawn')
+        self.channels = [ShardChannel(self.context, f"shard-{index}-writer") for index in range(shards)]
+        self.workers = [None] * shards
+        self._watch_task = None
+
+        self.application = (
+            application_builder(
+                token, PooledRequest('api'), PooledRequest('get_updates', pool_size=GET_UPDATES_POOL_SIZE)
+            )
+            .post_init(self.post_init)
+            .post_shutdown(self.post_shutdown)
+            .build()
+        )
+        self.application.add_handler(TypeHandler(Update, self.forward))
+
+    async def forward(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Передает обновление своему шарду"""
+        index = Shard.index_for(Shard.key_of(update), self.shards)
+        self.channels[index].put(update.to_json().encode())
+
+    def start_worker(self, index):
+        updates, acks = self.channels[index].open()
+        worker = self.context.Process(
+            target=run_shard_worker, args=(index, self.shards, updates, acks, self.token),
+            name=f"shard-{index}"
+        )
+        worker.start()
+        self.workers[index] = worker
+
+    async def watch_workers(self):
+        """Перезапускает упавшие шарды; неподтвержденные обновления получит новый процесс"""
+        while True:
+            await asyncio.sleep(self.watch_interval)
+            for index, worker in enumerate(self.workers):
+                if not worker.is_alive():
+                    logger.error(
+                        f"Шард {index} завершился с кодом {worker.exitcode}, перезапуск; "
+                        f"повторно будет передано обновлений: {len(self.channels[index].inflight)}"
+                    )
+                    self.start_worker(index)
+
+    async def post_init(self, application):
+        for index in range(self.shards):
+            self.start_worker(index)
+        self._watch_task = asyncio.create_task(self.watch_workers())
+
+    async def post_shutdown(self, application):
+        """Останавливает шарды: STOP в канале - сигнал дообработать и сохранить данные"""
+        if self._watch_task is not None:
+            self._watch_task.cancel()
+        for channel in self.channels:
+            channel.stop()
+        await asyncio.get_running_loop().run_in_executor(None, self.join_workers)
+        for channel in self.channels:
+            channel.close()
+
+    def join_workers(self, timeout=30):
+        deadline = time.monotonic() + timeout
+        for index, worker in enumerate(self.workers):
+            if worker is None:
+                continue
+            worker.join(max(0, deadline - time.monotonic()))
+            if worker.is_alive():
+                logger.error(f"Шард {index} не остановился за {timeout} сек, завершаем принудительно")
+                # SIGTERM шард игнорирует
+                worker.kill()
+                worker.join()
+
+    def run(self):
+        """Запуск супервизора"""
+        print(f"🚀 Запуск бота-администратора: {self.shards} шардов по chat_id")
+        try:
+            serve_application(self.application, self.token, self.mode)
+        except KeyboardInterrupt:
+            print("\n🛑 Бот остановлен пользователем")
+
+
+def application_builder(token, request=None, get_updates_request=None):
+    """Общие настройки приложения: токен, свой сервер Bot API и HTTP-клиенты"""
+    builder = Application.builder().token(token)
+    if BOT_API_URL:
+        builder = builder.base_url(f"{BOT_API_URL}/bot").base_file_url(f"{BOT_API_URL}/file/bot")
+    if request is not None:
+        builder = builder.request(request)
+    if get_updates_request is not None:
+        builder = builder.get_updates_request(get_updates_request)
+    return builder
+
+
+def serve_application(application, token, mode):
+    """Принимает обновления в режиме polling или webhook со встроенным HTTP-сервером"""
+    if mode != 'webhook':
+        # chat_member не приходит без явного запроса в allowed_updates
+        application.run_polling(allowed_updates=Update.ALL_TYPES)
+        return
+
+    # Без WEBHOOK_URL PTB зарегистрировал бы в Telegram локальный адрес
+    # listen:port, и обновления перестали бы приходить
+    if not WEBHOOK_URL:
+        raise ValueError("BOT_MODE=webhook требует WEBHOOK_URL - публичный адрес для setWebhook")
+
+    # Без явного секрета выводим его из токена: он одинаков у всех
+    # экземпляров за балансировщиком и неизвестен посторонним
+    secret_token = WEBHOOK_SECRET or hashlib.sha256(token.encode()).hexdigest()
+
+    print(f"🌐 Webhook: http://{WEBHOOK_LISTEN}:{WEBHOOK_PORT}/{WEBHOOK_PATH}")
+    application.run_webhook(
+        listen=WEBHOOK_LISTEN,
+        port=WEBHOOK_PORT,
+        url_path=WEBHOOK_PATH,
+        webhook_url=WEBHOOK_URL,
+        secret_token=secret_token,
+        allowed_updates=Update.ALL_TYPES
+    )
+
+
+def take_batch(updates, limit):
+    """Ждет обновление в канале шарда и забирает вместе с ним уже пришедшие"""
+    if not updates.poll(1):
+        raise queue.Empty
+    batch = [updates.recv_bytes()]
+    # После STOP супервизор закрывает pipe: poll вернул бы True на конце файла
+    while len(batch) < limit and batch[-1] != ShardChannel.STOP and updates.poll(0):
+        batch.append(updates.recv_bytes())
+    return batch
+
+
+def run_shard_worker(index, count, updates, acks, token):
+    """Точка входа процесса-шарда"""
+    # Шард останавливает супервизор через канал, чтобы он успел дообработать
+    # обновления и сохранить данные; сигналы терминала и systemd получает супервизор
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    AdvancedAdminBot(token, mode='shard', shard=Shard(index, count)).run_shard(updates, acks)
+
+
+def restore_backup(argv):
+    """python bot.py restore [--shard N] [НОМЕР] - список копий или восстановление (бот остановлен)"""
+    shard_index = None
+    if argv[:1] == ['--shard']:
+        if len(argv) < 2 or not argv[1].isdigit() or int(argv[1]) >= BOT_SHARDS:
+            print(f"❌ Укажите номер шарда от 0 до {BOT_SHARDS - 1}")
+            sys.exit(1)
+        shard_index, argv = int(argv[1]), argv[2:]
+
+    if shard_index is None and BOT_SHARDS > 1:
+        # Копии каждого шарда лежат в своем каталоге - восстанавливать по одному шарду
+        if argv:
+            print("❌ Бот работает в шардах: укажите шард, например restore --shard 0 НОМЕР")
+            sys.exit(1)
+        for index in range(BOT_SHARDS):
+            print(f"Шард {index}:")
+            for backup_id in BackupManager.for_shard(Shard(index, BOT_SHARDS)).list_backups():
+                print(f"  {backup_id}  {TimeManager.format_timestamp(backup_id)}")
+        return
+
+    backup_manager = BackupManager.for_shard(Shard(shard_index or 0, BOT_SHARDS))
+    backup_ids = backup_manager.list_backups()
+    if len(argv) < 1:
+        for backup_id in backup_ids:
+            print(f"{backup_id}  {TimeManager.format_timestamp(backup_id)}")
+        return
+
+    backup_id = int(argv[0])
+    if backup_id not in backup_ids:
+        print(f"❌ Копия {backup_id} не найдена")
+        sys.exit(1)
+    for filename in backup_manager.restore(backup_id):
+        print(f"✅ Восстановлен {filename}")
 
 
 if __name__ == "__main__":
-    bot = AdvancedAdminBot(BOT_TOKEN)
-    bot.run()
\ No newline at end of file
+    if sys.argv[1:2] == ['restore']:
+        restore_backup(sys.argv[2:])
+        sys.exit(0)
+
+    if BOT_SHARDS > 1:
+        ShardSupervisor(BOT_TOKEN).run()
+    else:
+        bot = AdvancedAdminBot(BOT_TOKEN)
+        bot.run()
\ No newline at end of file
@@ -0,0 +1,46 @@
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bot  # noqa: E402
+
+
+class FakeBot:
+    """Записывает вызовы Bot API вместо отправки в Telegram"""
+
+    id = 42
+
+    def __init__(self):
+        self.calls = []
+
+    def __getattr__(self, method):
+        async def call(*args, **kwargs):
+            self.calls.append((method, args, kwargs))
+            return SimpleNamespace(message_id=len(self.calls))
+        return call
+
+    def sent(self, method='send_message'):
+        return [kwargs for name, _, kwargs in self.calls if name == method]
+
+
+@pytest.fixture
+def fake_bot():
+    return FakeBot()
+
+
+@pytest.fixture
+def context(fake_bot):
+    return SimpleNamespace(bot=fake_bot)
+
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    """Файлы данных по умолчанию создаются во временном каталоге"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(bot.MessageSender, 'scheduler', None)
+    monkeypatch.setattr(bot.MessageSender, 'coalescer', None)
+    return tmp_path
@@ -0,0 +1,38 @@
+import bot
+
+
+def test_window_edges():
+    limiter = bot.FloodLimiter(max_messages=3, window=5, capacity=10)
+    assert [limiter.hit(-1, 7, now) for now in (0, 1, 2)] == [False, False, False]
+
+    # Четвертое сообщение: самое старое из трех пришло меньше окна назад
+    assert limiter.hit(-1, 7, 4.999)
+    # Ровно через окно после старейшего из запомненных (1) - уже не флуд
+    assert not limiter.hit(-1, 7, 6.0)
+
+
+def test_pairs_are_counted_separately_and_reset():
+    limiter = bot.FloodLimiter(max_messages=2, window=5, capacity=10)
+    limiter.hit(-1, 7, 0)
+    limiter.hit(-1, 7, 1)
+    assert not limiter.hit(-1, 8, 1)
+    assert not limiter.hit(-2, 7, 1)
+    assert limiter.hit(-1, 7, 2)
+
+    limiter.reset(-1, 7)
+    assert not limiter.hit(-1, 7, 3)
+    assert not limiter.hit(-1, 7, 3)
+    assert limiter.hit(-1, 7, 3)
+
+
+def test_idle_pair_is_evicted_first():
+    limiter = bot.FloodLimiter(max_messages=2, window=5, capacity=2)
+    limiter.hit(-1, 1, 0)
+    limiter.hit(-1, 1, 0)
+    limiter.hit(-1, 2, 0)
+    limiter.hit(-1, 1, 0)   # пара 1 снова активна, давнее всех писала пара 2
+    limiter.hit(-1, 3, 0)
+
+    assert set(limiter.slots) == {(-1, 1), (-1, 3)}
+    # Новый участок начинается с пустого счета
+    assert not limiter.hit(-1, 2, 1)
@@ -0,0 +1,58 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import bot
+
+LEGACY = {
+    'chat_data': {
+        '-1003205745038': {
+            'last_poll_message_id': 282,
+            'current_poll_id': '1762790401',
+            'votes': {'7': {'option': '1', 'name': 'A', 'timestamp': '2025-11-10T19:00:00', 'username': None}},
+            'admin_users': [2073879359, 5180275141],
+            'last_updated': '2025-11-10T19:18:31.743712',
+        }
+    },
+    'last_updated': '2025-11-10T19:18:31'
+}
+
+
+def load_manager():
+    with open('attendance_data.json', 'w', encoding='utf-8') as f:
+        json.dump(LEGACY, f)
+    manager = bot.AttendanceManager()
+    manager.load()
+    return manager
+
+
+def saved_chat():
+    with open('attendance_data.json', encoding='utf-8') as f:
+        return json.load(f)['chat_data']['-1003205745038']
+
+
+def test_unknown_chat_fields_survive_save():
+    manager = load_manager()
+    user = SimpleNamespace(id=8, full_name='B', username=None)
+    manager.vote(-1003205745038, '1762790401', user, '2')
+    manager.save()
+
+    chat = saved_chat()
+    assert chat['admin_users'] == [2073879359, 5180275141]
+    assert chat['last_updated'] == '2025-11-10T19:18:31.743712'
+    assert set(chat['votes']) == {'7', '8'}
+
+
+def test_unknown_chat_fields_survive_new_poll():
+    manager = load_manager()
+
+    async def scenario():
+        await manager.start_polls([-1003205745038], 'next')
+        await manager.flush()
+
+    asyncio.run(scenario())
+
+    chat = saved_chat()
+    assert chat['current_poll_id'] == 'next'
+    assert chat['votes'] == {}
+    assert chat['admin_users'] == [2073879359, 5180275141]
@@ -0,0 +1,49 @@
+import os
+
+import bot
+
+HOUR = 3600
+
+
+def make_backups(monkeypatch, manager, hours):
+    """Копия файла на каждый час из hours; содержимое - номер часа"""
+    backup_ids = []
+    for hour in hours:
+        with open('data.txt', 'w', encoding='utf-8') as f:
+            f.write(f"state at {hour}\n" * (hour + 1))
+        monkeypatch.setattr(bot.time, 'time', lambda: 1000 * HOUR + hour * HOUR)
+        backup_ids.append(manager.create_backup()[0])
+    return backup_ids
+
+
+def chunk_files(manager):
+    return {
+        digest for prefix in os.listdir(manager.chunks_directory)
+        for digest in os.listdir(os.path.join(manager.chunks_directory, prefix))
+    }
+
+
+def test_retention_keeps_latest_per_period_and_drops_unused_chunks(monkeypatch):
+    manager = bot.BackupManager('backups', ['data.txt'], keep_hourly=2, keep_daily=0, keep_weekly=0)
+    first, second, third = make_backups(monkeypatch, manager, [1, 2, 3])
+
+    assert manager.list_backups() == [second, third]
+    referenced = {
+        digest for backup_id in (second, third)
+        for digest in manager.load_manifest(backup_id)['files']['data.txt']['chunks']
+    }
+    assert chunk_files(manager) == referenced
+
+
+def test_restore_kept_backup(monkeypatch):
+    manager = bot.BackupManager('backups', ['data.txt'], keep_hourly=3, keep_daily=0, keep_weekly=0)
+    first, _ = make_backups(monkeypatch, manager, [1, 2])
+
+    with open('data.txt.journal', 'w', encoding='utf-8') as f:
+        f.write('newer than the backup\n')
+    assert manager.restore(first) == ['data.txt']
+
+    with open('data.txt', encoding='utf-8') as f:
+        assert f.read() == "state at 1\n" * 2
+    # Журнал новее копии применился бы поверх нее
+    assert not os.path.exists('data.txt.journal')
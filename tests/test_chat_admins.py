@@ -0,0 +1,76 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import bot
+
+
+class AdminsBot:
+    """Бот со списком администраторов чата; считает запросы к нему"""
+
+    id = 42
+
+    def __init__(self, *admin_ids):
+        self.admin_ids = admin_ids
+        self.requests = 0
+
+    async def get_chat_administrators(self, chat_id):
+        self.requests += 1
+        return [
+            SimpleNamespace(user=SimpleNamespace(id=user_id), status=bot.ChatMember.ADMINISTRATOR)
+            for user_id in self.admin_ids
+        ]
+
+
+def member_update(chat_id, user_id, status):
+    member = SimpleNamespace(user=SimpleNamespace(id=user_id), status=status)
+    return SimpleNamespace(
+        chat_member=SimpleNamespace(chat=SimpleNamespace(id=chat_id), new_chat_member=member),
+        my_chat_member=None
+    )
+
+
+def make_permissions(ttl=60):
+    data_manager = bot.DataManager(bot.JsonStorage())
+    data_manager.load_data()
+    cache = bot.ChatAdministratorsCache(ttl=ttl)
+    return bot.PermissionManager(data_manager, cache), cache
+
+
+def test_permission_checks_use_cached_admin_list():
+    permissions, _ = make_permissions()
+    admins_bot = AdminsBot(5)
+
+    async def scenario():
+        return [await permissions.is_chat_admin(admins_bot, -1, user_id) for user_id in (5, 6, 5)]
+
+    assert asyncio.run(scenario()) == [True, False, True]
+    assert admins_bot.requests == 1
+
+
+def test_expired_entries_are_dropped():
+    permissions, cache = make_permissions(ttl=0)
+    admins_bot = AdminsBot(5)
+
+    async def scenario():
+        await cache.get(admins_bot, -1)
+        await asyncio.sleep(0.01)
+        # Повышение в устаревшем списке не чинится, а список забывается
+        await cache.handle_chat_member(member_update(-1, 6, bot.ChatMember.ADMINISTRATOR), None)
+        assert -1 not in cache._entries
+
+        admins_bot.admin_ids = (5, 6)
+        assert await permissions.is_chat_admin(admins_bot, -1, 6)
+
+    asyncio.run(scenario())
+    assert admins_bot.requests == 2
+
+
+def test_moderation_refuses_chat_admins():
+    permissions, _ = make_permissions()
+    commands = bot.ModerationCommands(permissions, bot.TimeManager(), None, None, None, None)
+    context = SimpleNamespace(bot=AdminsBot(5))
+
+    with pytest.raises(bot.ModerationError, match='администратора чата'):
+        asyncio.run(commands._check_target(context, -1, 5, "self", "admin"))
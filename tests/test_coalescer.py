@@ -0,0 +1,54 @@
+import asyncio
+
+import bot
+
+
+def test_quick_commands_in_one_chat_produce_one_send(context, fake_bot, monkeypatch):
+    monkeypatch.setattr(bot.MessageSender, 'coalescer', bot.MessageCoalescer(window=0.05))
+
+    async def scenario():
+        # Команды одного чата выполняются по очереди: каждая ждет _send предыдущей
+        for user_id in (1, 2, 3):
+            await bot.ModerationCommands._send(context, -100, f"kicked {user_id}")
+        assert fake_bot.sent() == []
+        await asyncio.sleep(0.1)
+
+    asyncio.run(scenario())
+
+    sent = fake_bot.sent()
+    assert len(sent) == 1
+    assert sent[0]['text'] == "kicked 1\n\nkicked 2\n\nkicked 3"
+
+
+def test_windows_of_different_chats_are_independent(context, fake_bot, monkeypatch):
+    monkeypatch.setattr(bot.MessageSender, 'coalescer', bot.MessageCoalescer(window=0.05))
+
+    async def scenario():
+        await bot.ModerationCommands._send(context, -1, "a")
+        await bot.ModerationCommands._send(context, -2, "b")
+        await asyncio.sleep(0.1)
+
+    asyncio.run(scenario())
+
+    assert sorted(kwargs['chat_id'] for kwargs in fake_bot.sent()) == [-2, -1]
+
+
+def test_pack_splits_at_telegram_limit():
+    coalescer = bot.MessageCoalescer(window=1)
+    texts = ["x" * 3000, "y" * 3000, "z"]
+    assert list(coalescer._pack(texts)) == ["x" * 3000, "y" * 3000 + "\n\nz"]
+
+
+def test_close_sends_open_windows_and_waits_for_deliveries(context, fake_bot, monkeypatch):
+    coalescer = bot.MessageCoalescer(window=10)
+    monkeypatch.setattr(bot.MessageSender, 'coalescer', coalescer)
+
+    async def scenario():
+        await bot.ModerationCommands._send(context, -1, "a")
+        await bot.ModerationCommands._send(context, -1, "b")
+        await coalescer.close()
+        assert coalescer._deliveries == set()
+
+    asyncio.run(scenario())
+
+    assert [kwargs['text'] for kwargs in fake_bot.sent()] == ["a\n\nb"]
@@ -0,0 +1,55 @@
+import asyncio
+from types import SimpleNamespace
+
+import bot
+
+
+def make_commands():
+    data_manager = bot.DataManager(bot.JsonStorage())
+    data_manager.load_data()
+    permission_manager = bot.PermissionManager(data_manager)
+    return bot.ModerationCommands(
+        permission_manager, bot.TimeManager(), None, None, None, bot.PunishmentScheduler()
+    )
+
+
+def command_update(chat_id=-100):
+    return SimpleNamespace(
+        effective_user=SimpleNamespace(id=bot.MAIN_ADMIN_ID),
+        effective_chat=SimpleNamespace(id=chat_id),
+        message=SimpleNamespace(reply_to_message=None)
+    )
+
+
+def test_invalid_duration_uses_shared_template(context, fake_bot):
+    commands = make_commands()
+    context.reply_target = None
+    for command, args in (('mute', ['123456', '5x']), ('ban', ['123456', '5x']), ('extend', ['123456', '5x'])):
+        context.args = args
+        asyncio.run(getattr(commands, f'{command}_command')(command_update(), context))
+
+    assert [sent['text'] for sent in fake_bot.sent()] == [bot.Templates.INVALID_DURATION] * 3
+
+
+def test_trailing_duration_needs_unit():
+    commands = make_commands()
+
+    assert commands._parse_targets(['123', '45'], '10m') == ([123, 45], '10m')
+    assert commands._parse_targets(['123', '45', '30m'], '10m') == ([123, 45], '30m')
+    assert commands._parse_targets(['-100123', 'forever'], '10m') == ([-100123], 'forever')
+
+
+def test_kick_cancels_scheduled_punishments(context):
+    commands = make_commands()
+    until = int(bot.time.time()) + 3600
+    for kind in bot.PunishmentScheduler.KINDS:
+        commands.punishments.schedule(-100, 123, kind, until)
+    commands.punishments.schedule(-100, 456, 'mute', until)
+
+    async def is_admin(bot_, chat_id, user_id):
+        return False
+
+    commands.permission_manager.chat_admins_cache = SimpleNamespace(is_admin=is_admin)
+    asyncio.run(commands._kick_user(context, -100, 123))
+
+    assert commands.punishments.list_chat(-100) == [(until, 456, 'mute')]
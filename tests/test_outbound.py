@@ -0,0 +1,149 @@
+import asyncio
+import time
+from datetime import timedelta
+
+import pytest
+from telegram.error import RetryAfter, TimedOut
+
+import bot
+
+
+class FloodControlledBot:
+    """Первые запросы получают RetryAfter, остальные проходят"""
+
+    def __init__(self, retry_after, failures=1):
+        self.retry_after = retry_after
+        self.failures = failures
+        self.delivered = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        if self.failures:
+            self.failures -= 1
+            raise RetryAfter(self.retry_after)
+        self.delivered.append((chat_id, text, time.monotonic()))
+
+
+def make_scheduler():
+    return bot.OutboundScheduler(chat_rate=100, chat_burst=100, global_rate=100, global_burst=100)
+
+
+def test_send_safe_message_does_not_wait_for_paused_chat(monkeypatch):
+    flood_bot = FloodControlledBot(timedelta(seconds=0.3))
+    context = type('Context', (), {'bot': flood_bot})()
+
+    async def scenario():
+        scheduler = make_scheduler()
+        monkeypatch.setattr(bot.MessageSender, 'scheduler', scheduler)
+        await scheduler.start()
+        try:
+            started = time.monotonic()
+            await bot.MessageSender.send_safe_message(context, -1, "first")
+            await asyncio.sleep(0.05)  # первая попытка получила RetryAfter, чат на паузе
+            await bot.MessageSender.send_safe_message(context, -1, "second")
+            assert time.monotonic() - started < 0.2
+            assert flood_bot.delivered == []
+
+            await asyncio.sleep(0.5)
+        finally:
+            await scheduler.stop()
+        return started
+
+    started = asyncio.run(scenario())
+
+    assert [text for _, text, _ in flood_bot.delivered] == ["first", "second"]
+    assert flood_bot.delivered[0][2] - started >= 0.3
+
+
+class FlakyBot:
+    """Первые запросы падают по таймауту"""
+
+    def __init__(self, failures):
+        self.failures = failures
+        self.attempts = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.attempts.append(time.monotonic())
+        if self.failures:
+            self.failures -= 1
+            raise TimedOut()
+        return text
+
+
+def test_timeouts_are_retried_with_growing_backoff(monkeypatch):
+    monkeypatch.setattr(bot.random, 'uniform', lambda a, b: 1.0)
+    flaky_bot = FlakyBot(failures=2)
+
+    async def scenario():
+        scheduler = bot.OutboundScheduler(
+            chat_rate=100, chat_burst=100, global_rate=100, global_burst=100,
+            max_retries=3, backoff_base=0.1, backoff_max=1
+        )
+        await scheduler.start()
+        try:
+            return await scheduler.submit(-1, lambda: flaky_bot.send_message(-1, "x"), 0)
+        finally:
+            await scheduler.stop()
+
+    assert asyncio.run(scenario()) == "x"
+    first, second, third = flaky_bot.attempts
+    assert second - first >= 0.1
+    assert third - second >= 0.2
+
+
+def test_retry_after_pauses_only_its_chat():
+    flood_bot = FloodControlledBot(timedelta(seconds=0.3))
+
+    async def scenario():
+        scheduler = make_scheduler()
+        await scheduler.start()
+        try:
+            paused = scheduler.submit(-1, lambda: flood_bot.send_message(-1, "paused"), 0)
+            await asyncio.sleep(0.05)
+            await scheduler.submit(-2, lambda: flood_bot.send_message(-2, "other"), 0)
+            assert [text for _, text, _ in flood_bot.delivered] == ["other"]
+            await paused
+        finally:
+            await scheduler.stop()
+
+    asyncio.run(scenario())
+    assert [text for _, text, _ in flood_bot.delivered] == ["other", "paused"]
+
+
+def test_retry_after_retries_are_capped():
+    flood_bot = FloodControlledBot(timedelta(seconds=0.01), failures=10)
+
+    async def scenario():
+        scheduler = bot.OutboundScheduler(
+            chat_rate=100, chat_burst=100, global_rate=100, global_burst=100, max_retries=2
+        )
+        await scheduler.start()
+        try:
+            await scheduler.submit(-1, lambda: flood_bot.send_message(-1, "x"), 0)
+        finally:
+            await scheduler.stop()
+
+    with pytest.raises(RetryAfter):
+        asyncio.run(scenario())
+    assert flood_bot.failures == 7
+
+
+def test_paused_chat_waits_in_one_entry_and_stop_clears_queues():
+    flood_bot = FloodControlledBot(timedelta(seconds=0.3))
+
+    async def scenario():
+        scheduler = make_scheduler()
+        await scheduler.start()
+        futures = [scheduler.submit(-1, lambda: flood_bot.send_message(-1, "x"), 0)]
+        await asyncio.sleep(0.05)
+        for _ in range(5):
+            futures.append(scheduler.submit(-1, lambda: flood_bot.send_message(-1, "x"), 0))
+            await asyncio.sleep(0.01)
+        assert [chat_id for _, chat_id in scheduler._sleeping] == [-1]
+
+        await scheduler.stop()
+        assert scheduler._ready == [] and scheduler._sleeping == []
+        assert all(future.done() for future in futures)
+        for future in futures:
+            future.exception()
+
+    asyncio.run(scenario())
@@ -0,0 +1,61 @@
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import bot
+
+FOREVER = datetime.fromtimestamp(0, timezone.utc)
+
+
+class MemberBot:
+    """Бот, у которого get_chat_member возвращает заданного участника"""
+
+    def __init__(self, member):
+        self.member = member
+        self.calls = []
+
+    async def get_chat_member(self, chat_id, user_id):
+        return self.member
+
+    async def restrict_chat_member(self, **kwargs):
+        self.calls.append(('restrict', kwargs))
+
+    async def unban_chat_member(self, **kwargs):
+        self.calls.append(('unban', kwargs))
+
+
+def lift(member, kind='mute', forever=True):
+    member_bot = MemberBot(member)
+    asyncio.run(bot.ModerationCommands.lift_punishment(member_bot, -1, 7, kind, forever))
+    return member_bot.calls
+
+
+def test_regular_term_is_left_to_telegram():
+    assert lift(None, forever=False) == []
+
+
+def test_forever_mute_is_lifted_while_still_in_place():
+    calls = lift(SimpleNamespace(status=bot.ChatMember.RESTRICTED, until_date=FOREVER))
+    assert [name for name, _ in calls] == ['restrict']
+
+
+def test_manual_restriction_applied_since_is_kept():
+    manual = datetime.now(timezone.utc) + timedelta(days=1)
+    assert lift(SimpleNamespace(status=bot.ChatMember.RESTRICTED, until_date=manual)) == []
+    assert lift(SimpleNamespace(status=bot.ChatMember.MEMBER)) == []
+    assert lift(SimpleNamespace(status=bot.ChatMember.RESTRICTED, until_date=FOREVER), kind='ban') == []
+
+
+def test_forever_flag_survives_restart():
+    scheduler = bot.PunishmentScheduler()
+    scheduler.load()
+    now = time.time()
+    scheduler.schedule(-1, 7, 'mute', now + 400 * 86400)
+    scheduler.schedule(-1, 8, 'mute', now + 3600)
+    scheduler.save()
+
+    scheduler = bot.PunishmentScheduler()
+    scheduler.load()
+    assert scheduler.forever == {(-1, 7, 'mute')}
+    assert len(scheduler.entries) == 2
@@ -0,0 +1,95 @@
+import asyncio
+import multiprocessing
+import queue
+
+import pytest
+
+import bot
+
+
+def read_until_stop(reader):
+    received = []
+    while not received or received[-1] != bot.ShardChannel.STOP:
+        received += bot.take_batch(reader, 10)
+    return received[:-1]
+
+
+def test_restarted_shard_gets_unacknowledged_updates():
+    channel = bot.ShardChannel(multiprocessing.get_context('spawn'), 'test-writer')
+    updates = [f'{{"update_id": {number}}}'.encode() for number in range(5)]
+
+    async def scenario():
+        for data in updates:
+            channel.put(data)
+        reader, acks = channel.open()
+        received = []
+        while len(received) < 5:
+            received += bot.take_batch(reader, 10)
+        assert [data.partition(b' ')[2] for data in received] == updates
+
+        # Шард обработал два обновления и упал, прочитав остальные
+        acks.send_bytes(b'2')
+        await asyncio.sleep(0.05)
+        assert [seq for seq, _ in channel.inflight] == [3, 4, 5]
+
+        reader, acks = channel.open()
+        channel.stop()
+        assert [data.partition(b' ')[2] for data in read_until_stop(reader)] == updates[2:]
+        channel.close()
+
+    asyncio.run(scenario())
+
+
+def test_take_batch_raises_empty_without_updates():
+    reader, _writer = multiprocessing.get_context('spawn').Pipe(duplex=False)
+    with pytest.raises(queue.Empty):
+        bot.take_batch(reader, 10)
+
+
+def test_supervisor_passes_its_token_to_workers(monkeypatch):
+    started = []
+
+    class Process:
+        def __init__(self, target, args, name):
+            started.append(args)
+
+        def start(self):
+            pass
+
+    supervisor = bot.ShardSupervisor('123:shard-token', shards=2)
+    monkeypatch.setattr(supervisor.context, 'Process', Process)
+
+    async def scenario():
+        supervisor.start_worker(1)
+        supervisor.channels[1].close()
+
+    asyncio.run(scenario())
+
+    assert started[0][0:2] == (1, 2)
+    assert started[0][4] == '123:shard-token'
+
+
+def test_restore_finds_backups_of_shard(monkeypatch, capsys):
+    monkeypatch.setattr(bot, 'BOT_SHARDS', 2)
+    shard = bot.Shard(1, 2)
+    manager = bot.BackupManager.for_shard(shard)
+    with open(shard.path('bot_data.json'), 'w', encoding='utf-8') as f:
+        f.write('{"chats": {}}\n')
+    backup_id, _ = manager.create_backup()
+
+    with open(shard.path('bot_data.json'), 'w', encoding='utf-8') as f:
+        f.write('broken')
+    bot.restore_backup(['--shard', '1', str(backup_id)])
+
+    with open(shard.path('bot_data.json'), encoding='utf-8') as f:
+        assert f.read() == '{"chats": {}}\n'
+    assert "bot_data.shard1.json" in capsys.readouterr().out
+
+
+def test_restore_without_shard_lists_every_shard(monkeypatch, capsys):
+    monkeypatch.setattr(bot, 'BOT_SHARDS', 2)
+    bot.restore_backup([])
+    assert capsys.readouterr().out.split() == ["Шард", "0:", "Шард", "1:"]
+
+    with pytest.raises(SystemExit):
+        bot.restore_backup(['123'])
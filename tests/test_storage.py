@@ -0,0 +1,163 @@
+import asyncio
+
+import pytest
+
+import bot
+
+
+def sqlite_manager(cache_size=2):
+    manager = bot.DataManager(bot.SqliteStorage(), cache_size=cache_size)
+    manager.load_data()
+    return manager
+
+
+def test_sqlite_admin_lookup_does_not_load_pairs_at_startup():
+    manager = sqlite_manager()
+    for chat_id in (-1, -2, -3):
+        manager.add_admin(chat_id, 7)
+    manager.close()
+
+    manager = sqlite_manager()
+    assert manager.admin_index == {}
+    assert manager.get_admin_chats(7) == {-1, -2, -3}
+    assert manager.chats == {}
+    manager.close()
+
+
+def test_sqlite_admin_lookup_sees_unwritten_changes():
+    manager = sqlite_manager()
+    manager.add_admin(-1, 7)
+    manager.add_admin(-2, 7)
+    manager.close()
+
+    manager = sqlite_manager()
+
+    async def scenario():
+        manager.add_admin(-3, 7)
+        manager.remove_admin(-1, 7)
+        assert manager.storage.has_pending()
+        assert manager.get_admin_chats(7) == {-2, -3}
+
+        assert manager.remove_admin_everywhere(7) == [-3, -2]
+        await manager.flush()
+
+    asyncio.run(scenario())
+    assert manager.get_admin_chats(7) == set()
+    manager.close()
+
+
+def test_reading_unknown_chat_writes_nothing():
+    manager = bot.DataManager(bot.JsonStorage())
+    manager.load_data()
+
+    chat_data = manager.get_chat_data(-5)
+    assert chat_data.admin_users == bot.ChatData.DEFAULT_ADMINS
+    assert -5 not in manager.chats
+    assert not manager.storage.has_pending()
+
+    manager.add_admin(-5, 7)
+    assert manager.get_chat_data(-5).admin_users == {bot.MAIN_ADMIN_ID, 7}
+    manager.close()
+
+    manager = bot.DataManager(bot.JsonStorage())
+    manager.load_data()
+    assert 7 in manager.get_chat_data(-5).admin_users
+
+
+def test_atomic_write_keeps_old_file_when_writer_fails(tmp_path):
+    target = tmp_path / 'data.json'
+    target.write_text('old', encoding='utf-8')
+
+    def crash(f):
+        f.write('half of the new')
+        raise OSError('диск отключен')
+
+    try:
+        bot.atomic_write(str(target), crash)
+    except OSError:
+        pass
+    assert target.read_text(encoding='utf-8') == 'old'
+
+    bot.atomic_write(str(target), lambda f: f.write('new'))
+    assert target.read_text(encoding='utf-8') == 'new'
+    assert not (tmp_path / 'data.json.tmp').exists()
+
+
+def test_replay_cuts_torn_journal_tail(tmp_path):
+    journal = tmp_path / 'data.journal'
+    journal.write_bytes(b'{"n": 1}\n{"n": 2}\n{"n": ')
+
+    records = []
+    assert bot.replay_journal(str(journal), records.append) == (2, 18)
+    assert records == [{'n': 1}, {'n': 2}]
+    assert journal.read_bytes() == b'{"n": 1}\n{"n": 2}\n'
+
+
+def journal_manager(compact_size):
+    manager = bot.DataManager(bot.JsonStorage(journal=True, compact_size=compact_size))
+    manager.load_data()
+    return manager
+
+
+def test_journal_replay_after_compaction():
+    manager = journal_manager(compact_size=1)
+
+    async def scenario():
+        manager.add_admin(-1, 7)
+        await manager.flush()  # журнал перерос compact_size: следующая запись сожмет его
+        manager.add_admin(-2, 8)
+        await manager.flush()  # снимок с обоими чатами, журнал обнулен
+        manager.storage.compact_size = 10 ** 6
+        manager.remove_admin(-1, 7)
+        manager.add_admin(-3, 9)
+        await manager.flush()  # только журнал поверх снимка
+
+    asyncio.run(scenario())
+    assert manager.storage._journal_size > 0
+    assert -2 in dict(bot.iter_snapshot('bot_data.json'))
+
+    manager = journal_manager(compact_size=10 ** 6)
+    assert manager.get_chat_data(-1).admin_users == bot.ChatData.DEFAULT_ADMINS
+    assert 8 in manager.get_chat_data(-2).admin_users
+    assert 9 in manager.get_chat_data(-3).admin_users
+    assert manager.get_admin_chats(7) == set()
+
+
+def test_sqlite_round_trip_keeps_evicted_dirty_chats():
+    manager = sqlite_manager(cache_size=2)
+
+    async def scenario():
+        for chat_id in range(-1, -6, -1):
+            manager.add_admin(chat_id, 7)
+        # Кэш меньше числа измененных чатов, но незаписанные чаты не теряются
+        assert len(manager.chats) == 2
+        assert all(7 in manager.get_chat_data(chat_id).admin_users for chat_id in range(-1, -6, -1))
+
+        await manager.flush()
+        assert manager._pinned == {}
+
+    asyncio.run(scenario())
+    manager.close()
+
+    manager = sqlite_manager(cache_size=2)
+    assert all(7 in manager.get_chat_data(chat_id).admin_users for chat_id in range(-1, -6, -1))
+    assert len(manager.chats) == 2
+    manager.close()
+
+
+def test_truncated_snapshot_is_not_overwritten(tmp_path):
+    manager = journal_manager(compact_size=10 ** 6)
+    for chat_id in (-1, -2, -3):
+        manager.add_admin(chat_id, 7)
+    manager.close()
+
+    with open('bot_data.json', encoding='utf-8') as f:
+        data = f.read()
+    truncated = data[:data.index('"-2"') + 10]
+    with open('bot_data.json', 'w', encoding='utf-8') as f:
+        f.write(truncated)
+
+    with pytest.raises(ValueError, match='bot_data.json'):
+        journal_manager(compact_size=10 ** 6)
+    with open('bot_data.json', encoding='utf-8') as f:
+        assert f.read() == truncated
@@ -0,0 +1,48 @@
+import asyncio
+from types import SimpleNamespace
+
+import bot
+
+
+def make_commands():
+    data_manager = bot.DataManager(bot.JsonStorage())
+    data_manager.load_data()
+    permission_manager = bot.PermissionManager(data_manager)
+    return bot.UserCommands(permission_manager, data_manager, None, None)
+
+
+def test_id_command_reply(context, fake_bot):
+    user = SimpleNamespace(id=7, full_name='Иван', username=None)
+    update = SimpleNamespace(effective_user=user, effective_chat=SimpleNamespace(id=-100))
+
+    asyncio.run(make_commands().id_command(update, context))
+
+    assert fake_bot.sent()[0]['text'] == (
+        "👤 <b>Ваша информация:</b>\n\n"
+        "🆔 <b>ID:</b> <code>7</code>\n"
+        "📛 <b>Имя:</b> Иван\n"
+        "🔖 <b>Username:</b> @нет\n"
+        "💬 <b>ID чата:</b> <code>-100</code>\n"
+        "🎯 <b>Статус:</b> 👤 Пользователь"
+    )
+
+
+def test_all_ids_command_marks_creator(context, fake_bot):
+    commands = make_commands()
+    admins = [
+        SimpleNamespace(status='creator', user=SimpleNamespace(id=1, full_name='A', username='a')),
+        SimpleNamespace(status='administrator', user=SimpleNamespace(id=2, full_name='B', username=None)),
+    ]
+
+    async def get(bot_, chat_id):
+        return admins
+
+    commands.chat_admins_cache = SimpleNamespace(get=get)
+    update = SimpleNamespace(effective_chat=SimpleNamespace(id=-100))
+    asyncio.run(commands.all_ids_command(update, context))
+
+    assert fake_bot.sent()[0]['text'] == (
+        "👥 <b>Администраторы чата:</b>\n\n"
+        "1. A (@a) - <code>1</code> 👑\n"
+        "2. B - <code>2</code>"
+    )
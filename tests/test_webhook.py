@@ -0,0 +1,26 @@
+import pytest
+
+import bot
+
+
+class Application:
+    def __init__(self):
+        self.calls = []
+
+    def run_webhook(self, **kwargs):
+        self.calls.append(kwargs)
+
+
+def test_webhook_mode_without_public_url_fails_fast(monkeypatch):
+    monkeypatch.setattr(bot, 'WEBHOOK_URL', '')
+    application = Application()
+    with pytest.raises(ValueError, match='WEBHOOK_URL'):
+        bot.serve_application(application, '123:token', 'webhook')
+    assert application.calls == []
+
+
+def test_webhook_registers_public_url(monkeypatch):
+    monkeypatch.setattr(bot, 'WEBHOOK_URL', 'https://bot.example.org/telegram')
+    application = Application()
+    bot.serve_application(application, '123:token', 'webhook')
+    assert application.calls[0]['webhook_url'] == 'https://bot.example.org/telegram'